@@ -0,0 +1,180 @@
+"""Benchmarks of the serializers and of the pagination, without a database
+
+Objects are unsaved model instances whose related objects are set in the
+caches Django fills when following relations or prefetching, so that no
+query is run. The model properties reading related tables (`uber_puc`,
+`chemicals`) are replaced by their in-memory values, and the lookup tables
+are disabled, so that the serializers read the instances like they read
+querysets prefetched by the viewsets.
+
+Every benchmark is run for pages of 1, 100 and 500 objects, and times
+serialization and JSON rendering together; the time per row is reported
+alongside.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from unittest import mock
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from app.api import lookups, serializers
+from app.core.benchmark import measure
+from app.core.pagination import StandardPagination
+from app.core.renderers import StandardJSONRenderer
+from dashboard import models
+
+PAGE_SIZES = (1, 100, 500)
+
+CHEMICALS_PER_DOCUMENT = 10
+
+renderer = StandardJSONRenderer()
+
+
+def prefetched(model, objects):
+    """A queryset of `model` holding objects, as filled by prefetch_related"""
+    queryset = model.objects.order_by("pk")
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    return queryset
+
+
+def make_chemicals(n, start=0):
+    chemicals = []
+    for i in range(start, start + n):
+        dsstox = models.DSSToxLookup(
+            id=i + 1,
+            sid="DTXSID%07d" % (i + 1),
+            true_chemname="Chemical %d" % i,
+            true_cas="%d-%02d-%d" % (100 + i, i % 100, i % 10),
+        )
+        chemical = models.ExtractedChemical(
+            id=i + 1,
+            component="Component %d" % (i % 3),
+            lower_wf_analysis=0.1,
+            central_wf_analysis=0.2,
+            upper_wf_analysis=0.3,
+            ingredient_rank=i % 20 + 1,
+        )
+        chemical.dsstox = dsstox
+        chemicals.append(chemical)
+    return chemicals
+
+
+def make_documents(n):
+    group_type = models.GroupType(id=1, title="Composition")
+    data_group = models.DataGroup(id=1)
+    data_group.group_type = group_type
+    document_type = models.DocumentType(id=1, title="ingredient disclosure")
+    documents = []
+    for i in range(n):
+        document = models.DataDocument(
+            id=i + 1,
+            title="Safety data sheet %d" % i,
+            subtitle="Table %d" % i,
+            organization="Organization %d" % (i % 50),
+            note="Curated",
+        )
+        document.data_group = data_group
+        document.document_type = document_type
+        extracted = models.ExtractedText(doc_date="2019-01-%02d" % (i % 28 + 1))
+        document._state.fields_cache["extractedtext"] = extracted
+        document.product_links = [
+            models.ProductDocument(document_id=i + 1, product_id=2 * i + 1),
+            models.ProductDocument(document_id=i + 1, product_id=2 * i + 2),
+        ]
+        document._benchmark_chemicals = make_chemicals(
+            CHEMICALS_PER_DOCUMENT, i * CHEMICALS_PER_DOCUMENT
+        )
+        documents.append(document)
+    return documents
+
+
+def make_products(n):
+    pucs = [models.PUC(id=i + 1, gen_cat="Personal care") for i in range(10)]
+    products = []
+    for i in range(n):
+        product = models.Product(
+            id=i + 1,
+            title="Product %d" % i,
+            upc="stub_%d" % i,
+            manufacturer="Manufacturer %d" % (i % 40),
+            brand_name="Brand %d" % (i % 80),
+        )
+        document = models.DataDocument(id=i + 1)
+        product._prefetched_objects_cache = {
+            "documents": prefetched(models.DataDocument, [document])
+        }
+        product._benchmark_puc = pucs[i % len(pucs)]
+        products.append(product)
+    return products
+
+
+def serialize(serializer_class, objects):
+    return renderer.render(serializer_class(objects, many=True).data)
+
+
+def paginate(rows):
+    """Paginate and render rows which have already been serialized"""
+    factory = APIRequestFactory()
+    request = Request(factory.get("/", {"page_size": len(rows)}))
+    pagination = StandardPagination()
+    page = pagination.paginate_queryset(rows, request)
+    return renderer.render(pagination.get_paginated_response(page).data)
+
+
+def get_benchmarks():
+    """Return the benchmark functions by name, e.g. `product/100`"""
+    benchmarks = OrderedDict()
+    for size in PAGE_SIZES:
+        products = make_products(size)
+        documents = make_documents(size)
+        chemicals = make_chemicals(size)
+        rows = serializers.ProductSerializer(products, many=True).data
+        cases = [
+            ("product", lambda o=products: serialize(serializers.ProductSerializer, o)),
+            (
+                "document",
+                lambda o=documents: serialize(serializers.DocumentSerializer, o),
+            ),
+            (
+                "extractedchemical",
+                lambda o=chemicals: serialize(
+                    serializers.ExtractedChemicalSerializer, o
+                ),
+            ),
+            ("pagination", lambda r=rows: paginate(r)),
+        ]
+        for name, function in cases:
+            benchmarks["%s/%d" % (name, size)] = (function, size)
+    return benchmarks
+
+
+@contextmanager
+def in_memory():
+    """Replace what would query the database"""
+    with mock.patch.object(
+        lookups, "get_lookups", return_value=None
+    ), mock.patch.object(
+        models.Product, "uber_puc", property(lambda product: product._benchmark_puc)
+    ), mock.patch.object(
+        models.DataDocument,
+        "chemicals",
+        property(lambda document: document._benchmark_chemicals),
+        create=True,
+    ):
+        yield
+
+
+def run(names=None, repeat=5):
+    """Run the benchmarks, or those whose names start with one of `names`"""
+    results = OrderedDict()
+    with in_memory():
+        for name, (function, rows) in get_benchmarks().items():
+            if names and not any(name.startswith(n) for n in names):
+                continue
+            result = measure(function, repeat=repeat)
+            result["rows"] = rows
+            result["seconds_per_row"] = result["seconds"] / rows
+            results[name] = result
+    return results
@@ -0,0 +1,157 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from app.core.arrayfile import MappedFile, write_arrays
+from dashboard import models
+
+LEVELS = ("product", "puc")
+
+
+def get_path():
+    return os.path.join(settings.INDEX_ROOT, "chemical_cooccurrence.idx")
+
+
+def compressed(rows, columns, n_rows):
+    """Return the (offsets, indices) of the sparse matrix of (row, column) pairs
+
+    The columns of row i are indices[offsets[i]:offsets[i + 1]], sorted and
+    unique.
+    """
+    order = np.lexsort((columns, rows))
+    rows, columns = rows[order], columns[order]
+    keep = np.ones(len(rows), dtype=bool)
+    keep[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+    rows, columns = rows[keep], columns[keep]
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=offsets[1:])
+    return offsets, columns.astype(np.int32)
+
+
+def build_matrix(path=None):
+    """Write the product and PUC incidence matrices of every chemical
+
+    Each level is stored both by row (CSR, e.g. the chemicals of a product)
+    and by chemical (CSC, e.g. the products of a chemical).
+    """
+    prefix = "documents__extractedtext__rawchem__dsstox__"
+    rows = (
+        models.Product.objects.filter(**{prefix + "isnull": False})
+        .order_by()
+        .values_list("id", "puc", prefix + "sid")
+        .distinct()
+    )
+    products, pucs, sids = [], [], []
+    for product, puc, sid in rows.iterator():
+        products.append(product)
+        pucs.append(-1 if puc is None else puc)
+        sids.append(sid)
+    sid_values, chemicals = np.unique(np.array(sids, dtype="S"), return_inverse=True)
+    arrays = OrderedDict([("sids", sid_values)])
+    n_chemicals = len(sid_values)
+    for level, keys in (("product", products), ("puc", pucs)):
+        keys = np.array(keys, dtype=np.int64)
+        chemical_of = chemicals
+        if level == "puc":
+            chemical_of, keys = chemicals[keys >= 0], keys[keys >= 0]
+        ids, positions = np.unique(keys, return_inverse=True)
+        arrays[level + "_ids"] = ids
+        offsets, indices = compressed(positions, chemical_of, len(ids))
+        arrays[level + "_offsets"], arrays[level + "_chemicals"] = offsets, indices
+        offsets, indices = compressed(chemical_of, positions, n_chemicals)
+        arrays["chemical_%s_offsets" % level] = offsets
+        arrays["chemical_%ss" % level] = indices
+    write_arrays(path or get_path(), arrays)
+    return {level: len(arrays[level + "_ids"]) for level in LEVELS}
+
+
+class CooccurrenceMatrix:
+    """Co-occurrence counts of chemicals read from the incidence matrices"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def position(self, sid):
+        """Return the column of a chemical, None if it is not in any product"""
+        sids = self.index["sids"]
+        key = sid.encode()
+        n = np.searchsorted(sids, key)
+        if n < len(sids) and sids[n] == key:
+            return int(n)
+        return None
+
+    def rows_of(self, chemical, level):
+        """Return the products (or PUCs) of a chemical, none for None"""
+        if chemical is None:
+            return np.zeros(0, dtype=np.int32)
+        offsets = self.index["chemical_%s_offsets" % level]
+        return self.index["chemical_%ss" % level][
+            offsets[chemical] : offsets[chemical + 1]
+        ]
+
+    def top(self, chemical, level="product"):
+        """Return the chemicals appearing with a chemical, most frequent first
+
+        Counts are the number of products (or PUCs) holding both chemicals.
+        """
+        rows = self.rows_of(chemical, level)
+        offsets = self.index[level + "_offsets"]
+        starts, ends = offsets[rows], offsets[rows + 1]
+        lengths = ends - starts
+        positions = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths - starts, lengths
+        )
+        counts = np.bincount(
+            self.index[level + "_chemicals"][positions],
+            minlength=len(self.index["sids"]),
+        )
+        counts[chemical] = 0
+        found = np.flatnonzero(counts)
+        found = found[np.argsort(-counts[found], kind="stable")]
+        return CooccurrenceResults(self, found, counts[found])
+
+    def pair(self, chemical, other, level="product"):
+        """Count the rows holding each chemical, and both of them"""
+        rows, other_rows = self.rows_of(chemical, level), self.rows_of(other, level)
+        shared = len(np.intersect1d(rows, other_rows, assume_unique=True))
+        return len(rows), len(other_rows), shared
+
+
+class CooccurrenceResults:
+    """A lazily rendered, sliceable sequence of co-occurring chemicals"""
+
+    def __init__(self, matrix, chemicals, counts):
+        self.matrix = matrix
+        self.chemicals = chemicals
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.chemicals)
+
+    def count(self):
+        return len(self.chemicals)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.row(n) for n in range(len(self.chemicals))[key]]
+        return self.row(key)
+
+    def row(self, n):
+        return OrderedDict(
+            [
+                ("chemical_id", self.matrix.index["sids"][self.chemicals[n]].decode()),
+                ("count", int(self.counts[n])),
+            ]
+        )
+
+
+_files = {}
+
+
+def get_matrix():
+    """Return the co-occurrence matrix, or None when it has not been built"""
+    path = get_path()
+    index = _files.setdefault(path, MappedFile(path)).get()
+    return None if index is None else CooccurrenceMatrix(index)
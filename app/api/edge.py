@@ -0,0 +1,75 @@
+import os
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+EXPORT_ALIAS = "edge_export"
+
+BATCH_SIZE = 5000
+
+
+def get_exported_models():
+    """The models of this service, which is all edge nodes serve"""
+    return list(apps.get_app_config("api").get_models())
+
+
+def copy_table(model, source, target):
+    fields = model._meta.concrete_fields
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        target.ops.quote_name(model._meta.db_table),
+        ", ".join(target.ops.quote_name(f.column) for f in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    rows = model._base_manager.using(source).order_by("pk")
+    rows = rows.values_list(*[f.attname for f in fields]).iterator()
+    count = 0
+    with target.cursor() as cursor:
+        batch = []
+        for row in rows:
+            batch.append([f.get_db_prep_save(v, target) for f, v in zip(fields, row)])
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+
+def export_sqlite(path, using=DEFAULT_DB_ALIAS):
+    """Write the tables of this service to a new SQLite file at path
+
+    The file is built next to path and moved into place once complete.
+    Returns the number of rows written per table.
+    """
+    staging = "%s.%d.tmp" % (path, os.getpid())
+    if os.path.exists(staging):
+        os.remove(staging)
+    connections.databases[EXPORT_ALIAS] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": staging,
+    }
+    counts = {}
+    try:
+        target = connections[EXPORT_ALIAS]
+        models = get_exported_models()
+        with target.schema_editor() as editor:
+            for model in models:
+                editor.create_model(model)
+        with transaction.atomic(using=EXPORT_ALIAS):
+            for model in models:
+                counts[model._meta.db_table] = copy_table(model, using, target)
+        with target.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("VACUUM")
+        target.close()
+        os.replace(staging, path)
+    finally:
+        connections[EXPORT_ALIAS].close()
+        del connections.databases[EXPORT_ALIAS]
+        if hasattr(connections._connections, EXPORT_ALIAS):
+            delattr(connections._connections, EXPORT_ALIAS)
+        if os.path.exists(staging):
+            os.remove(staging)
+    return counts
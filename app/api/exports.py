@@ -0,0 +1,104 @@
+import os
+import shutil
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+
+from app.api import jobs, snapshots
+from app.core.dataversion import compute_data_version
+from app.core.viewsets import chunks
+
+# Filter values matched by each query
+FILTER_CHUNK_SIZE = 500
+
+
+def get_pks(resource, filters):
+    """Return the sorted primary keys of the objects matching a job's filters
+
+    The objects matching any value of a filter, and every filter, are
+    exported. Values are matched a chunk at a time, with an `__in` lookup on
+    the field of the filter, or by the `<method>_values(queryset, values)`
+    of the filterset for a filter implemented by a method. Other filters
+    are applied once per value.
+    """
+    filterset_class = snapshots.RESOURCES[resource].filterset_class
+    queryset = snapshots.get_queryset(resource).prefetch_related(None)
+    filterset = filterset_class(queryset=queryset)
+    pks = None
+    for name, values in filters.items():
+        cleaned = []
+        for value in values:
+            form = filterset_class({name: value}, queryset=queryset).form
+            if not form.is_valid():
+                raise ValueError("Invalid value %r of filter %s." % (value, name))
+            cleaned.append(form.cleaned_data[name])
+        field = filterset.filters[name]
+        if field.method:
+            match = getattr(filterset, "%s_values" % field.method, None)
+        elif field.lookup_expr == "exact" and not field.exclude:
+            match = partial(filter_in, "%s__in" % field.field_name)
+        else:
+            match = None
+        matched = set()
+        for chunk in chunks(cleaned, FILTER_CHUNK_SIZE):
+            if match is None:
+                querysets = [field.filter(queryset, value) for value in chunk]
+            else:
+                querysets = [match(queryset, chunk)]
+            for qs in querysets:
+                matched.update(qs.values_list("pk", flat=True))
+        pks = matched if pks is None else pks & matched
+    if pks is None:
+        pks = queryset.values_list("pk", flat=True)
+    return sorted(pks)
+
+
+def filter_in(lookup, queryset, values):
+    return queryset.filter(**{lookup: values})
+
+
+def run_job(job, workers=None, partition_size=None, root=None):
+    """Write the files of a claimed job and mark it done, or failed
+
+    The matching objects are split into partitions of at most
+    `partition_size` objects, serialized by the snapshot code in a process
+    pool and concatenated into gzipped NDJSON and CSV files. The data version
+    read when the job starts is recorded, as the data may have changed since
+    the job was queued.
+    """
+    resource = job["spec"]["resource"]
+    directory = jobs.get_directory(job["id"], root)
+    staging = os.path.join(directory, ".build")
+    partition_size = partition_size or settings.EXPORT_PARTITION_SIZE
+    try:
+        job["data_version"] = compute_data_version()
+        pks = get_pks(resource, job["spec"]["filters"])
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        tasks = [
+            (resource, chunk[0], chunk[-1], staging, n, chunk)
+            for n, chunk in enumerate(chunks(pks, partition_size))
+        ]
+        parts = snapshots.write_partitions(tasks, workers)
+        result = snapshots.assemble_resource(resource, directory, parts)
+    except Exception as e:
+        job["status"], job["error"] = "failed", str(e)
+    else:
+        job["status"], job["rows"] = "done", result["rows"]
+        job["files"] = OrderedDict(result["files"])
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    job["finished"] = jobs.now()
+    jobs.write_job(job, root)
+    return job
+
+
+def run_queued(workers=None, partition_size=None, root=None):
+    """Run the queued jobs, oldest first, and return them"""
+    done = []
+    for job in jobs.list_jobs("queued", root):
+        if jobs.claim_job(job, root):
+            done.append(run_job(job, workers, partition_size, root))
+            jobs.expire(keep=[job["id"]], root=root)
+    return done
@@ -1,8 +1,54 @@
+from django.conf import settings
 from django_filters import rest_framework as filters
+from rest_framework.exceptions import NotFound, ValidationError
 
+from app.api import models as api_models
+from app.api import lookups, search
 from dashboard import models
 
 
+class SearchFilterSet(filters.FilterSet):
+    """A filterset whose `q` filter matches against the search index
+
+    Texts matching more than `SEARCH_FILTER_MAX_MATCHES` objects are
+    rejected rather than sent to the database as a list of ids.
+    """
+
+    search_kind = None
+
+    def get_index(self):
+        index = search.get_index()
+        if index is None:
+            raise NotFound("The search index has not been built.")
+        return index
+
+    def search_filter(self, queryset, name, value):
+        try:
+            pks = self.get_index().filter_pks(
+                value, self.search_kind, settings.SEARCH_FILTER_MAX_MATCHES
+            )
+        except search.TooManyMatches as e:
+            raise self.too_many_matches(name, e.count)
+        return queryset.filter(pk__in=pks)
+
+    def search_id_filter(self, queryset, name, value):
+        try:
+            ids = self.get_index().filter_ids(
+                value, self.search_kind, settings.SEARCH_FILTER_MAX_MATCHES
+            )
+        except search.TooManyMatches as e:
+            raise self.too_many_matches(name, e.count)
+        return queryset.filter(pk__in=ids)
+
+    def too_many_matches(self, name, count):
+        return ValidationError(
+            {
+                name: "Matches %d objects, more than %d. Use a more specific "
+                "text, or /search/." % (count, settings.SEARCH_FILTER_MAX_MATCHES)
+            }
+        )
+
+
 class PUCFilter(filters.FilterSet):
     chemical = filters.CharFilter(
         help_text="A chemical DTXSID to filter products against.",
@@ -18,10 +64,12 @@ class PUCFilter(filters.FilterSet):
         fields = []
 
 
-class ProductFilter(filters.FilterSet):
+class ProductFilter(SearchFilterSet):
+    search_kind = "product"
+
     chemical = filters.CharFilter(
         help_text="A chemical DTXSID to filter products against.",
-        field_name="documents__extractedtext__rawchem__dsstox__sid",
+        method="chemical_filter",
         initial="DTXSID6026296",
     )
 
@@ -29,18 +77,251 @@ class ProductFilter(filters.FilterSet):
         help_text="A Product UPC to filter products against.", initial="stub_47"
     )
 
+    q = filters.CharFilter(
+        help_text="Text to search product titles, brands and manufacturers for.",
+        method="search_filter",
+        initial="shampoo",
+    )
+
+    def chemical_filter(self, queryset, name, value):
+        return self.chemical_filter_values(queryset, [value])
+
+    def chemical_filter_values(self, queryset, values):
+        tables = lookups.get_lookups()
+        if tables is None:
+            return queryset.filter(
+                documents__extractedtext__rawchem__dsstox__sid__in=values
+            )
+        # Filter on the chemical ids, without joining the chemical table
+        pks = [tables["chemical_ids"].get(value, "id") for value in values]
+        pks = [pk for pk in pks if pk is not None]
+        if not pks:
+            return queryset.none()
+        return queryset.filter(documents__extractedtext__rawchem__dsstox_id__in=pks)
+
     class Meta:
         model = models.Product
         fields = []
 
 
-class ChemicalFilter(filters.FilterSet):
+class ChemicalFilter(SearchFilterSet):
+    search_kind = "chemical"
+
     puc = filters.NumberFilter(
         help_text="A PUC ID to filter chemicals against.",
         field_name="curated_chemical__extracted_text__data_document__product__puc__id",
         initial="1",
     )
 
+    q = filters.CharFilter(
+        help_text="Text to search preferred chemical names and CAS numbers for.",
+        method="search_filter",
+        initial="benzyl",
+    )
+
     class Meta:
         model = models.DSSToxLookup
         fields = []
+
+
+class DocumentFilter(SearchFilterSet):
+    search_kind = "document"
+
+    chemical = filters.CharFilter(
+        help_text="A chemical DTXSID to filter documents against.",
+        method="chemical_filter",
+        initial="DTXSID6026296",
+    )
+
+    q = filters.CharFilter(
+        help_text="Text to search document titles and organizations for.",
+        method="search_filter",
+        initial="safety data sheet",
+    )
+
+    def chemical_filter(self, queryset, name, value):
+        return self.chemical_filter_values(queryset, [value])
+
+    def chemical_filter_values(self, queryset, values):
+        documents = models.DataDocument.objects.filter(
+            extractedtext__rawchem__dsstox__sid__in=values
+        ).values("pk")
+        return queryset.filter(pk__in=documents)
+
+    class Meta:
+        model = models.DataDocument
+        fields = []
+
+
+class PUCRecordFilter(filters.FilterSet):
+    chemical = filters.CharFilter(
+        help_text="A chemical DTXSID to filter products against.",
+        method="dtxsid_filter",
+        initial="DTXSID6026296",
+    )
+
+    def dtxsid_filter(self, queryset, name, value):
+        return self.dtxsid_filter_values(queryset, [value])
+
+    def dtxsid_filter_values(self, queryset, values):
+        pucs = api_models.ChemicalProductRecord.objects.filter(
+            chemical_id__in=values
+        ).values("puc_id")
+        return queryset.filter(pk__in=pucs)
+
+    class Meta:
+        model = api_models.PUCRecord
+        fields = []
+
+
+class ProductRecordFilter(SearchFilterSet):
+    search_kind = "product"
+
+    chemical = filters.CharFilter(
+        help_text="A chemical DTXSID to filter products against.",
+        method="chemical_filter",
+        initial="DTXSID6026296",
+    )
+
+    upc = filters.CharFilter(
+        help_text="A Product UPC to filter products against.", initial="stub_47"
+    )
+
+    q = filters.CharFilter(
+        help_text="Text to search product titles, brands and manufacturers for.",
+        method="search_filter",
+        initial="shampoo",
+    )
+
+    def chemical_filter(self, queryset, name, value):
+        return self.chemical_filter_values(queryset, [value])
+
+    def chemical_filter_values(self, queryset, values):
+        products = api_models.ChemicalProductRecord.objects.filter(
+            chemical_id__in=values
+        ).values("product_id")
+        return queryset.filter(pk__in=products)
+
+    class Meta:
+        model = api_models.ProductRecord
+        fields = []
+
+
+class ChemicalRecordFilter(SearchFilterSet):
+    search_kind = "chemical"
+
+    puc = filters.NumberFilter(
+        help_text="A PUC ID to filter chemicals against.",
+        method="puc_filter",
+        initial="1",
+    )
+
+    q = filters.CharFilter(
+        help_text="Text to search preferred chemical names and CAS numbers for.",
+        method="search_id_filter",
+        initial="benzyl",
+    )
+
+    def puc_filter(self, queryset, name, value):
+        return self.puc_filter_values(queryset, [value])
+
+    def puc_filter_values(self, queryset, values):
+        chemicals = api_models.ChemicalProductRecord.objects.filter(
+            puc_id__in=values
+        ).values("chemical_id")
+        return queryset.filter(pk__in=chemicals)
+
+    class Meta:
+        model = api_models.ChemicalRecord
+        fields = []
+
+
+class DocumentRecordFilter(SearchFilterSet):
+    search_kind = "document"
+
+    chemical = filters.CharFilter(
+        help_text="A chemical DTXSID to filter documents against.",
+        method="chemical_filter",
+        initial="DTXSID6026296",
+    )
+
+    q = filters.CharFilter(
+        help_text="Text to search document titles and organizations for.",
+        method="search_filter",
+        initial="safety data sheet",
+    )
+
+    def chemical_filter(self, queryset, name, value):
+        return self.chemical_filter_values(queryset, [value])
+
+    def chemical_filter_values(self, queryset, values):
+        documents = api_models.ChemicalDocumentRecord.objects.filter(
+            chemical_id__in=values
+        ).values("document_id")
+        return queryset.filter(pk__in=documents)
+
+    class Meta:
+        model = api_models.DocumentRecord
+        fields = []
+
+
+class PUCStatsFilter(filters.FilterSet):
+    kind = filters.CharFilter(help_text="A PUC kind to count against.", initial="FO")
+    level_1_category = filters.CharFilter(
+        help_text="A Level 1 category to count against.", initial="Personal care"
+    )
+    level_2_category = filters.CharFilter(
+        help_text="A Level 2 category to count against.",
+        initial="hair styling and care",
+    )
+
+    class Meta:
+        model = api_models.PUCSummary
+        fields = []
+
+
+class ProductStatsFilter(filters.FilterSet):
+    puc = filters.NumberFilter(
+        help_text="A PUC ID to count products against.",
+        field_name="puc_id",
+        initial="1",
+    )
+    manufacturer = filters.CharFilter(
+        help_text="A manufacturer to count products against.", initial="3M"
+    )
+
+    class Meta:
+        model = api_models.ProductSummary
+        fields = []
+
+
+class DocumentStatsFilter(filters.FilterSet):
+    data_type = filters.CharFilter(
+        help_text="A data type to count documents against.", initial="Composition"
+    )
+    document_type = filters.CharFilter(
+        help_text="A document type to count documents against.",
+        initial="ingredient disclosure",
+    )
+
+    class Meta:
+        model = api_models.DocumentSummary
+        fields = []
+
+
+class ChemicalStatsFilter(filters.FilterSet):
+    chemical = filters.CharFilter(
+        help_text="A chemical DTXSID to count against.",
+        field_name="chemical_id",
+        initial="DTXSID6026296",
+    )
+    min_products = filters.NumberFilter(
+        help_text="The minimum number of products a chemical must be found in.",
+        field_name="product_count",
+        lookup_expr="gte",
+        initial="10",
+    )
+
+    class Meta:
+        model = api_models.ChemicalSummary
+        fields = []
@@ -0,0 +1,170 @@
+"""The disk store of the export jobs
+
+Every job is a directory of EXPORT_ROOT named after the job id, holding a
+`job.json` description and, once done, the exported files. The id is a
+digest of the data version and of the normalized job specification, so that
+identical requests share a job. The files are built from the data when the
+job runs, whose version is recorded as its `data_version`.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+
+ID_RE = re.compile(r"^[0-9a-f]{20}$")
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+def now():
+    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+
+def get_root(root=None):
+    return root or settings.EXPORT_ROOT
+
+
+def get_job_id(spec, version):
+    key = json.dumps([version, spec], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(key.encode()).hexdigest()[:20]
+
+
+def get_directory(job_id, root=None):
+    return os.path.join(get_root(root), job_id)
+
+
+def read_job(job_id, root=None):
+    """Return the description of a job, None if there is no such job"""
+    if not ID_RE.match(job_id):
+        return None
+    try:
+        with open(os.path.join(get_directory(job_id, root), "job.json")) as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+    except (OSError, ValueError):
+        return None
+
+
+def write_job(job, root=None):
+    """Replace the description of a job atomically"""
+    directory = get_directory(job["id"], root)
+    tmp = os.path.join(directory, ".job.%d.tmp" % os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp, os.path.join(directory, "job.json"))
+
+
+def create_job(spec, version, root=None):
+    """Queue a job, returning it and whether it was created
+
+    A job with the same specification and data version is returned instead,
+    unless it has failed, in which case it is queued again.
+    """
+    job_id = get_job_id(spec, version)
+    directory = get_directory(job_id, root)
+    os.makedirs(get_root(root), exist_ok=True)
+    try:
+        os.mkdir(directory)
+    except FileExistsError:
+        job = read_job(job_id, root)
+        if job is not None and job["status"] != "failed":
+            return job, False
+        # A failed job, or one whose description is still being written
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    job = OrderedDict(
+        [
+            ("id", job_id),
+            ("status", "queued"),
+            ("version", version),
+            ("data_version", None),
+            ("spec", spec),
+            ("created", now()),
+            ("started", None),
+            ("finished", None),
+            ("rows", None),
+            ("files", OrderedDict()),
+            ("error", None),
+        ]
+    )
+    write_job(job, root)
+    return job, True
+
+
+def list_jobs(status=None, root=None):
+    """Return the jobs, optionally of a status, oldest first"""
+    try:
+        names = os.listdir(get_root(root))
+    except FileNotFoundError:
+        return []
+    jobs = [read_job(name, root) for name in names if ID_RE.match(name)]
+    jobs = [j for j in jobs if j is not None and status in (None, j["status"])]
+    jobs.sort(key=lambda job: job["created"])
+    return jobs
+
+
+def claim_job(job, root=None):
+    """Mark a queued job as running, False if another worker claimed it"""
+    lock = os.path.join(get_directory(job["id"], root), ".claimed")
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    job["status"], job["started"] = "running", now()
+    write_job(job, root)
+    return True
+
+
+def requeue_running(root=None):
+    """Queue the jobs left running by a worker which has stopped"""
+    jobs = list_jobs("running", root)
+    for job in jobs:
+        try:
+            os.remove(os.path.join(get_directory(job["id"], root), ".claimed"))
+        except FileNotFoundError:
+            pass
+        job["status"], job["started"] = "queued", None
+        write_job(job, root)
+    return jobs
+
+
+def get_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for path, _, names in os.walk(directory)
+        for name in names
+    )
+
+
+def expire(max_bytes=None, keep=(), root=None):
+    """Remove the oldest finished jobs until the rest fit in max_bytes
+
+    Queued and running jobs, and the jobs of ids `keep`, are never removed.
+    Returns the removed job ids.
+    """
+    max_bytes = settings.EXPORT_MAX_BYTES if max_bytes is None else max_bytes
+    jobs = list_jobs(root=root)
+    sizes = {job["id"]: get_size(get_directory(job["id"], root)) for job in jobs}
+    total = sum(sizes.values())
+    finished = [
+        job
+        for job in jobs
+        if job["status"] in ("done", "failed") and job["id"] not in keep
+    ]
+    finished.sort(key=lambda job: job["finished"] or job["created"])
+    removed = []
+    for job in finished:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(get_directory(job["id"], root), ignore_errors=True)
+        total -= sizes[job["id"]]
+        removed.append(job["id"])
+    return removed
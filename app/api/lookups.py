@@ -0,0 +1,94 @@
+import os
+
+from django.conf import settings
+from django.db.models import Min
+
+from app.core.dataversion import compute_data_version, get_data_version
+from app.core.lookup import LookupFile, write_lookups
+from dashboard import models
+
+PRODUCT_CHUNK_SIZE = 2000
+
+
+def get_path():
+    return os.path.join(settings.INDEX_ROOT, "lookups.idx")
+
+
+def get_product_rows():
+    """Yield the id, PUC id and first document id of every product"""
+    first_documents = dict(
+        models.ProductDocument.objects.order_by()
+        .values("product_id")
+        .annotate(first=Min("document_id"))
+        .values_list("product_id", "first")
+    )
+    for product in iter_products():
+        puc = product.uber_puc
+        yield (
+            product.id,
+            None if puc is None else puc.id,
+            first_documents.get(product.id),
+        )
+
+
+def iter_products():
+    """Yield every product with its PUCs prefetched, in chunks"""
+    pks = list(models.Product.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(pks), PRODUCT_CHUNK_SIZE):
+        chunk = pks[start : start + PRODUCT_CHUNK_SIZE]
+        yield from models.Product.objects.prefetch_pucs().filter(pk__in=chunk)
+
+
+def get_document_rows():
+    """Yield the id and the sorted product ids of every linked document"""
+    links = (
+        models.ProductDocument.objects.order_by("document_id", "product_id")
+        .values_list("document_id", "product_id")
+        .distinct()
+    )
+    document, products = None, []
+    for document_id, product_id in links.iterator():
+        if document_id != document:
+            if products:
+                yield document, products
+            document, products = document_id, []
+        products.append(product_id)
+    if products:
+        yield document, products
+
+
+def build_lookups(path=None):
+    """Write the lookup tables of the serializers and filters
+
+    The file records the data version it was read at, and is ignored by the
+    workers once the data version has changed.
+    """
+    version = compute_data_version()
+    chemicals = list(
+        models.DSSToxLookup.objects.values_list(
+            "id", "sid", "true_chemname", "true_cas"
+        )
+    )
+    tables = {
+        "chemicals": ([("sid", "str"), ("name", "str"), ("cas", "str")], chemicals),
+        "chemical_ids": ([("id", "int")], [(row[1], row[0]) for row in chemicals]),
+        "products": ([("puc", "int"), ("document", "int")], list(get_product_rows())),
+        "documents": ([("products", "list")], list(get_document_rows())),
+    }
+    write_lookups(path or get_path(), tables, {"data_version": version})
+    return {name: len(rows) for name, (columns, rows) in tables.items()}
+
+
+_files = {}
+
+
+def get_built_version():
+    """Return the data version of the lookup file, None if there is none"""
+    lookups = _files.setdefault(get_path(), LookupFile(get_path())).get()
+    return None if lookups is None else lookups.meta.get("data_version")
+
+
+def get_lookups():
+    """Return the lookup tables, or None unless built at the current data version"""
+    path = get_path()
+    return _files.setdefault(path, LookupFile(path)).get(get_data_version())
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.api import cooccurrence
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the product and PUC incidence matrices of chemicals served by "
+        "/chemicals/{id}/cooccurring/. Workers pick up the new file on their "
+        "next request."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = cooccurrence.build_matrix()
+        self.stdout.write(
+            "%s: %d products, %d PUCs in %.1f s"
+            % (
+                cooccurrence.get_path(),
+                counts["product"],
+                counts["puc"],
+                time.perf_counter() - start,
+            )
+        )
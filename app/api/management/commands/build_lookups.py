@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.api import lookups
+from app.core.dataversion import compute_data_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the lookup tables through which the serializers and filters "
+        "resolve ids and labels without joins. Workers pick up the new file on "
+        "their next request, and ignore it once the data version has changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--if-changed",
+            action="store_true",
+            help="Only build the tables if the data version has changed.",
+        )
+
+    def handle(self, *args, **options):
+        if options["if_changed"]:
+            version = compute_data_version()
+            if lookups.get_built_version() == version:
+                self.stdout.write("Lookup tables are up to date (%s)." % version)
+                return
+        start = time.perf_counter()
+        counts = lookups.build_lookups()
+        self.stdout.write(
+            "%s: %s in %.1f s"
+            % (
+                lookups.get_path(),
+                ", ".join("%d %s" % (n, name) for name, n in counts.items()),
+                time.perf_counter() - start,
+            )
+        )
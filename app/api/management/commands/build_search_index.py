@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.api import search
+from app.core.dataversion import compute_data_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the search index served by /search/ and the q= filters. Workers "
+        "pick up the new file on their next request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--if-changed",
+            action="store_true",
+            help="Only build the index if the data version has changed.",
+        )
+
+    def handle(self, *args, **options):
+        if options["if_changed"]:
+            version = compute_data_version()
+            if search.get_built_version() == version:
+                self.stdout.write("Search index is up to date (%s)." % version)
+                return
+        start = time.perf_counter()
+        entries = search.build_index()
+        self.stdout.write(
+            "%s: %d entries in %.1f s"
+            % (search.get_path(), entries, time.perf_counter() - start)
+        )
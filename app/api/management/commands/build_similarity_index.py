@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.api import similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the MinHash/LSH index of product compositions served by "
+        "/products/{id}/similar/. Workers pick up the new file on their next "
+        "request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--weighted",
+            action="store_true",
+            help="Weight chemicals by their central weight fraction.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = similarity.build_index(weighted=options["weighted"])
+        self.stdout.write(
+            "%s: %d products in %.1f s"
+            % (similarity.get_path(), count, time.perf_counter() - start)
+        )
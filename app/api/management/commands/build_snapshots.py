@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from app.api import snapshots
+from app.core.dataversion import compute_data_version
+
+
+class Command(BaseCommand):
+    help = "Build compressed NDJSON and CSV snapshots of every API resource."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes (0 builds in this process).",
+        )
+        parser.add_argument(
+            "--partition-size",
+            type=int,
+            default=None,
+            help="Maximum number of rows per partition.",
+        )
+        parser.add_argument(
+            "--root", default=None, help="Directory to publish the snapshots to."
+        )
+        parser.add_argument(
+            "--keep",
+            type=int,
+            default=None,
+            help="Number of snapshots to keep, including the latest.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Build a snapshot even if the data has not changed.",
+        )
+
+    def handle(self, *args, **options):
+        version = compute_data_version()
+        root = options["root"]
+        if not options["force"] and snapshots.get_published_version(root) == version:
+            self.stdout.write("Snapshot %s is up to date." % version)
+            return
+        manifest = snapshots.build_snapshot(
+            version,
+            root=root,
+            workers=options["workers"],
+            partition_size=options["partition_size"],
+        )
+        for name, resource in manifest["resources"].items():
+            self.stdout.write("%s: %d rows" % (name, resource["rows"]))
+        for name in snapshots.prune(root, options["keep"]):
+            self.stdout.write("Removed snapshot %s" % name)
+        self.stdout.write(self.style.SUCCESS("Published snapshot %s" % version))
@@ -0,0 +1,98 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Prefetch
+from rest_framework import serializers as drf_serializers
+
+from app.api import serializers, views
+from app.core.db import straight_join
+from app.core.fragments import encode
+from dashboard import models
+
+
+class LegacyDocumentSerializer(serializers.DocumentSerializer):
+    products = drf_serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+
+def get_legacy_queryset():
+    """The document query plan used before the lean plan"""
+    return straight_join(
+        models.DataDocument.objects.prefetch_related(
+            Prefetch(
+                "extractedtext__rawchem",
+                queryset=models.RawChem.objects.filter(dsstox__isnull=False)
+                .select_related("dsstox")
+                .select_subclasses(),
+            ),
+            Prefetch("products"),
+        )
+        .select_related("data_group__group_type", "document_type")
+        .order_by("-id")
+    )
+
+
+PLANS = {
+    "legacy": (get_legacy_queryset, LegacyDocumentSerializer),
+    "lean": (
+        lambda: views.DocumentViewSet.queryset.all(),
+        serializers.DocumentSerializer,
+    ),
+}
+
+
+class QueryTimer:
+    """Database execute wrapper adding up the number and time of queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the query time and memory of the legacy and lean document "
+        "query plans over the first pages of /documents/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=5)
+        parser.add_argument("--page-size", type=int, default=500)
+
+    def run(self, name, pages, page_size):
+        get_queryset, serializer_class = PLANS[name]
+        timer = QueryTimer()
+        size = 0
+        tracemalloc.start()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            for page in range(pages):
+                queryset = get_queryset()[page * page_size : (page + 1) * page_size]
+                size += len(encode(serializer_class(queryset, many=True).data))
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return seconds, timer, peak, size
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            "%-8s %10s %10s %8s %12s %12s"
+            % ("plan", "total (s)", "SQL (s)", "queries", "peak (MiB)", "bytes")
+        )
+        for name in PLANS:
+            seconds, timer, peak, size = self.run(
+                name, options["pages"], options["page_size"]
+            )
+            self.stdout.write(
+                "%-8s %10.3f %10.3f %8d %12.1f %12d"
+                % (name, seconds, timer.seconds, timer.count, peak / 2 ** 20, size)
+            )
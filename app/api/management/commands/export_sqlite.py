@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from app.api import edge, readmodels, summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the summary and read-model tables to a read-only SQLite file, "
+        "served by edge nodes with FACTOTUM_WS_EDGE_DATABASE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The SQLite file to write.")
+        parser.add_argument(
+            "--no-refresh",
+            action="store_true",
+            help="Export the tables as they are, without refreshing them first.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["no_refresh"]:
+            for table in summaries.SUMMARIES + readmodels.READ_MODELS:
+                summaries.refresh(table)
+        counts = edge.export_sqlite(options["path"])
+        for table, count in counts.items():
+            self.stdout.write("%s: %d rows" % (table, count))
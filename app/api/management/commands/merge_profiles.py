@@ -0,0 +1,71 @@
+import os
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.core import sampling
+
+
+def parse_time(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise CommandError("Invalid time: %s" % value)
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge the stack samples written by the workers into one collapsed "
+        "stack file, ready for flamegraph.pl or speedscope."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            help="Sample files or directories, SAMPLING_ROOT by default.",
+        )
+        parser.add_argument("--since", help="Start of the window (ISO 8601).")
+        parser.add_argument("--until", help="End of the window (ISO 8601).")
+        parser.add_argument(
+            "--endpoint", help="Only keep the endpoints containing this text."
+        )
+        parser.add_argument("--output", help="Write to this file, not stdout.")
+
+    def get_files(self, paths):
+        for path in paths or [settings.SAMPLING_ROOT]:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if name.endswith(".folded"):
+                        yield os.path.join(path, name)
+            elif os.path.exists(path):
+                yield path
+            else:
+                raise CommandError("No such file or directory: %s" % path)
+
+    def handle(self, *args, **options):
+        since = parse_time(options["since"]) if options["since"] else None
+        until = parse_time(options["until"]) if options["until"] else None
+        stacks = Counter()
+        files = 0
+        for path in self.get_files(options["paths"]):
+            # Files are named after the end of their window
+            prefix = os.path.basename(path).split("-", 1)[0]
+            timestamp = int(prefix) if prefix.isdigit() else None
+            if timestamp is not None and (
+                (since and timestamp < since) or (until and timestamp > until)
+            ):
+                continue
+            for stack, count in sampling.read_stacks(path).items():
+                endpoint = stack.split(";", 1)[0]
+                if not options["endpoint"] or options["endpoint"] in endpoint:
+                    stacks[stack] += count
+            files += 1
+        if options["output"]:
+            sampling.write_stacks(options["output"], stacks)
+        else:
+            for stack, count in sorted(stacks.items()):
+                self.stdout.write("%s %d" % (stack, count))
+        self.stderr.write("%d samples from %d files" % (sum(stacks.values()), files))
@@ -0,0 +1,11 @@
+from app.api import readmodels
+from app.api.management.commands import refresh_summaries
+
+
+class Command(refresh_summaries.Command):
+    help = (
+        "Refresh the read-model tables served when FACTOTUM_WS_READ_MODELS is "
+        "enabled. Only the rows which changed are written, and tables whose "
+        "sources have not changed are skipped."
+    )
+    tables = readmodels.READ_MODELS
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.api import summaries
+
+
+class Command(BaseCommand):
+    help = "Refresh the summary tables behind the /stats/ endpoints."
+    tables = summaries.SUMMARIES
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help="Tables to refresh (default: all of %s)."
+            % ", ".join(s.name for s in self.tables),
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Refresh even if the source data has not changed.",
+        )
+
+    def handle(self, *args, **options):
+        available = {s.name: s for s in self.tables}
+        names = options["names"] or list(available)
+        for name in names:
+            if name not in available:
+                raise CommandError("Unknown table '%s'." % name)
+        for name in names:
+            result = summaries.refresh(available[name], force=options["force"])
+            if result is None:
+                self.stdout.write("%s: up to date" % name)
+            else:
+                self.stdout.write(
+                    "%s: %d created, %d updated, %d deleted" % ((name,) + result)
+                )
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.api import benchmarks
+from app.core.benchmark import compare, load_baseline, save_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the serializers and the pagination on in-memory objects, without "
+        "a database, and compare the results with a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help="Only run the benchmarks starting with these names, e.g. product/.",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=settings.BENCHMARK_BASELINE,
+            help="The baseline file, BENCHMARK_BASELINE by default.",
+        )
+        parser.add_argument(
+            "--save",
+            action="store_true",
+            help="Save the results as the baseline of the benchmarks run.",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=settings.BENCHMARK_THRESHOLD,
+            help="Fail when slower than the baseline by more than this fraction.",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = benchmarks.run(options["names"], options["repeat"])
+        baseline = load_baseline(options["baseline"])
+        self.stdout.write(
+            "%-24s %12s %12s %12s %10s %8s"
+            % ("benchmark", "ms", "us/row", "peak KiB", "blocks", "change")
+        )
+        for name, result in results.items():
+            base = baseline.get(name)
+            change = (
+                "%+7.1f%%" % (100 * (result["seconds"] / base["seconds"] - 1))
+                if base
+                else ""
+            )
+            self.stdout.write(
+                "%-24s %12.3f %12.2f %12.1f %10d %8s"
+                % (
+                    name,
+                    result["seconds"] * 1e3,
+                    result["seconds_per_row"] * 1e6,
+                    result["peak_bytes"] / 1024,
+                    result["blocks"],
+                    change,
+                )
+            )
+        if options["save"]:
+            baseline.update(results)
+            save_baseline(options["baseline"], baseline)
+            self.stdout.write("Saved %s" % options["baseline"])
+            return
+        regressions = compare(results, baseline, options["threshold"])
+        if regressions:
+            raise CommandError(
+                "Slower than the baseline: %s"
+                % ", ".join("%s (x%.2f)" % r for r in regressions)
+            )
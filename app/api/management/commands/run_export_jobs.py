@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.api import exports, jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the export jobs queued through /exports/, building their files in "
+        "a process pool. A single worker is run per EXPORT_ROOT: jobs left "
+        "running by a previous worker are queued again on start."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes per job (0 builds in this process).",
+        )
+        parser.add_argument(
+            "--partition-size",
+            type=int,
+            default=None,
+            help="Maximum number of rows per partition.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between checks for queued jobs.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        for job in jobs.requeue_running():
+            self.stdout.write("Queued %s again" % job["id"])
+        while True:
+            done = exports.run_queued(options["workers"], options["partition_size"])
+            for job in done:
+                if job["status"] == "done":
+                    self.stdout.write("%s: %d rows" % (job["id"], job["rows"]))
+                else:
+                    self.stderr.write("%s: %s" % (job["id"], job["error"]))
+            if options["once"] and not done:
+                return
+            if not done:
+                time.sleep(options["interval"])
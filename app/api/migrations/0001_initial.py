@@ -0,0 +1,88 @@
+# Generated by Django 2.2.28 on 2026-10-19 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="ChemicalSummary",
+            fields=[
+                (
+                    "chemical_id",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("name", models.CharField(max_length=500)),
+                ("cas", models.CharField(max_length=50)),
+                ("document_count", models.IntegerField()),
+                ("product_count", models.IntegerField(db_index=True)),
+                ("puc_count", models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DocumentSummary",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data_type", models.CharField(db_index=True, max_length=50)),
+                ("document_type", models.CharField(db_index=True, max_length=100)),
+                ("document_count", models.IntegerField()),
+                ("product_count", models.IntegerField()),
+                ("chemical_count", models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ProductSummary",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("puc_id", models.IntegerField(db_index=True, null=True)),
+                ("manufacturer", models.CharField(db_index=True, max_length=255)),
+                ("brand", models.CharField(db_index=True, max_length=255)),
+                ("product_count", models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PUCSummary",
+            fields=[
+                ("puc_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("level_1_category", models.CharField(db_index=True, max_length=50)),
+                ("level_2_category", models.CharField(db_index=True, max_length=50)),
+                ("level_3_category", models.CharField(db_index=True, max_length=50)),
+                ("kind", models.CharField(db_index=True, max_length=50)),
+                ("product_count", models.IntegerField()),
+                ("document_count", models.IntegerField()),
+                ("chemical_count", models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RefreshState",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("version", models.CharField(max_length=40)),
+                ("refreshed_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 2.2.28 on 2026-10-19 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("api", "0001_initial")]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChemicalPresenceRecord",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                ("name", models.TextField()),
+                ("definition", models.TextField(null=True)),
+                ("kind", models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ChemicalProductRecord",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("chemical_id", models.CharField(db_index=True, max_length=50)),
+                ("product_id", models.IntegerField(db_index=True)),
+                ("puc_id", models.IntegerField(db_index=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ChemicalRecord",
+            fields=[
+                (
+                    "id",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("name", models.TextField(null=True)),
+                ("cas", models.TextField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DocumentRecord",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                ("title", models.TextField(null=True)),
+                ("subtitle", models.TextField(null=True)),
+                ("organization", models.TextField(null=True)),
+                ("date", models.CharField(max_length=25, null=True)),
+                ("data_type", models.TextField(null=True)),
+                ("document_type", models.TextField(null=True)),
+                ("url", models.TextField(null=True)),
+                ("notes", models.TextField(null=True)),
+                ("products", models.TextField()),
+                ("chemicals", models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ProductRecord",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                ("name", models.TextField(null=True)),
+                ("upc", models.CharField(db_index=True, max_length=255, null=True)),
+                ("manufacturer", models.TextField(null=True)),
+                ("brand", models.TextField(null=True)),
+                ("puc_id", models.IntegerField(null=True)),
+                ("document_id", models.IntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PUCRecord",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                ("level_1_category", models.TextField(null=True)),
+                ("level_2_category", models.TextField(null=True)),
+                ("level_3_category", models.TextField(null=True)),
+                ("definition", models.TextField(null=True)),
+                ("kind", models.TextField(null=True)),
+            ],
+        ),
+    ]
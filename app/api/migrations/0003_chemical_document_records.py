@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-19 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("api", "0002_read_models")]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChemicalDocumentRecord",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("chemical_id", models.CharField(db_index=True, max_length=50)),
+                ("document_id", models.IntegerField(db_index=True)),
+            ],
+        )
+    ]
@@ -0,0 +1,130 @@
+from django.db import models
+
+
+class RefreshState(models.Model):
+    """The source data version a derived table was last refreshed from"""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.CharField(max_length=40)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+
+class PUCSummary(models.Model):
+    """Counts of the products, documents and chemicals of each PUC"""
+
+    puc_id = models.IntegerField(primary_key=True)
+    level_1_category = models.CharField(max_length=50, db_index=True)
+    level_2_category = models.CharField(max_length=50, db_index=True)
+    level_3_category = models.CharField(max_length=50, db_index=True)
+    kind = models.CharField(max_length=50, db_index=True)
+    product_count = models.IntegerField()
+    document_count = models.IntegerField()
+    chemical_count = models.IntegerField()
+
+
+class ProductSummary(models.Model):
+    """Counts of products by PUC, manufacturer and brand"""
+
+    puc_id = models.IntegerField(null=True, db_index=True)
+    manufacturer = models.CharField(max_length=255, db_index=True)
+    brand = models.CharField(max_length=255, db_index=True)
+    product_count = models.IntegerField()
+
+
+class DocumentSummary(models.Model):
+    """Counts of documents by data type and document type"""
+
+    data_type = models.CharField(max_length=50, db_index=True)
+    document_type = models.CharField(max_length=100, db_index=True)
+    document_count = models.IntegerField()
+    product_count = models.IntegerField()
+    chemical_count = models.IntegerField()
+
+
+class ChemicalSummary(models.Model):
+    """Counts of the documents, products and PUCs of each chemical"""
+
+    chemical_id = models.CharField(max_length=50, primary_key=True)
+    name = models.CharField(max_length=500)
+    cas = models.CharField(max_length=50)
+    document_count = models.IntegerField()
+    product_count = models.IntegerField(db_index=True)
+    puc_count = models.IntegerField()
+
+
+class PUCRecord(models.Model):
+    """A PUC as served by /pucs/"""
+
+    id = models.IntegerField(primary_key=True)
+    level_1_category = models.TextField(null=True)
+    level_2_category = models.TextField(null=True)
+    level_3_category = models.TextField(null=True)
+    definition = models.TextField(null=True)
+    kind = models.TextField(null=True)
+
+
+class ProductRecord(models.Model):
+    """A product as served by /products/"""
+
+    id = models.IntegerField(primary_key=True)
+    name = models.TextField(null=True)
+    upc = models.CharField(max_length=255, null=True, db_index=True)
+    manufacturer = models.TextField(null=True)
+    brand = models.TextField(null=True)
+    puc_id = models.IntegerField(null=True)
+    document_id = models.IntegerField(null=True)
+
+
+class DocumentRecord(models.Model):
+    """A document as served by /documents/, its lists stored as JSON"""
+
+    id = models.IntegerField(primary_key=True)
+    title = models.TextField(null=True)
+    subtitle = models.TextField(null=True)
+    organization = models.TextField(null=True)
+    date = models.CharField(max_length=25, null=True)
+    data_type = models.TextField(null=True)
+    document_type = models.TextField(null=True)
+    url = models.TextField(null=True)
+    notes = models.TextField(null=True)
+    products = models.TextField()
+    chemicals = models.TextField()
+
+
+class ChemicalRecord(models.Model):
+    """A chemical as served by /chemicals/"""
+
+    id = models.CharField(max_length=50, primary_key=True)
+    name = models.TextField(null=True)
+    cas = models.TextField(null=True)
+
+
+class ChemicalPresenceRecord(models.Model):
+    """A chemical presence tag as served by /chemicalpresences/"""
+
+    id = models.IntegerField(primary_key=True)
+    name = models.TextField()
+    definition = models.TextField(null=True)
+    kind = models.TextField()
+
+
+class ChemicalProductRecord(models.Model):
+    """The chemicals found in each product, and the PUCs of the product
+
+    Serves the chemical filters of the product and PUC records, and the PUC
+    filter of the chemical records.
+    """
+
+    chemical_id = models.CharField(max_length=50, db_index=True)
+    product_id = models.IntegerField(db_index=True)
+    puc_id = models.IntegerField(null=True, db_index=True)
+
+
+class ChemicalDocumentRecord(models.Model):
+    """The chemicals found in each document
+
+    Serves the chemical filter of the document records.
+    """
+
+    chemical_id = models.CharField(max_length=50, db_index=True)
+    document_id = models.IntegerField(db_index=True)
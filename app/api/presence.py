@@ -0,0 +1,256 @@
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.dataversion import VersionedObject
+from dashboard import models
+
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+# Number of set bits of every byte
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def tokenize(expression):
+    """Split a tag expression into parentheses, operators and tag references"""
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_RE.match(expression, position)
+        if match is None:
+            raise ExpressionError("Unexpected character at %d." % position)
+        position = match.end()
+        opening, closing, quoted, word = match.groups()
+        if opening or closing:
+            tokens.append(opening or closing)
+        elif quoted is not None:
+            tokens.append(("tag", re.sub(r"\\(.)", r"\1", quoted)))
+        elif word.lower() in ("and", "or", "not"):
+            tokens.append(word.lower())
+        else:
+            tokens.append(("tag", word))
+    return tokens
+
+
+def describe(token):
+    return repr(token[1]) if isinstance(token, tuple) else repr(token)
+
+
+class Parser:
+    """Recursive descent parser of tag expressions
+
+        expression := term ("or" term)*
+        term := factor ("and" factor)*
+        factor := "not" factor | "(" expression ")" | tag
+
+    A tag is its numeric id or its name, double-quoted when it holds spaces.
+    Each tag is replaced by `resolve(tag)` and the operators are applied with
+    `operators`, a mapping of "and", "or" and "not" to functions.
+    """
+
+    def __init__(self, tokens, resolve, operators):
+        self.tokens = tokens
+        self.position = 0
+        self.resolve = resolve
+        self.operators = operators
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise ExpressionError("Unexpected end of expression.")
+        self.position += 1
+        return token
+
+    def parse(self):
+        value = self.expression()
+        if self.peek() is not None:
+            raise ExpressionError("Unexpected %s." % describe(self.peek()))
+        return value
+
+    def expression(self):
+        value = self.term()
+        while self.peek() == "or":
+            self.take()
+            value = self.operators["or"](value, self.term())
+        return value
+
+    def term(self):
+        value = self.factor()
+        while self.peek() == "and":
+            self.take()
+            value = self.operators["and"](value, self.factor())
+        return value
+
+    def factor(self):
+        token = self.take()
+        if token == "not":
+            return self.operators["not"](self.factor())
+        if token == "(":
+            value = self.expression()
+            if self.take() != ")":
+                raise ExpressionError("Missing closing parenthesis.")
+            return value
+        if isinstance(token, tuple):
+            return self.resolve(token[1])
+        raise ExpressionError("Unexpected %s." % describe(token))
+
+
+class PresenceTags:
+    """Bitsets of the chemicals carrying each chemical presence tag
+
+    Chemicals are numbered by their position in `sids`, and row t of `bits`
+    holds one bit per chemical (packed eight to a byte) telling whether it
+    carries tag t. Only chemicals with at least one tag are numbered.
+    """
+
+    def __init__(self):
+        tags = models.ExtractedListPresenceTag.objects.order_by("id")
+        rows = list(tags.values_list("id", "name", "kind__name"))
+        self.tag_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.names = [r[1] for r in rows]
+        self.kinds = [r[2] for r in rows]
+        links = np.array(
+            models.ExtractedListPresenceToTag.objects.filter(
+                content_object__dsstox__isnull=False
+            )
+            .values_list("tag_id", "content_object__dsstox__sid")
+            .distinct(),
+            dtype=object,
+        ).reshape(-1, 2)
+        self.sids, chemicals = np.unique(links[:, 1].astype(str), return_inverse=True)
+        self.sids = self.sids.tolist()
+        tags = np.searchsorted(self.tag_ids, links[:, 0].astype(np.int64))
+        self.bits = np.zeros((len(self.tag_ids), (len(self.sids) + 7) // 8), np.uint8)
+        masks = (0x80 >> (chemicals % 8)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, (tags, chemicals // 8), masks)
+        self.size = len(self.sids)
+        self.chemical_index = {sid: n for n, sid in enumerate(self.sids)}
+
+    def empty(self):
+        return np.zeros(self.bits.shape[1], dtype=np.uint8)
+
+    def tags_of_kind(self, kind=None):
+        """Return the rows of the tags of a kind, or of every tag"""
+        return [t for t, k in enumerate(self.kinds) if kind is None or k == kind]
+
+    def universe(self, kind=None):
+        """The bitset of the chemicals carrying any tag of a kind"""
+        rows = self.tags_of_kind(kind)
+        if not rows:
+            return self.empty()
+        return np.bitwise_or.reduce(self.bits[rows], axis=0)
+
+    def find_tags(self, reference, kind=None):
+        """Return the rows of the tags referenced by id or name"""
+        if reference.isdigit():
+            n = np.searchsorted(self.tag_ids, int(reference))
+            found = (
+                [n]
+                if n < len(self.tag_ids) and self.tag_ids[n] == int(reference)
+                else []
+            )
+        else:
+            found = [t for t, name in enumerate(self.names) if name == reference]
+        return [t for t in found if kind is None or self.kinds[t] == kind]
+
+    def evaluate(self, expression, kind=None):
+        """Return the bitset of the chemicals matching a tag expression
+
+        A tag name shared by several tags matches any of them. Negation is
+        relative to the chemicals carrying a tag of `kind` (or any tag).
+        """
+        universe = self.universe(kind)
+
+        def resolve(reference):
+            rows = self.find_tags(reference, kind)
+            if not rows:
+                raise ExpressionError("Unknown tag %r." % reference)
+            return np.bitwise_or.reduce(self.bits[rows], axis=0)
+
+        operators = {
+            "and": np.bitwise_and,
+            "or": np.bitwise_or,
+            "not": lambda bits: np.bitwise_and(np.invert(bits), universe),
+        }
+        return Parser(tokenize(expression), resolve, operators).parse()
+
+    def chemicals(self, bits):
+        """Return the positions of the chemicals set in a bitset"""
+        return np.flatnonzero(np.unpackbits(bits)[: self.size])
+
+    def chemical_tags(self, chemical, kind=None):
+        """Return the ids of the tags carried by a chemical position"""
+        byte, mask = chemical // 8, 0x80 >> (chemical % 8)
+        rows = np.flatnonzero(self.bits[:, byte] & mask)
+        return [
+            int(self.tag_ids[t]) for t in rows if kind is None or self.kinds[t] == kind
+        ]
+
+    def cooccurrence(self, bits, kind=None):
+        """Count the chemicals of a bitset carrying each tag, largest first"""
+        columns = np.flatnonzero(bits)
+        rows = np.array(self.tags_of_kind(kind), dtype=np.intp)
+        counts = POPCOUNT[self.bits[np.ix_(rows, columns)] & bits[columns]].sum(axis=1)
+        out = []
+        for n in np.argsort(-counts, kind="stable"):
+            if counts[n] == 0:
+                break
+            t = rows[n]
+            out.append(
+                OrderedDict(
+                    [
+                        ("id", int(self.tag_ids[t])),
+                        ("name", self.names[t]),
+                        ("kind", self.kinds[t]),
+                        ("count", int(counts[n])),
+                    ]
+                )
+            )
+        return out
+
+
+class ChemicalTagSets:
+    """A lazily rendered, sliceable sequence of chemicals and their tags"""
+
+    def __init__(self, tags, chemicals, kind=None):
+        self.tags = tags
+        self.chemicals = chemicals
+        self.kind = kind
+
+    def __len__(self):
+        return len(self.chemicals)
+
+    def count(self):
+        return len(self.chemicals)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.row(c) for c in self.chemicals[key]]
+        return self.row(self.chemicals[key])
+
+    def row(self, chemical):
+        return OrderedDict(
+            [
+                ("chemical_id", self.tags.sids[chemical]),
+                ("tags", self.tags.chemical_tags(chemical, self.kind)),
+            ]
+        )
+
+
+_tags = VersionedObject(PresenceTags)
+
+
+def get_presence_tags():
+    """Return the tag bitsets of the current data version"""
+    return _tags.get()
@@ -0,0 +1,152 @@
+from app.api import models as api_models
+from app.api import snapshots
+from app.api.summaries import Summary
+from dashboard import models
+
+DOCUMENT_SOURCES = (
+    "dashboard.DataDocument",
+    "dashboard.DataGroup",
+    "dashboard.GroupType",
+    "dashboard.DocumentType",
+    "dashboard.ExtractedText",
+    "dashboard.RawChem",
+    "dashboard.ExtractedChemical",
+    "dashboard.DSSToxLookup",
+    "dashboard.ProductDocument",
+)
+
+
+class ResourceRecords(Summary):
+    """A read-model table holding the serialized objects of a resource
+
+    Rows are the output of the resource's serializer, so that the records
+    serve exactly what the normalized tables would.
+    """
+
+    resource = None
+
+    def get_rows(self):
+        queryset = snapshots.get_queryset(self.resource)
+        for row in snapshots.iter_rows(self.resource, queryset):
+            yield self.to_record(row)
+
+    def to_record(self, row):
+        return dict(row)
+
+
+class PUCRecords(ResourceRecords):
+    name = "puc_records"
+    resource = "pucs"
+    model = api_models.PUCRecord
+    key = ("id",)
+    sources = ("dashboard.PUC",)
+
+
+class ProductRecords(ResourceRecords):
+    name = "product_records"
+    resource = "products"
+    model = api_models.ProductRecord
+    key = ("id",)
+    sources = (
+        "dashboard.Product",
+        "dashboard.ProductToPUC",
+        "dashboard.ProductDocument",
+    )
+
+
+class DocumentRecords(ResourceRecords):
+    name = "document_records"
+    resource = "documents"
+    model = api_models.DocumentRecord
+    key = ("id",)
+    sources = DOCUMENT_SOURCES
+
+    def to_record(self, row):
+        return dict(
+            row,
+            products=snapshots.encode_json(row["products"]),
+            chemicals=snapshots.encode_json(row["chemicals"]),
+        )
+
+
+class ChemicalRecords(ResourceRecords):
+    name = "chemical_records"
+    resource = "chemicals"
+    model = api_models.ChemicalRecord
+    key = ("id",)
+    sources = ("dashboard.DSSToxLookup", "dashboard.RawChem")
+
+
+class ChemicalPresenceRecords(ResourceRecords):
+    name = "chemicalpresence_records"
+    resource = "chemicalpresences"
+    model = api_models.ChemicalPresenceRecord
+    key = ("id",)
+
+    @property
+    def sources(self):
+        kind = models.ExtractedListPresenceTag._meta.get_field("kind").related_model
+        return ("dashboard.ExtractedListPresenceTag", kind._meta.label)
+
+
+class ChemicalProductRecords(Summary):
+    name = "chemicalproduct_records"
+    model = api_models.ChemicalProductRecord
+    key = ("chemical_id", "product_id", "puc_id")
+    sources = (
+        "dashboard.Product",
+        "dashboard.ProductToPUC",
+        "dashboard.ProductDocument",
+        "dashboard.RawChem",
+        "dashboard.DSSToxLookup",
+    )
+
+    def get_rows(self):
+        rows = (
+            models.Product.objects.filter(
+                documents__extractedtext__rawchem__dsstox__isnull=False
+            )
+            .order_by()
+            .values_list("documents__extractedtext__rawchem__dsstox__sid", "id", "puc")
+            .distinct()
+        )
+        for chemical_id, product_id, puc_id in rows.iterator():
+            yield {
+                "chemical_id": chemical_id,
+                "product_id": product_id,
+                "puc_id": puc_id,
+            }
+
+
+class ChemicalDocumentRecords(Summary):
+    name = "chemicaldocument_records"
+    model = api_models.ChemicalDocumentRecord
+    key = ("chemical_id", "document_id")
+    sources = (
+        "dashboard.ExtractedText",
+        "dashboard.RawChem",
+        "dashboard.ExtractedChemical",
+        "dashboard.DSSToxLookup",
+    )
+
+    def get_rows(self):
+        # The chemicals of the document records, see DocumentRecords
+        rows = (
+            models.ExtractedChemical.objects.filter(dsstox__isnull=False)
+            .order_by()
+            .values_list("dsstox__sid", "extracted_text_id")
+            .distinct()
+        )
+        for chemical_id, document_id in rows.iterator():
+            yield {"chemical_id": chemical_id, "document_id": document_id}
+
+
+READ_MODELS = [
+    PUCRecords(),
+    ProductRecords(),
+    DocumentRecords(),
+    ChemicalRecords(),
+    ChemicalPresenceRecords(),
+    ChemicalProductRecords(),
+    ChemicalDocumentRecords(),
+]
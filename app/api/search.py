@@ -0,0 +1,369 @@
+import os
+import re
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from app.api import models as api_models
+from app.core.arrayfile import MappedFile, write_arrays
+from app.core.dataversion import compute_data_version
+from app.core.lookup import Strings, column_arrays, offsets
+from dashboard import models
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+
+KINDS = ("chemical", "product", "document")
+
+# Only the best candidates (by label length) are scored when a query
+# matches more entries than this.
+MAX_RANKED = 1000
+
+# Searchable fields of the source with the most
+MAX_FIELDS = 3
+
+
+class TooManyMatches(Exception):
+    """A search filter matches more objects than allowed"""
+
+    def __init__(self, count):
+        super().__init__(count)
+        self.count = count
+
+
+def get_path():
+    return os.path.join(settings.INDEX_ROOT, "search.idx")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def trigrams(token):
+    return {token[i : i + 3] for i in range(len(token) - 2)}
+
+
+def get_sources():
+    """Return the searchable fields of every kind
+
+    Each source is (kind, queryset, id field, searchable fields, weights),
+    the first searchable field being used as the label. The read-model
+    tables are searched when the API is served from them.
+    """
+    if settings.API_READ_MODELS:
+        return (
+            (
+                "chemical",
+                api_models.ChemicalRecord.objects.all(),
+                "id",
+                ("name", "cas"),
+                (1.0, 1.0),
+            ),
+            (
+                "product",
+                api_models.ProductRecord.objects.all(),
+                "id",
+                ("name", "brand", "manufacturer"),
+                (1.0, 0.5, 0.5),
+            ),
+            (
+                "document",
+                api_models.DocumentRecord.objects.all(),
+                "id",
+                ("title", "organization"),
+                (1.0, 0.5),
+            ),
+        )
+    return (
+        (
+            "chemical",
+            models.DSSToxLookup.objects.exclude(curated_chemical__isnull=True),
+            "sid",
+            ("true_chemname", "true_cas"),
+            (1.0, 1.0),
+        ),
+        (
+            "product",
+            models.Product.objects.all(),
+            "id",
+            ("title", "brand_name", "manufacturer"),
+            (1.0, 0.5, 0.5),
+        ),
+        (
+            "document",
+            models.DataDocument.objects.all(),
+            "id",
+            ("title", "organization"),
+            (1.0, 0.5),
+        ),
+    )
+
+
+def build_index(path=None):
+    """Write the search index of every source, returns the number of entries
+
+    Tokens are kept in a sorted vocabulary so that every prefix maps to a
+    contiguous range of token ids. The entries containing each token are
+    stored as one concatenated array with offsets, and the trigrams of each
+    token, sorted, point back to the vocabulary for substring matching.
+    """
+    version = compute_data_version()
+    kinds, pks, ids, labels, fields = array("b"), [], [], [], []
+    weights, int_ids = {}, []
+    pairs = {}
+    for kind, queryset, id_field, names, kind_weights in get_sources():
+        kind_code = KINDS.index(kind)
+        weights[kind] = kind_weights
+        rows = queryset.order_by("pk").values_list("pk", id_field, *names)
+        for row in rows.iterator():
+            entry = len(ids)
+            kinds.append(kind_code)
+            pks.append(row[0])
+            ids.append(row[1])
+            values = tuple(tokenize(v) for v in row[2:])
+            labels.append(row[2] or "")
+            fields.append(tuple(" ".join(tokens) for tokens in values))
+            for token in set(t for tokens in values for t in tokens):
+                pairs.setdefault(token, array("i")).append(entry)
+        if ids and isinstance(ids[-1], int):
+            int_ids.append(kind)
+    arrays = OrderedDict()
+    arrays["kinds"] = np.frombuffer(kinds, dtype=np.int8)
+    # Primary keys are not integers in the chemical read-model table
+    int_pks = all(isinstance(pk, int) for pk in pks)
+    if int_pks:
+        arrays["pks"] = np.array(pks, dtype=np.int64)
+    else:
+        arrays.update(column_arrays("pks", "str", pks))
+    arrays.update(column_arrays("ids", "str", ids))
+    arrays.update(column_arrays("labels", "str", labels))
+    arrays["lengths"] = np.array([len(label) for label in labels], dtype=np.int32)
+    for n in range(MAX_FIELDS):
+        values = [f[n] if n < len(f) else None for f in fields]
+        arrays.update(column_arrays("fields.%d" % n, "str", values))
+    vocabulary = sorted(pairs)
+    arrays.update(column_arrays("vocabulary", "str", vocabulary))
+    postings = [np.frombuffer(pairs.pop(t), dtype=np.int32) for t in vocabulary]
+    arrays["offsets"] = offsets(len(p) for p in postings)
+    arrays["postings"] = (
+        np.concatenate(postings) if postings else np.zeros(0, dtype=np.int32)
+    )
+    grams = {}
+    for token_id, token in enumerate(vocabulary):
+        for gram in trigrams(token):
+            grams.setdefault(gram, array("i")).append(token_id)
+    gram_keys = sorted(grams)
+    arrays["trigrams"] = np.array([g.encode() for g in gram_keys], dtype="S")
+    arrays["trigrams.offsets"] = offsets(len(grams[g]) for g in gram_keys)
+    arrays["trigrams.tokens"] = np.array(
+        [t for g in gram_keys for t in grams[g]], dtype=np.int32
+    )
+    meta = {
+        "data_version": version,
+        "weights": weights,
+        "int_ids": int_ids,
+        "int_pks": int_pks,
+    }
+    write_arrays(path or get_path(), arrays, meta)
+    return len(ids)
+
+
+class SearchIndex:
+    """The token and trigram index over chemicals, products and documents
+
+    The arrays are read in place from the index file, see `build_index`.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.kinds = arrays["kinds"]
+        self.lengths = arrays["lengths"]
+        self.offsets = arrays["offsets"]
+        self.postings = arrays["postings"]
+        self.vocabulary = Strings(arrays, "vocabulary")
+        self.labels = Strings(arrays, "labels")
+        self.id_strings = Strings(arrays, "ids")
+        self.fields = [
+            Strings(arrays, "fields.%d" % n)
+            for n in range(MAX_FIELDS)
+            if "fields.%d" % n in arrays
+        ]
+        meta = arrays.meta
+        self.weights = [meta["weights"].get(kind, ()) for kind in KINDS]
+        self.int_ids = [KINDS.index(kind) for kind in meta["int_ids"]]
+        self.pks = arrays["pks"] if meta["int_pks"] else Strings(arrays, "pks")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def get_id(self, entry):
+        value = self.id_strings[entry]
+        return int(value) if self.kinds[entry] in self.int_ids else value
+
+    def get_trigram(self, gram):
+        """Return the ids of the tokens containing a trigram, None if none does"""
+        keys = self.arrays["trigrams"]
+        key = gram.encode()
+        n = np.searchsorted(keys, key)
+        if n == len(keys) or keys[n] != key:
+            return None
+        offsets = self.arrays["trigrams.offsets"]
+        return self.arrays["trigrams.tokens"][offsets[n] : offsets[n + 1]]
+
+    def entries_for_tokens(self, token_ids):
+        if len(token_ids) == 0:
+            return np.zeros(0, dtype=np.int32)
+        slices = [
+            self.postings[self.offsets[t] : self.offsets[t + 1]] for t in token_ids
+        ]
+        return np.unique(np.concatenate(slices))
+
+    def prefix_entries(self, term):
+        """Entries having a token which starts with `term`"""
+        low = bisect_left(self.vocabulary, term)
+        high = bisect_left(self.vocabulary, term + "\U0010ffff")
+        return np.unique(self.postings[self.offsets[low] : self.offsets[high]])
+
+    def substring_entries(self, term):
+        """Entries having a token which contains `term`"""
+        if len(term) < 3:
+            return self.prefix_entries(term)
+        grams = [self.get_trigram(gram) for gram in trigrams(term)]
+        if any(token_ids is None for token_ids in grams):
+            return np.zeros(0, dtype=np.int32)
+        candidates = None
+        for token_ids in sorted(grams, key=len):
+            candidates = (
+                token_ids
+                if candidates is None
+                else np.intersect1d(candidates, token_ids, assume_unique=True)
+            )
+        token_ids = [t for t in candidates if term in self.vocabulary[t]]
+        return self.entries_for_tokens(token_ids)
+
+    def score(self, entry, terms):
+        """Rank an entry: whole field, field prefix, token prefix and substring
+        matches score 4, 3, 2 and 1 respectively, weighted by field
+        """
+        weights = self.weights[self.kinds[entry]]
+        values = [field[entry] for field in self.fields[: len(weights)]]
+        total = 0.0
+        for term in terms:
+            best = 0.0
+            for weight, value in zip(weights, values):
+                if value == term:
+                    points = 4
+                elif value.startswith(term):
+                    points = 3
+                elif (" " + term) in (" " + value):
+                    points = 2
+                elif term in value:
+                    points = 1
+                else:
+                    continue
+                best = max(best, points * weight)
+            total += best
+        return total
+
+    def match(self, terms, kinds=None, prefix=False):
+        """Return the unordered entries matching every term
+
+        With `prefix` terms match the start of indexed tokens (autocomplete),
+        otherwise any part of them.
+        """
+        lookup = self.prefix_entries if prefix else self.substring_entries
+        entries = np.zeros(0, dtype=np.int32)
+        for i, term in enumerate(sorted(set(terms), key=len, reverse=True)):
+            matches = lookup(term)
+            entries = (
+                matches
+                if i == 0
+                else np.intersect1d(entries, matches, assume_unique=True)
+            )
+            if len(entries) == 0:
+                break
+        if kinds:
+            codes = [KINDS.index(k) for k in kinds]
+            entries = entries[np.isin(self.kinds[entries], codes)]
+        return entries
+
+    def search(self, query, kinds=None, prefix=False):
+        """Return the ranked `SearchResults` of a query"""
+        terms = tokenize(query)
+        entries = self.match(terms, kinds, prefix)
+        # Shortest labels first, then rank the best candidates by score
+        entries = entries[np.argsort(self.lengths[entries], kind="stable")]
+        head = sorted(entries[:MAX_RANKED], key=lambda e: -self.score(e, terms))
+        order = np.concatenate([np.array(head, dtype=np.int32), entries[MAX_RANKED:]])
+        return SearchResults(self, order, terms)
+
+    def filter_pks(self, query, kind, limit=None):
+        """Return the primary keys of the objects of a kind matching a query
+
+        Raises `TooManyMatches` when more than `limit` objects match.
+        """
+        entries = self.filter_entries(query, kind, limit)
+        if isinstance(self.pks, np.ndarray):
+            return self.pks[entries].tolist()
+        return [self.pks[e] for e in entries]
+
+    def filter_ids(self, query, kind, limit=None):
+        """Return the API ids of the objects of a kind matching a query
+
+        Raises `TooManyMatches` when more than `limit` objects match.
+        """
+        return [self.get_id(e) for e in self.filter_entries(query, kind, limit)]
+
+    def filter_entries(self, query, kind, limit):
+        entries = self.match(tokenize(query), [kind])
+        if limit is not None and len(entries) > limit:
+            raise TooManyMatches(len(entries))
+        return entries
+
+
+class SearchResults:
+    """A lazily rendered, sliceable sequence of search hits"""
+
+    def __init__(self, index, entries, terms):
+        self.index = index
+        self.entries = entries
+        self.terms = terms
+
+    def __len__(self):
+        return len(self.entries)
+
+    def count(self):
+        return len(self.entries)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.hit(e) for e in self.entries[key]]
+        return self.hit(self.entries[key])
+
+    def hit(self, entry):
+        return OrderedDict(
+            [
+                ("type", KINDS[self.index.kinds[entry]]),
+                ("id", self.index.get_id(entry)),
+                ("label", self.index.labels[entry]),
+                ("score", self.index.score(entry, self.terms)),
+            ]
+        )
+
+
+_files = {}
+
+
+def get_index():
+    """Return the search index, or None when it has not been built"""
+    path = get_path()
+    arrays = _files.setdefault(path, MappedFile(path)).get()
+    return None if arrays is None else SearchIndex(arrays)
+
+
+def get_built_version():
+    """Return the data version of the search index, None if there is none"""
+    index = get_index()
+    return None if index is None else index.arrays.meta.get("data_version")
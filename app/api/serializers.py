@@ -1,7 +1,61 @@
+from typing import List
+
 from rest_framework import serializers
+from rest_framework.fields import SkipField, empty
+
+from app.api import jobs, lookups
+from app.api import models as api_models
 from dashboard import models
 
 
+def get_context_lookups(context):
+    """Return the lookup tables of a serializer context, resolved once"""
+    if "lookups" not in context:
+        context["lookups"] = lookups.get_lookups()
+    return context["lookups"]
+
+
+class LookupMixin:
+    """Reads the value of a field from a lookup table when it is current
+
+    `lookup` is the (table, column, key attribute) of the value, which is read
+    from `source` when the lookup tables have not been built at the current
+    data version, or have no row for the key, e.g. for an object created
+    since their build. The tables are resolved once per serializer, or taken
+    from the `lookups` of its context.
+    """
+
+    def __init__(self, *args, lookup, **kwargs):
+        self.lookup_table, self.lookup_column, self.lookup_key = lookup
+        super().__init__(*args, **kwargs)
+
+    def get_attribute(self, instance):
+        tables = get_context_lookups(self.context)
+        if tables is None:
+            return super().get_attribute(instance)
+        table = tables[self.lookup_table]
+        n = table.position(getattr(instance, self.lookup_key))
+        if n is None:
+            return super().get_attribute(instance)
+        value = table.value(n, self.lookup_column)
+        if value is not None:
+            return value
+        # As when source is missing
+        if self.default is not empty:
+            return self.get_default()
+        if self.allow_null:
+            return None
+        raise SkipField()
+
+
+class LookupIntegerField(LookupMixin, serializers.IntegerField):
+    pass
+
+
+class LookupCharField(LookupMixin, serializers.CharField):
+    pass
+
+
 class PUCSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.PUC
@@ -71,8 +125,60 @@ class ChemicalSerializer(serializers.ModelSerializer):
         }
 
 
+class PUCTreeSerializer(serializers.Serializer):
+    id = serializers.IntegerField(
+        read_only=True,
+        allow_null=True,
+        label="PUC ID",
+        help_text="The unique numeric identifier for the PUC defined by this node, if \
+            the categories of the node are themselves a PUC.",
+    )
+    name = serializers.CharField(
+        read_only=True,
+        label="Name",
+        help_text="The Level 1, 2 or 3 category of this node.",
+    )
+    level = serializers.IntegerField(
+        read_only=True, label="Level", help_text="The level of this node (1-3)."
+    )
+    kind = serializers.CharField(
+        read_only=True,
+        allow_null=True,
+        label="Kind",
+        help_text="The kind of the PUC defined by this node, if any.",
+    )
+    definition = serializers.CharField(
+        read_only=True,
+        allow_null=True,
+        label="Definition",
+        help_text="Definition of the PUC defined by this node, if any.",
+    )
+    product_count = serializers.IntegerField(
+        read_only=True,
+        label="Product count",
+        help_text="Number of products assigned to this node or any node below it.",
+    )
+    document_count = serializers.IntegerField(
+        read_only=True,
+        label="Document count",
+        help_text="Number of documents linked to those products.",
+    )
+    chemical_count = serializers.IntegerField(
+        read_only=True,
+        label="Chemical count",
+        help_text="Number of chemicals found in those documents.",
+    )
+    children = serializers.ListField(
+        child=serializers.DictField(),
+        read_only=True,
+        label="Children",
+        help_text="The nodes one level below this node, with the same structure.",
+    )
+
+
 class ProductSerializer(serializers.ModelSerializer):
-    puc_id = serializers.IntegerField(
+    puc_id = LookupIntegerField(
+        lookup=("products", "puc", "id"),
         source="uber_puc.id",
         default=None,
         read_only=True,
@@ -81,7 +187,8 @@ class ProductSerializer(serializers.ModelSerializer):
         help_text=" Unique numeric identifier for the product use category assigned to the product \
         (if one has been assigned). Use the PUCs API to obtain additional information on the PUC.",
     )
-    document_id = serializers.IntegerField(
+    document_id = LookupIntegerField(
+        lookup=("products", "document", "id"),
         source="documents.first.id",
         read_only=True,
         label="Document ID",
@@ -124,7 +231,8 @@ class ProductSerializer(serializers.ModelSerializer):
 
 class ExtractedChemicalSerializer(serializers.ModelSerializer):
 
-    chemical_id = serializers.CharField(
+    chemical_id = LookupCharField(
+        lookup=("chemicals", "sid", "dsstox_id"),
         label="DTXSID",
         help_text="The DSSTox Substance Identifier for each chemical included on the document. \
             May be >1 per document. See the chemicals API for additional information on the \
@@ -212,8 +320,7 @@ class DocumentSerializer(serializers.ModelSerializer):
         label="URL",
         help_text="Link to a locally stored copy of the document.",
     )
-    products = serializers.PrimaryKeyRelatedField(
-        many=True,
+    products = serializers.SerializerMethodField(
         read_only=True,
         label="Product IDs",
         help_text="Unique numeric identifiers for products associated with the \
@@ -228,6 +335,18 @@ class DocumentSerializer(serializers.ModelSerializer):
     def get_url(self, obj) -> serializers.URLField:
         return obj.file.url if obj.file else None
 
+    def get_products(self, obj) -> List[int]:
+        tables = get_context_lookups(self.context)
+        if tables is not None:
+            return tables["documents"].get(obj.id, "products", [])
+        # Read from the link table rows prefetched by DocumentViewSet
+        links = getattr(obj, "product_links", None)
+        if links is None:
+            return list(
+                obj.products.order_by("id").values_list("id", flat=True).distinct()
+            )
+        return sorted({link.product_id for link in links})
+
     class Meta:
         model = models.DataDocument
         fields = [
@@ -293,3 +412,413 @@ class ChemicalPresenceSerializer(serializers.ModelSerializer):
                 "label": "Definition",
             },
         }
+
+
+class SimilarProductSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(
+        read_only=True, label="Product ID", help_text="The ID of a similar product."
+    )
+    similarity = serializers.FloatField(
+        read_only=True,
+        label="Similarity",
+        help_text="The Jaccard similarity of the chemicals of both products, "
+        "between 0 and 1.",
+    )
+
+
+class CooccurringChemicalSerializer(serializers.Serializer):
+    chemical_id = serializers.CharField(
+        read_only=True,
+        label="Chemical ID",
+        help_text="The DTXSID of a chemical found with the requested chemical.",
+    )
+    count = serializers.IntegerField(
+        read_only=True,
+        label="Count",
+        help_text="The number of products (or PUCs) holding both chemicals.",
+    )
+
+
+class ChemicalPairSerializer(serializers.Serializer):
+    chemical_id = serializers.CharField(
+        read_only=True, label="Chemical ID", help_text="The DTXSID of the chemical."
+    )
+    other_chemical_id = serializers.CharField(
+        read_only=True,
+        label="Other chemical ID",
+        help_text="The DTXSID of the other chemical.",
+    )
+    level = serializers.CharField(
+        read_only=True,
+        label="Level",
+        help_text="Whether chemicals are counted together by product or by PUC.",
+    )
+    chemical_count = serializers.IntegerField(
+        read_only=True,
+        label="Chemical count",
+        help_text="The number of products (or PUCs) holding the chemical.",
+    )
+    other_chemical_count = serializers.IntegerField(
+        read_only=True,
+        label="Other chemical count",
+        help_text="The number of products (or PUCs) holding the other chemical.",
+    )
+    count = serializers.IntegerField(
+        read_only=True,
+        label="Count",
+        help_text="The number of products (or PUCs) holding both chemicals.",
+    )
+
+
+class PresenceChemicalSerializer(serializers.Serializer):
+    chemical_id = serializers.CharField(
+        read_only=True,
+        label="Chemical ID",
+        help_text="The DTXSID of a chemical carrying the requested tags.",
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        read_only=True,
+        label="Tags",
+        help_text="The IDs of every chemical presence tag carried by the chemical, "
+        "within the requested kind if any.",
+    )
+
+
+class PresenceTagCountSerializer(serializers.Serializer):
+    id = serializers.IntegerField(
+        read_only=True,
+        label="Chemical Presence ID",
+        help_text="The unique numeric identifier for the chemical presence tag.",
+    )
+    name = serializers.CharField(read_only=True, label="Name")
+    kind = serializers.CharField(read_only=True, label="Kind")
+    count = serializers.IntegerField(
+        read_only=True,
+        label="Count",
+        help_text="The number of matching chemicals which carry the tag.",
+    )
+
+
+class SearchResultSerializer(serializers.Serializer):
+    type = serializers.ReadOnlyField(
+        label="Type",
+        help_text="The kind of object matched: 'chemical', 'product' or 'document'.",
+    )
+    id = serializers.ReadOnlyField(
+        label="ID",
+        help_text="The DTXSID of a matched chemical, or the unique numeric identifier of a \
+            matched product or document. Use the corresponding API to obtain additional \
+            information on the object.",
+    )
+    label = serializers.ReadOnlyField(
+        label="Label",
+        help_text="Preferred name of the chemical, or title of the product or document.",
+    )
+    score = serializers.FloatField(
+        read_only=True,
+        label="Score",
+        help_text="Relevance of the match. Whole field matches rank above matches at \
+            the start of a field or word, which rank above matches within a word.",
+    )
+
+
+class SummarySerializer(serializers.ModelSerializer):
+    """Serializes summary rows, or rows grouped by a subset of their fields
+
+    Grouped rows are dictionaries in which the counts are sums.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        if isinstance(instance, dict):
+            instance = {
+                (k[: -len("__sum")] if k.endswith("__sum") else k): v
+                for k, v in instance.items()
+            }
+        return super().to_representation(instance)
+
+
+COUNT_HELP_TEXT = {
+    "product_count": "Number of distinct products.",
+    "document_count": "Number of distinct documents.",
+    "chemical_count": "Number of distinct chemicals.",
+}
+
+
+class PUCStatsSerializer(SummarySerializer):
+    class Meta:
+        model = api_models.PUCSummary
+        fields = [
+            "puc_id",
+            "level_1_category",
+            "level_2_category",
+            "level_3_category",
+            "kind",
+            "product_count",
+            "document_count",
+            "chemical_count",
+        ]
+        extra_kwargs = {
+            "puc_id": {
+                "label": "PUC ID",
+                "help_text": "The unique numeric identifier for the PUC.",
+            },
+            "level_1_category": {
+                "label": "Level 1 Category",
+                "help_text": "High-level product sector.",
+            },
+            "level_2_category": {
+                "label": "Level 2 Category",
+                "help_text": "Product family within the sector.",
+            },
+            "level_3_category": {
+                "label": "Level 3 Category",
+                "help_text": "Product type within the family.",
+            },
+            "kind": {"label": "Kind", "help_text": "The kind of the PUC."},
+            "product_count": {
+                "label": "Product count",
+                "help_text": COUNT_HELP_TEXT["product_count"],
+            },
+            "document_count": {
+                "label": "Document count",
+                "help_text": COUNT_HELP_TEXT["document_count"],
+            },
+            "chemical_count": {
+                "label": "Chemical count",
+                "help_text": COUNT_HELP_TEXT["chemical_count"],
+            },
+        }
+
+
+class ProductStatsSerializer(SummarySerializer):
+    class Meta:
+        model = api_models.ProductSummary
+        fields = ["puc_id", "manufacturer", "brand", "product_count"]
+        extra_kwargs = {
+            "puc_id": {
+                "label": "PUC ID",
+                "help_text": "The PUC assigned to the products, if any.",
+            },
+            "manufacturer": {
+                "label": "Manufacturer",
+                "help_text": "Manufacturer of the products.",
+            },
+            "brand": {"label": "Brand", "help_text": "Brand name of the products."},
+            "product_count": {
+                "label": "Product count",
+                "help_text": COUNT_HELP_TEXT["product_count"],
+            },
+        }
+
+
+class DocumentStatsSerializer(SummarySerializer):
+    class Meta:
+        model = api_models.DocumentSummary
+        fields = [
+            "data_type",
+            "document_type",
+            "document_count",
+            "product_count",
+            "chemical_count",
+        ]
+        extra_kwargs = {
+            "data_type": {
+                "label": "Data type",
+                "help_text": "Type of data provided by the documents.",
+            },
+            "document_type": {
+                "label": "Document type",
+                "help_text": "Standardized type of the documents.",
+            },
+            "document_count": {
+                "label": "Document count",
+                "help_text": COUNT_HELP_TEXT["document_count"],
+            },
+            "product_count": {
+                "label": "Product count",
+                "help_text": COUNT_HELP_TEXT["product_count"],
+            },
+            "chemical_count": {
+                "label": "Chemical count",
+                "help_text": COUNT_HELP_TEXT["chemical_count"],
+            },
+        }
+
+
+class ChemicalStatsSerializer(SummarySerializer):
+    class Meta:
+        model = api_models.ChemicalSummary
+        fields = [
+            "chemical_id",
+            "name",
+            "cas",
+            "document_count",
+            "product_count",
+            "puc_count",
+        ]
+        extra_kwargs = {
+            "chemical_id": {
+                "label": "DTXSID",
+                "help_text": "The DSSTox Substance Identifier of the chemical.",
+            },
+            "name": {
+                "label": "Preferred name",
+                "help_text": "Preferred name for the chemical substance.",
+            },
+            "cas": {
+                "label": "Preferred CAS",
+                "help_text": "Preferred CAS number for the chemical substance.",
+            },
+            "document_count": {
+                "label": "Document count",
+                "help_text": "Number of documents the chemical was found in.",
+            },
+            "product_count": {
+                "label": "Product count",
+                "help_text": "Number of products the chemical was found in.",
+            },
+            "puc_count": {
+                "label": "PUC count",
+                "help_text": "Number of PUCs of those products.",
+            },
+        }
+
+
+class HistogramSerializer(serializers.Serializer):
+    edges = serializers.ListField(
+        child=serializers.FloatField(),
+        read_only=True,
+        label="Edges",
+        help_text="The bin edges, one more than the number of bins.",
+    )
+    counts = serializers.ListField(
+        child=serializers.IntegerField(),
+        read_only=True,
+        label="Counts",
+        help_text="The number of values in each bin.",
+    )
+
+
+class DistributionSerializer(serializers.Serializer):
+    count = serializers.IntegerField(
+        read_only=True,
+        label="Count",
+        help_text="Number of reported values within the requested range.",
+    )
+    min = serializers.FloatField(read_only=True, allow_null=True, label="Minimum")
+    max = serializers.FloatField(read_only=True, allow_null=True, label="Maximum")
+    mean = serializers.FloatField(read_only=True, allow_null=True, label="Mean")
+    percentiles = serializers.DictField(
+        child=serializers.FloatField(allow_null=True),
+        read_only=True,
+        label="Percentiles",
+        help_text="The 5th, 10th, 25th, 50th, 75th, 90th and 95th percentiles.",
+    )
+    histogram = HistogramSerializer(read_only=True, label="Histogram")
+
+
+class WeightFractionStatsSerializer(serializers.Serializer):
+    component = serializers.CharField(
+        read_only=True,
+        required=False,
+        label="Component",
+        help_text="The product component, when grouping by component.",
+    )
+    puc = serializers.IntegerField(
+        read_only=True,
+        required=False,
+        label="PUC ID",
+        help_text="The PUC of the products, when grouping by PUC.",
+    )
+    count = serializers.IntegerField(
+        read_only=True,
+        label="Count",
+        help_text="Number of chemical records in the group.",
+    )
+    lower_weight_fraction = DistributionSerializer(
+        read_only=True,
+        label="Lower weight fraction",
+        help_text="Distribution of the minimum weight fraction of the chemicals.",
+    )
+    central_weight_fraction = DistributionSerializer(
+        read_only=True,
+        label="Central weight fraction",
+        help_text="Distribution of the central weight fraction of the chemicals.",
+    )
+    upper_weight_fraction = DistributionSerializer(
+        read_only=True,
+        label="Upper weight fraction",
+        help_text="Distribution of the maximum weight fraction of the chemicals.",
+    )
+
+
+class ExportSpecSerializer(serializers.Serializer):
+    resource = serializers.ChoiceField(
+        choices=["pucs", "products", "documents", "chemicals", "chemicalpresences"],
+        label="Resource",
+        help_text="The resource to export.",
+    )
+    filters = serializers.DictField(
+        child=serializers.ListField(child=serializers.CharField(), allow_empty=False),
+        required=False,
+        default=dict,
+        label="Filters",
+        help_text="The values of the filters of the resource's list service, e.g. "
+        '{"chemical": ["DTXSID6026296", "DTXSID2021781"]}. Objects matching any '
+        "value of a filter, and every filter, are exported.",
+    )
+
+
+class ExportJobSerializer(serializers.Serializer):
+    id = serializers.CharField(
+        read_only=True, label="Job ID", help_text="The identifier of the job."
+    )
+    status = serializers.ChoiceField(
+        choices=jobs.STATUSES,
+        read_only=True,
+        label="Status",
+        help_text="Whether the job is queued, running, done or failed.",
+    )
+    resource = serializers.CharField(
+        source="spec.resource", read_only=True, label="Resource"
+    )
+    filters = serializers.DictField(
+        source="spec.filters",
+        child=serializers.ListField(child=serializers.CharField()),
+        read_only=True,
+        label="Filters",
+    )
+    created = serializers.CharField(read_only=True, label="Created")
+    started = serializers.CharField(read_only=True, allow_null=True, label="Started")
+    finished = serializers.CharField(read_only=True, allow_null=True, label="Finished")
+    data_version = serializers.CharField(
+        read_only=True,
+        allow_null=True,
+        label="Data version",
+        help_text="The version of the data the files were built from, once running.",
+    )
+    rows = serializers.IntegerField(
+        read_only=True,
+        allow_null=True,
+        label="Rows",
+        help_text="The number of exported objects, once done.",
+    )
+    files = serializers.DictField(
+        child=serializers.URLField(),
+        read_only=True,
+        label="Files",
+        help_text="The links to the gzipped NDJSON and CSV files, once done.",
+    )
+    error = serializers.CharField(
+        read_only=True,
+        allow_null=True,
+        label="Error",
+        help_text="Why the job failed, if it did.",
+    )
@@ -0,0 +1,202 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from app.core.arrayfile import MappedFile, write_arrays
+from dashboard import models
+
+NUM_PERM = 128
+
+# 32 bands of 4 rows find pairs above a Jaccard similarity of about 0.4
+BANDS = 32
+
+# Weight fractions are rounded up to tenths, a chemical at level k being
+# represented by k tokens, so that the Jaccard similarity of the token sets
+# approximates the weighted similarity of the compositions
+WEIGHT_LEVELS = 10
+
+BATCH_TOKENS = 100000
+
+
+def get_path():
+    return os.path.join(settings.INDEX_ROOT, "similar_products.idx")
+
+
+def get_compositions(weighted=False):
+    """Return (product ids, token offsets, tokens) of every product
+
+    The tokens of product i are tokens[offsets[i]:offsets[i + 1]], sorted,
+    and are the DSSTox ids of its chemicals, or with `weighted` one token
+    per weight level of each chemical.
+    """
+    prefix = "documents__extractedtext__rawchem__"
+    rows = models.Product.objects.filter(**{prefix + "dsstox__isnull": False})
+    fields = ["id", prefix + "dsstox_id"]
+    if weighted:
+        fields.append(prefix + "extractedchemical__central_wf_analysis")
+    values = rows.order_by().values_list(*fields).distinct()
+    rows = np.array(
+        [[0 if v is None else v for v in row] for row in values.iterator()],
+        dtype=np.float64,
+    ).reshape(-1, len(fields))
+    products = rows[:, 0].astype(np.int64)
+    chemicals = rows[:, 1].astype(np.int64)
+    if weighted:
+        levels = np.clip(np.ceil(rows[:, 2] * WEIGHT_LEVELS), 1, WEIGHT_LEVELS)
+        levels = levels.astype(np.int64)
+        # Keep the highest level of a chemical reported several times
+        order = np.lexsort((-levels, chemicals, products))
+        products, chemicals, levels = products[order], chemicals[order], levels[order]
+        first = np.ones(len(products), dtype=bool)
+        first[1:] = (products[1:] != products[:-1]) | (chemicals[1:] != chemicals[:-1])
+        products, chemicals, levels = products[first], chemicals[first], levels[first]
+        products = np.repeat(products, levels)
+        starts = np.cumsum(levels) - levels
+        steps = np.arange(levels.sum()) - np.repeat(starts, levels)
+        tokens = np.repeat(chemicals, levels) * WEIGHT_LEVELS + steps
+    else:
+        tokens = chemicals
+    order = np.lexsort((tokens, products))
+    products, tokens = products[order], tokens[order]
+    keep = np.ones(len(tokens), dtype=bool)
+    keep[1:] = (products[1:] != products[:-1]) | (tokens[1:] != tokens[:-1])
+    products, tokens = products[keep], tokens[keep]
+    ids, counts = np.unique(products, return_counts=True)
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return ids, offsets, tokens
+
+
+def make_permutations(num_perm, seed=0):
+    random = np.random.RandomState(seed)
+    a = random.randint(1, 2 ** 62, size=num_perm, dtype=np.int64) * 2 + 1
+    b = random.randint(0, 2 ** 62, size=num_perm, dtype=np.int64)
+    return a.astype(np.uint64), b.astype(np.uint64)
+
+
+def mix(tokens):
+    """Spread token values over 64 bits (the splitmix64 finalizer)"""
+    x = tokens.astype(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash(offsets, tokens, num_perm=NUM_PERM, batch_tokens=BATCH_TOKENS):
+    """Return the MinHash signature of every token set, as uint32 rows
+
+    Hashes are computed in batches of whole sets of about `batch_tokens`
+    tokens, keeping the temporary matrix small.
+    """
+    a, b = make_permutations(num_perm)
+    signatures = np.empty((len(offsets) - 1, num_perm), dtype=np.uint32)
+    mixed = mix(tokens)
+    start = 0
+    with np.errstate(over="ignore"):
+        while start < len(offsets) - 1:
+            stop = np.searchsorted(offsets, offsets[start] + batch_tokens, "right") - 1
+            stop = min(max(stop, start + 1), len(offsets) - 1)
+            low, high = offsets[start], offsets[stop]
+            hashes = (mixed[low:high, None] * a + b) >> np.uint64(32)
+            signatures[start:stop] = np.minimum.reduceat(
+                hashes.astype(np.uint32), offsets[start:stop] - low, axis=0
+            )
+            start = stop
+    return signatures
+
+
+def band_keys(signatures, bands=BANDS):
+    """Hash each band of rows of the signatures to a uint64 key"""
+    rows = signatures.shape[1] // bands
+    keys = np.empty((bands, len(signatures)), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for band in range(bands):
+            key = np.full(len(signatures), 0xCBF29CE484222325, dtype=np.uint64)
+            for column in signatures[:, band * rows : (band + 1) * rows].T:
+                key = mix(key ^ column.astype(np.uint64))
+            keys[band] = key
+    return keys
+
+
+def build_index(path=None, weighted=False):
+    """Compute the signatures and LSH tables of every product and write them"""
+    ids, offsets, tokens = get_compositions(weighted)
+    signatures = minhash(offsets, tokens)
+    keys = band_keys(signatures)
+    order = np.argsort(keys, axis=1, kind="stable").astype(np.int32)
+    write_arrays(
+        path or get_path(),
+        OrderedDict(
+            [
+                ("products", ids),
+                ("offsets", offsets),
+                ("tokens", tokens),
+                ("signatures", signatures),
+                ("band_keys", np.take_along_axis(keys, order, axis=1)),
+                ("band_members", order),
+            ]
+        ),
+        {"weighted": weighted, "bands": BANDS, "num_perm": NUM_PERM},
+    )
+    return len(ids)
+
+
+class SimilarProducts:
+    """Queries of a similar product index file"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def position(self, product_id):
+        products = self.index["products"]
+        n = np.searchsorted(products, product_id)
+        if n < len(products) and products[n] == product_id:
+            return int(n)
+        return None
+
+    def token_set(self, n):
+        offsets = self.index["offsets"]
+        return self.index["tokens"][offsets[n] : offsets[n + 1]]
+
+    def candidates(self, n):
+        """Products sharing at least one band with product n"""
+        keys, members = self.index["band_keys"], self.index["band_members"]
+        found = []
+        own = band_keys(self.index["signatures"][n : n + 1])[:, 0]
+        for band in range(keys.shape[0]):
+            low = np.searchsorted(keys[band], own[band], "left")
+            high = np.searchsorted(keys[band], own[band], "right")
+            found.append(members[band][low:high])
+        candidates = np.unique(np.concatenate(found))
+        return candidates[candidates != n]
+
+    def similar(self, product_id, k=10):
+        """Return the k most similar products by Jaccard similarity"""
+        n = self.position(product_id)
+        if n is None:
+            return []
+        tokens = self.token_set(n)
+        results = []
+        for candidate in self.candidates(n):
+            other = self.token_set(candidate)
+            shared = len(np.intersect1d(tokens, other, assume_unique=True))
+            union = len(tokens) + len(other) - shared
+            results.append((shared / union if union else 0.0, int(candidate)))
+        results.sort(key=lambda r: (-r[0], r[1]))
+        products = self.index["products"]
+        return [
+            OrderedDict([("product_id", int(products[c])), ("similarity", s)])
+            for s, c in results[:k]
+        ]
+
+
+_files = {}
+
+
+def get_similar_products():
+    """Return the similar product index, or None when it has not been built"""
+    path = get_path()
+    index = _files.setdefault(path, MappedFile(path)).get()
+    return None if index is None else SimilarProducts(index)
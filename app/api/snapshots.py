@@ -0,0 +1,269 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.utils.encoders import JSONEncoder
+
+from app.api import views
+
+RESOURCES = OrderedDict(
+    [
+        ("pucs", views.PUCViewSet),
+        ("products", views.ProductViewSet),
+        ("documents", views.DocumentViewSet),
+        ("chemicals", views.ChemicalViewSet),
+        ("chemicalpresences", views.ChemicalPresenceViewSet),
+    ]
+)
+
+CHUNK_SIZE = 500
+
+
+def get_queryset(resource):
+    """Return the queryset of a resource ordered by primary key"""
+    return RESOURCES[resource].queryset.all().order_by("pk")
+
+
+def get_partitions(queryset, size):
+    """Split a queryset into primary key ranges of at most `size` rows
+
+    Returns a list of inclusive (low, high) primary key pairs.
+    """
+    pks = list(queryset.prefetch_related(None).values_list("pk", flat=True))
+    return [
+        (pks[i], pks[min(i + size, len(pks)) - 1]) for i in range(0, len(pks), size)
+    ]
+
+
+def iter_rows(resource, queryset):
+    """Yield the serialized rows of a queryset in primary key order
+
+    The queryset is read in keyset chunks so that prefetches stay bounded.
+    """
+    serializer_class = RESOURCES[resource].serializer_class
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        objects = list(chunk[:CHUNK_SIZE])
+        if not objects:
+            return
+        for row in serializer_class(objects, many=True).data:
+            yield row
+        last = objects[-1].pk
+
+
+def encode_json(row):
+    return json.dumps(row, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_cell(value):
+    if isinstance(value, (list, dict)):
+        return encode_json(value)
+    return value
+
+
+def get_columns(resource):
+    return list(RESOURCES[resource].serializer_class().fields)
+
+
+def write_partition(resource, low, high, directory, number, pks=None):
+    """Serialize one primary key range into gzipped NDJSON and CSV parts
+
+    Only the objects with primary keys `pks` are written if given. The CSV
+    part has no header row so that the parts can be concatenated.
+    """
+    queryset = get_queryset(resource).filter(pk__gte=low, pk__lte=high)
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    columns = get_columns(resource)
+    base = os.path.join(directory, "%s.%05d" % (resource, number))
+    rows = 0
+    with gzip.open(base + ".ndjson.gz", "wt", encoding="utf-8") as ndjson, gzip.open(
+        base + ".csv.gz", "wt", encoding="utf-8", newline=""
+    ) as text:
+        writer = csv.writer(text)
+        for row in iter_rows(resource, queryset):
+            ndjson.write(encode_json(row) + "\n")
+            writer.writerow([encode_cell(row[c]) for c in columns])
+            rows += 1
+    return {"rows": rows, "ndjson": base + ".ndjson.gz", "csv": base + ".csv.gz"}
+
+
+def write_partitions(tasks, workers=None):
+    """Run `write_partition` for every task, in a process pool unless
+    `workers` is 0, and return the results in order"""
+    if workers == 0:
+        return [write_partition(*task) for task in tasks]
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_partition, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def concatenate(paths, destination, header=b""):
+    """Concatenate gzip members into one file and return its file entry
+
+    A sequence of gzip members is itself a valid gzip file, so the parts
+    never need to be decompressed.
+    """
+    digest = hashlib.sha256()
+    with open(destination, "wb") as out:
+        if header:
+            member = gzip.compress(header)
+            digest.update(member)
+            out.write(member)
+        for path in paths:
+            with open(path, "rb") as part:
+                for block in iter(lambda: part.read(1 << 20), b""):
+                    digest.update(block)
+                    out.write(block)
+            os.remove(path)
+    return OrderedDict(
+        [
+            ("name", os.path.basename(destination)),
+            ("bytes", os.path.getsize(destination)),
+            ("sha256", digest.hexdigest()),
+        ]
+    )
+
+
+def csv_header(resource):
+    text = io.StringIO()
+    csv.writer(text).writerow(get_columns(resource))
+    return text.getvalue().encode("utf-8")
+
+
+def assemble_resource(resource, directory, parts):
+    """Concatenate the partition files of a resource and describe the result"""
+    ndjson = concatenate(
+        [p["ndjson"] for p in parts], os.path.join(directory, resource + ".ndjson.gz")
+    )
+    csv_file = concatenate(
+        [p["csv"] for p in parts],
+        os.path.join(directory, resource + ".csv.gz"),
+        header=csv_header(resource),
+    )
+    return OrderedDict(
+        [
+            ("rows", sum(p["rows"] for p in parts)),
+            ("partitions", len(parts)),
+            ("files", OrderedDict([("ndjson", ndjson), ("csv", csv_file)])),
+        ]
+    )
+
+
+def build_snapshot(version, root=None, workers=None, partition_size=None):
+    """Build and atomically publish the snapshot for a data version
+
+    Every resource is split into primary key partitions which are built
+    in a process pool (or in this process when `workers` is 0). The
+    snapshot is written to a staging directory which is renamed into place
+    once complete, after which the `latest` link is swapped to it.
+    Returns the manifest.
+    """
+    root = root or settings.SNAPSHOT_ROOT
+    partition_size = partition_size or settings.SNAPSHOT_PARTITION_SIZE
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, ".build-%s-%d" % (version, os.getpid()))
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    tasks = OrderedDict(
+        (
+            name,
+            [
+                (name, low, high, staging, n)
+                for n, (low, high) in enumerate(
+                    get_partitions(get_queryset(name), partition_size)
+                )
+            ],
+        )
+        for name in RESOURCES
+    )
+    try:
+        results = iter(
+            write_partitions([t for args in tasks.values() for t in args], workers)
+        )
+        parts = {name: [next(results) for _ in args] for name, args in tasks.items()}
+        resources = OrderedDict(
+            (name, assemble_resource(name, staging, parts[name])) for name in tasks
+        )
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    manifest = OrderedDict(
+        [
+            ("version", version),
+            ("created", datetime.utcnow().isoformat(timespec="seconds") + "Z"),
+            ("resources", resources),
+        ]
+    )
+    with open(os.path.join(staging, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    publish(root, staging, version)
+    return manifest
+
+
+def publish(root, staging, version):
+    """Move a staged snapshot into place and point `latest` at it
+
+    A snapshot rebuilt for a published version is moved to a new directory,
+    e.g. `<version>-1`, and the previous build is only removed once
+    `latest` points to the new one, so that `latest` never points to a
+    missing directory.
+    """
+    name, n = version, 0
+    while os.path.lexists(os.path.join(root, name)):
+        n += 1
+        name = "%s-%d" % (version, n)
+    os.rename(staging, os.path.join(root, name))
+    link = os.path.join(root, ".latest-%d" % os.getpid())
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(name, link)
+    os.replace(link, os.path.join(root, "latest"))
+    previous = re.compile(r"^%s(-\d+)?$" % re.escape(version))
+    for other in os.listdir(root):
+        if other != name and previous.match(other):
+            shutil.rmtree(os.path.join(root, other), ignore_errors=True)
+
+
+def get_published_version(root=None):
+    """Return the data version of the latest published snapshot, if any"""
+    path = os.path.join(root or settings.SNAPSHOT_ROOT, "latest", "manifest.json")
+    try:
+        with open(path) as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def prune(root=None, keep=None):
+    """Remove all but the `keep` most recent snapshots"""
+    root = root or settings.SNAPSHOT_ROOT
+    keep = settings.SNAPSHOT_KEEP if keep is None else keep
+    latest = os.path.realpath(os.path.join(root, "latest"))
+    snapshots = [
+        os.path.join(root, name)
+        for name in os.listdir(root)
+        if not name.startswith(".") and name != "latest"
+    ]
+    snapshots = [
+        p for p in snapshots if os.path.isdir(p) and os.path.realpath(p) != latest
+    ]
+    snapshots.sort(key=os.path.getmtime, reverse=True)
+    removed = []
+    for path in snapshots[max(keep - 1, 0) :]:
+        shutil.rmtree(path)
+        removed.append(os.path.basename(path))
+    return removed
@@ -0,0 +1,199 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import AutoField, Count
+
+from app.api import lookups
+from app.api import models as api_models
+from app.core.dataversion import compute_data_version
+from dashboard import models
+
+
+class Summary:
+    """A summary table filled from the Factotum tables
+
+    `key` names the fields identifying a row, `sources` the models whose
+    data version decides whether the summary needs refreshing. Subclasses
+    define `get_rows()`, yielding the rows of the summary as dictionaries of
+    field values.
+    """
+
+    name = None
+    model = None
+    key = ()
+    sources = ()
+
+
+class PUCSummary(Summary):
+    name = "pucs"
+    model = api_models.PUCSummary
+    key = ("puc_id",)
+    sources = (
+        "dashboard.PUC",
+        "dashboard.ProductToPUC",
+        "dashboard.ProductDocument",
+        "dashboard.RawChem",
+    )
+
+    def get_rows(self):
+        rows = (
+            models.PUC.objects.order_by()
+            .values("id", "gen_cat", "prod_fam", "prod_type", "kind")
+            .annotate(
+                product_count=Count("products", distinct=True),
+                document_count=Count("products__documents", distinct=True),
+                chemical_count=Count(
+                    "products__documents__extractedtext__rawchem__dsstox", distinct=True
+                ),
+            )
+        )
+        for row in rows.iterator():
+            yield {
+                "puc_id": row["id"],
+                "level_1_category": row["gen_cat"] or "",
+                "level_2_category": row["prod_fam"] or "",
+                "level_3_category": row["prod_type"] or "",
+                "kind": row["kind"] or "",
+                "product_count": row["product_count"],
+                "document_count": row["document_count"],
+                "chemical_count": row["chemical_count"],
+            }
+
+
+class ProductSummary(Summary):
+    name = "products"
+    model = api_models.ProductSummary
+    key = ("puc_id", "manufacturer", "brand")
+    sources = ("dashboard.Product", "dashboard.ProductToPUC")
+
+    def get_rows(self):
+        """Count every product once, under its uber PUC like /products/"""
+        counts = Counter()
+        for product in lookups.iter_products():
+            puc = product.uber_puc
+            # Values are truncated to the column size, which may merge groups
+            key = (
+                None if puc is None else puc.id,
+                (product.manufacturer or "")[:255],
+                (product.brand_name or "")[:255],
+            )
+            counts[key] += 1
+        for (puc_id, manufacturer, brand), count in counts.items():
+            yield {
+                "puc_id": puc_id,
+                "manufacturer": manufacturer,
+                "brand": brand,
+                "product_count": count,
+            }
+
+
+class DocumentSummary(Summary):
+    name = "documents"
+    model = api_models.DocumentSummary
+    key = ("data_type", "document_type")
+    sources = (
+        "dashboard.DataDocument",
+        "dashboard.DataGroup",
+        "dashboard.GroupType",
+        "dashboard.DocumentType",
+        "dashboard.ProductDocument",
+        "dashboard.RawChem",
+    )
+
+    def get_rows(self):
+        rows = (
+            models.DataDocument.objects.order_by()
+            .values("data_group__group_type__title", "document_type__title")
+            .annotate(
+                document_count=Count("id", distinct=True),
+                product_count=Count("products", distinct=True),
+                chemical_count=Count("extractedtext__rawchem__dsstox", distinct=True),
+            )
+        )
+        for row in rows.iterator():
+            yield {
+                "data_type": row["data_group__group_type__title"] or "",
+                "document_type": row["document_type__title"] or "",
+                "document_count": row["document_count"],
+                "product_count": row["product_count"],
+                "chemical_count": row["chemical_count"],
+            }
+
+
+class ChemicalSummary(Summary):
+    name = "chemicals"
+    model = api_models.ChemicalSummary
+    key = ("chemical_id",)
+    sources = (
+        "dashboard.DSSToxLookup",
+        "dashboard.RawChem",
+        "dashboard.ProductDocument",
+        "dashboard.ProductToPUC",
+    )
+
+    def get_rows(self):
+        path = "curated_chemical__extracted_text__data_document"
+        rows = (
+            models.DSSToxLookup.objects.exclude(curated_chemical__isnull=True)
+            .order_by()
+            .values("sid", "true_chemname", "true_cas")
+            .annotate(
+                document_count=Count(path, distinct=True),
+                product_count=Count(path + "__product", distinct=True),
+                puc_count=Count(path + "__product__puc", distinct=True),
+            )
+        )
+        for row in rows.iterator():
+            yield {
+                "chemical_id": row["sid"],
+                "name": (row["true_chemname"] or "")[:500],
+                "cas": row["true_cas"] or "",
+                "document_count": row["document_count"],
+                "product_count": row["product_count"],
+                "puc_count": row["puc_count"],
+            }
+
+
+SUMMARIES = [PUCSummary(), ProductSummary(), DocumentSummary(), ChemicalSummary()]
+
+
+def refresh(summary, force=False):
+    """Bring a summary table up to date with the Factotum tables
+
+    Nothing is done while the source data version is unchanged. Otherwise
+    the summary is recomputed and only the rows which were added, changed
+    or removed are written. Returns the (created, updated, deleted) row
+    counts, or None if the summary was already up to date.
+    """
+    version = compute_data_version(summary.sources)
+    state = api_models.RefreshState.objects.filter(name=summary.name).first()
+    if not force and state is not None and state.version == version:
+        return None
+    model = summary.model
+    fields = [
+        f.attname
+        for f in model._meta.concrete_fields
+        if not isinstance(f, AutoField) and f.attname not in summary.key
+    ]
+    existing = {
+        tuple(getattr(obj, k) for k in summary.key): obj for obj in model.objects.all()
+    }
+    created, updated = [], []
+    for row in summary.get_rows():
+        obj = existing.pop(tuple(row[k] for k in summary.key), None)
+        if obj is None:
+            created.append(model(**row))
+        elif any(getattr(obj, f) != row[f] for f in fields):
+            for f in fields:
+                setattr(obj, f, row[f])
+            updated.append(obj)
+    deleted = [obj.pk for obj in existing.values()]
+    with transaction.atomic():
+        for i in range(0, len(deleted), 1000):
+            model.objects.filter(pk__in=deleted[i : i + 1000]).delete()
+        model.objects.bulk_update(updated, fields, batch_size=1000)
+        model.objects.bulk_create(created, batch_size=1000)
+        api_models.RefreshState.objects.update_or_create(
+            name=summary.name, defaults={"version": version}
+        )
+    return len(created), len(updated), len(deleted)
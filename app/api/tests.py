@@ -1,12 +1,30 @@
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
 import uuid
+from unittest import mock
 
+from django.conf import settings
+from django.core.management import call_command
 from django.db import connection, reset_queries
 from django.test.utils import override_settings
 from drf_yasg.generators import EndpointEnumerator
+from rest_framework.test import APIRequestFactory, APITransactionTestCase
 
+from app.api import exports, jobs, lookups, search, tree
+from app.api import models as api_models
+from app.api import views
 from app.api.serializers import ExtractedChemicalSerializer
+from app.core import dataversion, db, fragments
 from app.core.test import TestCase
 
+from config import urls
 from dashboard import models
 
 
@@ -15,14 +33,34 @@ class TestQueryCount(TestCase):
     of data returned.
     """
 
+    # List endpoints returning every object at once, see test_unpaginated
+    unpaginated = ("/pucs/tree/", "/weightfractions/")
+
+    def setUp(self):
+        call_command("refresh_summaries", stdout=io.StringIO())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(INDEX_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command("build_search_index", stdout=io.StringIO())
+        chemical = (
+            models.DSSToxLookup.objects.exclude(curated_chemical__isnull=True)
+            .exclude(true_chemname="")
+            .first()
+        )
+        # Parameters required by list endpoints
+        self.params = {"/search/": {"q": chemical.true_chemname.split()[0]}}
+
     @override_settings(DEBUG=True)
     def test_query_count(self):
         reset_queries()
-        for endpoint in EndpointEnumerator().get_api_endpoints():
-            url = endpoint[0]
+        for url, method, _ in EndpointEnumerator().get_api_endpoints():
             # Only hit list endpoints
             if "{" not in url and "}" not in url:
-                result = self.get(url)
+                if method != "GET" or url in self.unpaginated:
+                    continue
+                result = self.get(url, self.params.get(url))
                 max_queries = len(result["data"])
                 num_queries = len(connection.queries)
                 # Number of queries must be less than the number of data objects returned.
@@ -32,6 +70,72 @@ class TestQueryCount(TestCase):
                 )
                 reset_queries()
 
+    @override_settings(DEBUG=True)
+    def test_data_version(self):
+        """The data and derived versions cost one query per model, paid by the
+        request finding them expired once every DATA_VERSION_TTL"""
+        reset_queries()
+        version = dataversion.compute_data_version()
+        self.assertEqual(len(connection.queries), len(settings.DATA_VERSION_MODELS))
+        counts = []
+        for expires in (float("inf"), float("inf"), 0.0):
+            state = {"version": version, "expires": expires}
+            with mock.patch.dict(dataversion._current, state):
+                reset_queries()
+                self.get("/products/")
+                counts.append(len(connection.queries))
+        # the first request fills the caches of the version
+        self.assertEqual(
+            len(settings.DATA_VERSION_MODELS) + len(settings.DERIVED_VERSION_MODELS),
+            counts[2] - counts[1],
+        )
+
+    @override_settings(DEBUG=True)
+    def test_unpaginated(self):
+        """The unpaginated endpoints aggregate in a fixed number of queries,
+        once per data version"""
+        version = {"version": uuid.uuid4().hex, "expires": float("inf")}
+        with mock.patch.dict(dataversion._current, version):
+            for url, max_queries in (
+                ("/pucs/tree/", len(tree.LEVELS) + 1),
+                ("/weightfractions/", 3),
+            ):
+                reset_queries()
+                self.assertIsInstance(self.get(url), list)
+                self.assertLessEqual(len(connection.queries), max_queries, url)
+                reset_queries()
+                self.get(url)
+                self.assertEqual(len(connection.queries), 0, url)
+
+
+class TestConcurrentQueries(APITransactionTestCase):
+    """The count and prefetch queries of a page run on the pool threads, which
+    only see committed data, so not in a TestCase"""
+
+    fixtures = ["dashboard"]
+
+    def test_count_and_slice(self):
+        queryset = views.DocumentViewSet.queryset
+        self.assertFalse(db.queries.is_sequential())
+        threads = set()
+        task = db.queries.task
+
+        def record(*args):
+            threads.add(threading.get_ident())
+            return task(*args)
+
+        with mock.patch.object(db.queries, "task", record):
+            count, objects = db.count_and_slice(queryset, 0, 10)
+        self.assertTrue(threads - {threading.get_ident()})
+        self.assertEqual(queryset.count(), count)
+        expected = list(queryset[:10])
+        self.assertEqual([d.pk for d in expected], [d.pk for d in objects])
+        for document, other in zip(objects, expected):
+            self.assertEqual(
+                [link.product_id for link in other.product_links],
+                [link.product_id for link in document.product_links],
+            )
+
 
 class TestPUC(TestCase):
     dtxsid = "DTXSID6026296"
@@ -84,6 +188,40 @@ class TestPUC(TestCase):
         self.assertEqual(len(response["data"]), 2)
 
 
+class TestPUCTree(TestCase):
+    dtxsid = "DTXSID6026296"
+
+    def flatten(self, nodes):
+        for node in nodes:
+            yield node
+            yield from self.flatten(node["children"])
+
+    def test_tree(self):
+        response = self.get("/pucs/tree/")
+        nodes = {node["id"]: node for node in self.flatten(response) if node["id"]}
+        self.assertEqual(models.PUC.objects.count(), len(nodes))
+        puc = models.PUC.objects.exclude(prod_type="").first()
+        node = nodes[puc.id]
+        self.assertEqual(3, node["level"])
+        self.assertEqual(puc.prod_type, node["name"])
+        self.assertEqual(puc.products.distinct().count(), node["product_count"])
+
+    def test_chemical(self):
+        response = self.get("/pucs/tree/", {"chemical": self.dtxsid})
+        self.assertTrue(len(response) > 0)
+        for node in self.flatten(response):
+            self.assertEqual(1, node["chemical_count"])
+            self.assertTrue(node["product_count"] > 0)
+
+    def test_unknown(self):
+        with mock.patch.object(tree, "build_tree", wraps=tree.build_tree) as build:
+            self.assertEqual(self.get("/pucs/tree/", {"chemical": "DTXSID0"}), [])
+            self.assertEqual(self.get("/pucs/tree/", {"kind": "spam"}), [])
+        # only the complete hierarchy is built, to validate the kind
+        for call in build.call_args_list:
+            self.assertEqual(call, mock.call(None, None))
+
+
 class TestProduct(TestCase):
     dtxsid = "DTXSID6026296"
     upc = "stub_1872"
@@ -158,6 +296,159 @@ class TestChemical(TestCase):
         self.assertEqual(count, response["meta"]["count"])
 
 
+class TestSearch(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(INDEX_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command("build_search_index", stdout=io.StringIO())
+        self.chem = (
+            models.DSSToxLookup.objects.exclude(curated_chemical__isnull=True)
+            .exclude(true_chemname="")
+            .first()
+        )
+
+    def test_search(self):
+        word = self.chem.true_chemname.split()[0]
+        response = self.get("/search/", {"q": word, "type": "chemical"})
+        self.assertTrue("paging" in response)
+        ids = [hit["id"] for hit in response["data"]]
+        self.assertTrue(self.chem.sid in ids)
+        for hit in response["data"]:
+            self.assertEqual(hit["type"], "chemical")
+        # results are ranked
+        scores = [hit["score"] for hit in response["data"]]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_prefix(self):
+        name = self.chem.true_chemname
+        response = self.get(
+            "/search/", {"q": name[:-1], "mode": "prefix", "type": "chemical"}
+        )
+        self.assertTrue(self.chem.sid in [hit["id"] for hit in response["data"]])
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get("/search/").status_code, 400)
+        response = self.client.get("/search/", {"q": "a", "type": "spam"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_filter(self):
+        response = self.get("/chemicals/", {"q": self.chem.true_cas})
+        self.assertTrue(self.chem.sid in [c["id"] for c in response["data"]])
+
+    def test_too_many_matches(self):
+        with self.settings(SEARCH_FILTER_MAX_MATCHES=0):
+            response = self.client.get("/chemicals/", {"q": self.chem.true_cas})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("q", response.data)
+
+    def test_not_built(self):
+        os.remove(search.get_path())
+        self.assertEqual(self.client.get("/search/", {"q": "a"}).status_code, 404)
+        response = self.client.get("/chemicals/", {"q": "a"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestStats(TestCase):
+    def setUp(self):
+        call_command("refresh_summaries", stdout=io.StringIO())
+
+    def test_refresh(self):
+        stdout = io.StringIO()
+        call_command("refresh_summaries", "pucs", stdout=stdout)
+        self.assertIn("pucs: up to date", stdout.getvalue())
+        stdout = io.StringIO()
+        call_command("refresh_summaries", "pucs", force=True, stdout=stdout)
+        self.assertIn("pucs: 0 created, 0 updated, 0 deleted", stdout.getvalue())
+
+    def test_pucs(self):
+        response = self.get("/stats/pucs/")
+        self.assertEqual(models.PUC.objects.count(), response["meta"]["count"])
+        row = response["data"][0]
+        puc = models.PUC.objects.get(id=row["puc_id"])
+        self.assertEqual(puc.gen_cat, row["level_1_category"])
+        self.assertEqual(puc.products.distinct().count(), row["product_count"])
+        # products shared by PUCs would be counted once per PUC
+        response = self.client.get("/stats/pucs/", {"group_by": "kind"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_products(self):
+        # every product is counted once, under its uber PUC
+        self.assertEqual(
+            models.Product.objects.count(),
+            sum(
+                api_models.ProductSummary.objects.values_list(
+                    "product_count", flat=True
+                )
+            ),
+        )
+        response = self.get("/stats/products/", {"group_by": "puc_id"})
+        self.assertEqual({"puc_id", "product_count"}, set(response["data"][0]))
+
+    def test_documents(self):
+        response = self.get("/stats/documents/", {"group_by": "data_type"})
+        self.assertEqual(
+            models.DataDocument.objects.count(),
+            sum(r["document_count"] for r in response["data"]),
+        )
+        self.assertEqual({"data_type", "document_count"}, set(response["data"][0]))
+
+    def test_chemicals(self):
+        response = self.get("/stats/chemicals/")
+        counts = [r["product_count"] for r in response["data"]]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        response = self.get("/stats/chemicals/", {"ordering": "chemical_id"})
+        ids = [r["chemical_id"] for r in response["data"]]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_invalid(self):
+        response = self.client.get("/stats/pucs/", {"group_by": "spam"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/stats/chemicals/", {"ordering": "spam"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestWeightFractions(TestCase):
+    def test_chemical(self):
+        chemical = models.ExtractedChemical.objects.filter(
+            dsstox__isnull=False, central_wf_analysis__isnull=False
+        ).first()
+        sid = chemical.dsstox.sid
+        values = models.ExtractedChemical.objects.filter(
+            dsstox__sid=sid, central_wf_analysis__isnull=False
+        ).values_list("central_wf_analysis", flat=True)
+        response = self.get("/weightfractions/", {"chemical": sid})
+        self.assertEqual(1, len(response))
+        stats = response[0]["central_weight_fraction"]
+        self.assertEqual(len(values), stats["count"])
+        self.assertAlmostEqual(float(min(values)), stats["min"])
+        self.assertAlmostEqual(float(max(values)), stats["max"])
+        self.assertEqual(stats["count"], sum(stats["histogram"]["counts"]))
+        response = self.get(
+            "/weightfractions/", {"chemical": sid, "min_wf": stats["max"], "bins": 2}
+        )
+        stats = response[0]["central_weight_fraction"]
+        self.assertEqual(2, len(stats["histogram"]["counts"]))
+        self.assertTrue(all(v == stats["max"] for v in stats["percentiles"].values()))
+
+    def test_group_by(self):
+        total = self.get("/weightfractions/")[0]["count"]
+        response = self.get("/weightfractions/", {"group_by": "component"})
+        self.assertEqual(total, sum(r["count"] for r in response))
+        self.assertIn("component", response[0])
+        response = self.get("/weightfractions/", {"group_by": "puc"})
+        puc = response[0]["puc"]
+        count = self.get("/weightfractions/", {"puc": puc})[0]["count"]
+        self.assertEqual(response[0]["count"], count)
+
+    def test_invalid(self):
+        for params in ({"min_wf": "2"}, {"bins": "0"}, {"group_by": "spam"}):
+            response = self.client.get("/weightfractions/", params)
+            self.assertEqual(response.status_code, 400)
+
+
 class TestChemicalPresence(TestCase):
     qs = models.ExtractedListPresenceTag.objects.all()
 
@@ -195,6 +486,17 @@ class TestDocument(TestCase):
             doc.chemicals.filter(dsstox__isnull=False).count(),
             len(response["chemicals"]),
         )
+        self.assertEqual(
+            sorted(set(p.id for p in doc.products.all())), response["products"]
+        )
+
+    def test_compare_plans(self):
+        stdout = io.StringIO()
+        call_command("compare_document_plans", pages=1, page_size=10, stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(["legacy", "lean"], [line.split()[0] for line in lines[1:]])
+        # both plans serialize the same documents
+        self.assertEqual(lines[1].split()[-1], lines[2].split()[-1])
 
     def test_list(self):
         # test without filter
@@ -205,6 +507,439 @@ class TestDocument(TestCase):
         self.assertEqual(count, response["meta"]["count"])
 
 
+class TestColumnar(TestCase):
+    def test_documents(self):
+        rows = self.get("/documents/", {"page_size": 20})["data"]
+        response = self.client.get(
+            "/documents/", {"page_size": 20, "format": "columnar"}
+        )
+        columns = json.loads(response.content.decode())["data"]
+        self.assertEqual([r["id"] for r in rows], columns["id"])
+        self.assertEqual([r["products"] for r in rows], columns["products"])
+        chemicals = columns["chemicals"]
+        self.assertEqual(
+            [len(r["chemicals"]) for r in rows],
+            [b - a for a, b in zip(chemicals["offsets"], chemicals["offsets"][1:])],
+        )
+        self.assertEqual(
+            [c["chemical_id"] for r in rows for c in r["chemicals"]],
+            chemicals["chemical_id"],
+        )
+
+    def test_page_size(self):
+        response = self.client.get(
+            "/products/", {"page_size": 1000, "format": "columnar"}
+        )
+        data = json.loads(response.content.decode())
+        self.assertEqual(
+            min(1000, models.Product.objects.count()), len(data["data"]["id"])
+        )
+
+
+class TestFragments(TestCase):
+    def test_documents(self):
+        fragments.cache.clear()
+        first = self.client.get("/documents/", {"page_size": 20}).content
+        hits = fragments.cache.hits
+        second = self.client.get("/documents/", {"page_size": 20}).content
+        self.assertEqual(first, second)
+        data = json.loads(first.decode())["data"]
+        self.assertEqual(hits + len(data), fragments.cache.hits)
+        document = data[0]
+        # detail responses share the fragments of list responses
+        response = self.client.get("/documents/%d/" % document["id"])
+        self.assertEqual(document, json.loads(response.content.decode()))
+        self.assertEqual(hits + len(data) + 1, fragments.cache.hits)
+        response = self.client.get("/documents/0/")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestStreaming(TestCase):
+    def test_documents(self):
+        params = {"page_size": 20, "page": 2}
+        expected = json.loads(self.client.get("/documents/", params).content.decode())
+        response = self.client.get("/documents/", dict(params, stream="true"))
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(expected, json.loads(content))
+
+    def test_page_size(self):
+        response = self.client.get("/products/", {"page_size": 1000, "stream": "1"})
+        data = json.loads(b"".join(response.streaming_content).decode())
+        self.assertEqual(min(1000, models.Product.objects.count()), len(data["data"]))
+
+
+class TestSimilarProducts(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(INDEX_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def get_compositions(self):
+        rows = models.Product.objects.filter(
+            documents__extractedtext__rawchem__dsstox__isnull=False
+        ).values_list("id", "documents__extractedtext__rawchem__dsstox_id")
+        compositions = {}
+        for product, chemical in rows:
+            compositions.setdefault(product, set()).add(chemical)
+        return compositions
+
+    def test_similar(self):
+        response = self.client.get("/products/1/similar/")
+        self.assertEqual(response.status_code, 404)
+        call_command("build_similarity_index", stdout=io.StringIO())
+        compositions = self.get_compositions()
+        product = max(compositions, key=lambda p: len(compositions[p]))
+        results = self.get("/products/%d/similar/" % product, {"k": 5})
+        self.assertLessEqual(len(results), 5)
+        mine = compositions[product]
+        for result in results:
+            other = compositions[result["product_id"]]
+            self.assertAlmostEqual(
+                len(mine & other) / len(mine | other), result["similarity"]
+            )
+        self.assertEqual(
+            [r["similarity"] for r in results],
+            sorted((r["similarity"] for r in results), reverse=True),
+        )
+        # an identical composition is always found
+        twins = [p for p in compositions if p != product and compositions[p] == mine]
+        if twins:
+            self.assertEqual(results[0]["similarity"], 1.0)
+        response = self.client.get("/products/%d/similar/" % product, {"k": 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/products/abc/similar/")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestChemicalCooccurrence(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(INDEX_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def get_compositions(self):
+        rows = models.Product.objects.filter(
+            documents__extractedtext__rawchem__dsstox__isnull=False
+        ).values_list("id", "documents__extractedtext__rawchem__dsstox__sid")
+        compositions = {}
+        for product, sid in rows:
+            compositions.setdefault(product, set()).add(sid)
+        return compositions
+
+    def test_cooccurring(self):
+        compositions = self.get_compositions()
+        product = max(compositions, key=lambda p: len(compositions[p]))
+        sid, other = sorted(compositions[product])[:2]
+        url = "/chemicals/%s/cooccurring/" % sid
+        self.assertEqual(self.client.get(url).status_code, 404)
+        call_command("build_cooccurrence_matrix", stdout=io.StringIO())
+        expected = {}
+        for chemicals in compositions.values():
+            if sid in chemicals:
+                for chemical in chemicals - {sid}:
+                    expected[chemical] = expected.get(chemical, 0) + 1
+        results = self.get(url, {"page_size": 500})["data"]
+        self.assertEqual({r["chemical_id"]: r["count"] for r in results}, expected)
+        self.assertEqual(
+            [r["count"] for r in results], sorted(expected.values(), reverse=True)
+        )
+        response = self.get(url + other + "/")
+        self.assertEqual(response["count"], expected[other])
+        self.assertEqual(
+            response["chemical_count"],
+            sum(sid in chemicals for chemicals in compositions.values()),
+        )
+        pucs = {}
+        rows = models.Product.objects.filter(
+            puc__isnull=False, documents__extractedtext__rawchem__dsstox__isnull=False
+        ).values_list("puc", "documents__extractedtext__rawchem__dsstox__sid")
+        for puc, chemical in rows:
+            pucs.setdefault(puc, set()).add(chemical)
+        response = self.get(url + other + "/", {"level": "puc"})
+        self.assertEqual(
+            response["count"],
+            sum(sid in chemicals and other in chemicals for chemicals in pucs.values()),
+        )
+        response = self.client.get(url, {"level": "brand"})
+        self.assertEqual(response.status_code, 400)
+        # unknown chemicals are not found, like unknown products of /similar/
+        for unknown in ("/chemicals/spam/cooccurring/", url + "spam/"):
+            self.assertEqual(self.client.get(unknown).status_code, 404)
+
+
+class TestLookups(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(INDEX_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch.dict(
+            dataversion._current, {"version": None, "expires": 0.0}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def serialize(self, viewset, queryset):
+        objects = list(queryset.order_by("pk")[:50])
+        return viewset.serializer_class(objects, many=True).data
+
+    def test_lookups(self):
+        viewsets = [views.ProductViewSet, views.DocumentViewSet]
+        expected = [self.serialize(v, v.queryset) for v in viewsets]
+        self.assertIsNone(lookups.get_lookups())
+        call_command("build_lookups", stdout=io.StringIO())
+        self.assertIsNotNone(lookups.get_lookups())
+        for viewset, rows in zip(viewsets, expected):
+            self.assertEqual(self.serialize(viewset, viewset.lookup_queryset), rows)
+        # the tables are resolved once per serializer, not per row and field
+        with mock.patch.object(
+            lookups, "get_lookups", wraps=lookups.get_lookups
+        ) as get_lookups:
+            self.serialize(views.DocumentViewSet, views.DocumentViewSet.lookup_queryset)
+        self.assertEqual(get_lookups.call_count, 1)
+        # objects created since the build are read from the database
+        tables = lookups.get_lookups()
+        with mock.patch.object(tables["products"], "position", return_value=None):
+            rows = self.serialize(
+                views.ProductViewSet, views.ProductViewSet.lookup_queryset
+            )
+            self.assertEqual(rows, expected[0])
+        sid = "DTXSID6026296"
+        count = models.Product.objects.filter(
+            documents__extractedtext__rawchem__dsstox__sid=sid
+        ).count()
+        response = self.get("/products/", {"chemical": sid})
+        self.assertEqual(response["meta"]["count"], count)
+        response = self.get("/products/", {"chemical": "DTXSID0"})
+        self.assertEqual(response["meta"]["count"], 0)
+        out = io.StringIO()
+        call_command("build_lookups", "--if-changed", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+        # the tables are ignored once the data changes
+        with mock.patch.object(lookups, "get_data_version", return_value="new"):
+            self.assertIsNone(lookups.get_lookups())
+
+
+class TestExports(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(EXPORT_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_get_pks(self):
+        # one query per chunk of values, rather than per value
+        sids = list(models.DSSToxLookup.objects.values_list("sid", flat=True))
+        sids = sids[: exports.FILTER_CHUNK_SIZE] + ["DTXSID0"]
+        expected = set(
+            models.DataDocument.objects.filter(
+                extractedtext__rawchem__dsstox__sid__in=sids
+            ).values_list("pk", flat=True)
+        )
+        with self.assertNumQueries(math.ceil(len(sids) / exports.FILTER_CHUNK_SIZE)):
+            pks = exports.get_pks("documents", {"chemical": sids})
+        self.assertEqual(pks, sorted(expected))
+        upcs = list(models.Product.objects.values_list("upc", flat=True)[:3])
+        expected = models.Product.objects.filter(upc__in=upcs).values_list("pk")
+        pks = exports.get_pks("products", {"upc": upcs})
+        self.assertEqual(pks, sorted(pk for pk, in expected))
+
+    def test_export(self):
+        sids = ["DTXSID6026296", "DTXSID2021781"]
+        spec = {"resource": "documents", "filters": {"chemical": sids}}
+        response = self.client.post("/exports/", spec, format="json")
+        self.assertEqual(response.status_code, 202)
+        job = response.data
+        self.assertEqual(job["status"], "queued")
+        # identical specifications share a job
+        spec["filters"]["chemical"] = sids[::-1]
+        response = self.client.post("/exports/", spec, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["id"], job["id"])
+        call_command(
+            "run_export_jobs", "--once", "--workers", "0", stdout=io.StringIO()
+        )
+        job = self.get("/exports/%s/" % job["id"])
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["data_version"], dataversion.compute_data_version())
+        expected = set(
+            models.DataDocument.objects.filter(
+                extractedtext__rawchem__dsstox__sid__in=sids
+            ).values_list("pk", flat=True)
+        )
+        self.assertEqual(job["rows"], len(expected))
+        response = self.client.get(job["files"]["ndjson"])
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual({row["id"] for row in rows}, expected)
+        self.assertEqual(rows[0], self.get("/documents/%d/" % rows[0]["id"]))
+        response = self.client.get(job["files"]["csv"])
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), len(expected) + 1)
+        # results are removed by disk quota
+        self.assertEqual(jobs.expire(0), [job["id"]])
+        response = self.client.get("/exports/%s/" % job["id"])
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid(self):
+        for spec in [
+            {"resource": "documents", "filters": {"puc": ["1"]}},
+            {"resource": "chemicals", "filters": {"puc": ["one"]}},
+            {"resource": "sids", "filters": {}},
+        ]:
+            response = self.client.post("/exports/", spec, format="json")
+            self.assertEqual(response.status_code, 400)
+
+
+class TestPresenceTags(TestCase):
+    def get_links(self):
+        return set(
+            models.ExtractedListPresenceToTag.objects.filter(
+                content_object__dsstox__isnull=False
+            ).values_list("content_object__dsstox__sid", "tag_id")
+        )
+
+    def get_all(self, url, params):
+        params = dict(params, page_size=500)
+        return self.get(url, params)["data"]
+
+    def test_chemicals(self):
+        links = self.get_links()
+        a, b = sorted({tag for _, tag in links})[:2]
+        with_a = {sid for sid, tag in links if tag == a}
+        with_b = {sid for sid, tag in links if tag == b}
+        for q, expected in [
+            ("%d" % a, with_a),
+            ("%d and %d" % (a, b), with_a & with_b),
+            ("%d or %d" % (a, b), with_a | with_b),
+            ("%d and not %d" % (a, b), with_a - with_b),
+            ("not (%d or %d)" % (a, b), {s for s, _ in links} - with_a - with_b),
+        ]:
+            rows = self.get_all("/chemicalpresences/chemicals/", {"q": q})
+            self.assertEqual(expected, {row["chemical_id"] for row in rows}, q)
+        rows = self.get_all("/chemicalpresences/chemicals/", {})
+        self.assertEqual(
+            links, {(row["chemical_id"], tag) for row in rows for tag in row["tags"]}
+        )
+        response = self.client.get("/chemicalpresences/chemicals/", {"q": "1 and"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cooccurrence(self):
+        links = self.get_links()
+        a = min(tag for _, tag in links)
+        with_a = {sid for sid, tag in links if tag == a}
+        rows = self.get_all("/chemicalpresences/cooccurrence/", {"q": str(a)})
+        counts = {row["id"]: row["count"] for row in rows}
+        self.assertEqual(counts[a], len(with_a))
+        for tag, count in counts.items():
+            self.assertEqual(
+                count, len({s for s, t in links if t == tag and s in with_a})
+            )
+        self.assertEqual(
+            [row["count"] for row in rows],
+            sorted((row["count"] for row in rows), reverse=True),
+        )
+
+
+class TestReadModels(TestCase):
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        call_command("refresh_read_models", stdout=io.StringIO())
+
+    def get_records(self, viewset, url, params=None, action="list", **kwargs):
+        view = viewset.as_view({"get": action})
+        response = view(self.factory.get(url, params), **kwargs)
+        response.render()
+        return json.loads(response.content.decode())
+
+    def by_id(self, rows):
+        return {row["id"]: row for row in rows}
+
+    def test_refresh(self):
+        stdout = io.StringIO()
+        call_command("refresh_read_models", "puc_records", stdout=stdout)
+        self.assertIn("puc_records: up to date", stdout.getvalue())
+
+    def test_list(self):
+        for prefix, _, viewset, record_viewset in urls.resources:
+            url = "/%s/" % prefix
+            expected = json.loads(self.client.get(url).content.decode())
+            records = self.get_records(record_viewset, url)
+            self.assertEqual(expected["meta"], records["meta"])
+            expected = self.by_id(
+                json.loads(self.client.get(url, {"page_size": 500}).content.decode())[
+                    "data"
+                ]
+            )
+            records = self.by_id(
+                self.get_records(record_viewset, url, {"page_size": 500})["data"]
+            )
+            self.assertEqual(expected, records)
+
+    def test_retrieve(self):
+        chemical = models.DSSToxLookup.objects.exclude(
+            curated_chemical__isnull=True
+        ).first()
+        url = "/chemicals/%s/" % chemical.sid
+        record = self.get_records(
+            views.ChemicalRecordViewSet, url, action="retrieve", id=chemical.sid
+        )
+        self.assertEqual(self.get(url), record)
+
+    def test_streaming(self):
+        url = "/products/"
+        params = {"page_size": 30, "page": 2}
+        expected = self.get_records(views.ProductRecordViewSet, url, params)
+        view = views.ProductRecordViewSet.as_view({"get": "list"})
+        response = view(self.factory.get(url, dict(params, stream="true")))
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(expected, json.loads(content))
+
+    def test_filters(self):
+        for prefix, record_viewset, params in [
+            ("products", views.ProductRecordViewSet, {"chemical": "DTXSID6026296"}),
+            ("pucs", views.PUCRecordViewSet, {"chemical": "DTXSID6026296"}),
+            ("chemicals", views.ChemicalRecordViewSet, {"puc": "1"}),
+            ("chemicals", views.ChemicalRecordViewSet, {"q": "benzyl"}),
+            ("documents", views.DocumentRecordViewSet, {"chemical": "DTXSID6026296"}),
+        ]:
+            url = "/%s/" % prefix
+            params = dict(params, page_size=500)
+            expected = self.by_id(self.get(url, params)["data"])
+            records = self.get_records(record_viewset, url, params)["data"]
+            self.assertEqual(set(expected), set(self.by_id(records)))
+
+
+class TestEdgeExport(TestCase):
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "edge.sqlite3")
+            call_command("export_sqlite", path, stdout=io.StringIO())
+            db = sqlite3.connect("file:%s?mode=ro&immutable=1" % path, uri=True)
+            for model in (api_models.DocumentRecord, api_models.PUCSummary):
+                sql = "SELECT COUNT(*) FROM %s" % model._meta.db_table
+                self.assertEqual(model.objects.count(), db.execute(sql).fetchone()[0])
+                self.assertGreater(model.objects.count(), 0)
+            with self.assertRaises(sqlite3.OperationalError):
+                db.execute("DELETE FROM api_pucrecord")
+            db.close()
+
+    def test_not_served(self):
+        # Services reading the Factotum tables answer 404 on edge nodes
+        with self.settings(EDGE_DATABASE="edge.sqlite3"):
+            for url in ("/pucs/tree/", "/weightfractions/", "/exports/spam/"):
+                self.assertEqual(self.client.get(url).status_code, 404, url)
+
+
 class TestExtractedChemicalSerializer(TestCase):
     def test_serialize(self):
         et = models.ExtractedText.objects.first()
@@ -244,3 +979,36 @@ class TestExtractedChemicalSerializer(TestCase):
             extracted_chemical.ingredient_rank,
             serialized_extracted_chemical.data["ingredient_rank"],
         )
+
+
+class TestSnapshot(TestCase):
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as root:
+            call_command(
+                "build_snapshots",
+                root=root,
+                workers=0,
+                partition_size=50,
+                stdout=io.StringIO(),
+            )
+            with open(os.path.join(root, "latest", "manifest.json")) as f:
+                manifest = json.load(f)
+            pucs = manifest["resources"]["pucs"]
+            self.assertEqual(models.PUC.objects.count(), pucs["rows"])
+            path = os.path.join(root, "latest", pucs["files"]["ndjson"]["name"])
+            with gzip.open(path, "rt") as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual(pucs["rows"], len(rows))
+            self.assertEqual(self.get("/pucs/%d/" % rows[0]["id"]), rows[0])
+            # the snapshot is not rebuilt while the data is unchanged
+            stdout = io.StringIO()
+            call_command("build_snapshots", root=root, workers=0, stdout=stdout)
+            self.assertIn("up to date", stdout.getvalue())
+            # a forced rebuild is published next to the previous build,
+            # which is removed once `latest` points to the new one
+            call_command(
+                "build_snapshots", root=root, workers=0, force=True, stdout=stdout
+            )
+            version = manifest["version"]
+            self.assertEqual(os.readlink(os.path.join(root, "latest")), version + "-1")
+            self.assertFalse(os.path.exists(os.path.join(root, version)))
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from app.api import lookups
+from app.core.dataversion import versioned_key
+from dashboard import models
+
+LEVELS = (("gen_cat",), ("gen_cat", "prod_fam"), ("gen_cat", "prod_fam", "prod_type"))
+
+
+def get_counts(queryset):
+    """Count the distinct products, documents and chemicals below every node
+
+    Returns a dictionary keyed by the category names of each node.
+    """
+    counts = {}
+    for fields in LEVELS:
+        rows = (
+            queryset.order_by()
+            .values(*fields)
+            .annotate(
+                product_count=Count("products", distinct=True),
+                document_count=Count("products__documents", distinct=True),
+                chemical_count=Count(
+                    "products__documents__extractedtext__rawchem__dsstox", distinct=True
+                ),
+            )
+        )
+        for row in rows:
+            counts[tuple(row[f] for f in fields)] = (
+                row["product_count"],
+                row["document_count"],
+                row["chemical_count"],
+            )
+    return counts
+
+
+def make_node(key, counts):
+    product_count, document_count, chemical_count = counts.get(key, (0, 0, 0))
+    return OrderedDict(
+        [
+            ("id", None),
+            ("name", key[-1]),
+            ("level", len(key)),
+            ("kind", None),
+            ("definition", None),
+            ("product_count", product_count),
+            ("document_count", document_count),
+            ("chemical_count", chemical_count),
+            ("children", []),
+        ]
+    )
+
+
+def build_tree(kind=None, chemical=None):
+    """Build the nested PUC hierarchy with the counts of every node
+
+    When filtered by chemical, only the nodes linked to the chemical are
+    included and their counts are restricted to it.
+    """
+    queryset = models.PUC.objects.all()
+    if kind:
+        queryset = queryset.filter(kind=kind)
+    if chemical:
+        queryset = queryset.filter(
+            products__documents__extractedtext__rawchem__dsstox__sid=chemical
+        )
+    counts = get_counts(queryset)
+    nodes = OrderedDict()
+    for puc in queryset.order_by("gen_cat", "prod_fam", "prod_type").distinct():
+        categories = (puc.gen_cat, puc.prod_fam, puc.prod_type)
+        key = categories[: next((i for i, c in enumerate(categories) if not c), 3)]
+        if not key:
+            continue
+        for depth in range(1, len(key) + 1):
+            if key[:depth] not in nodes:
+                node = nodes[key[:depth]] = make_node(key[:depth], counts)
+                if depth > 1:
+                    nodes[key[: depth - 1]]["children"].append(node)
+        node = nodes[key]
+        node["id"] = puc.id
+        node["kind"] = puc.kind
+        node["definition"] = puc.description
+    return [node for key, node in nodes.items() if len(key) == 1]
+
+
+def flatten(nodes):
+    for node in nodes:
+        yield node
+        yield from flatten(node["children"])
+
+
+def is_chemical(sid):
+    tables = lookups.get_lookups()
+    if tables is not None:
+        return tables["chemical_ids"].position(sid) is not None
+    return models.DSSToxLookup.objects.filter(sid=sid).exists()
+
+
+def get_tree(kind=None, chemical=None):
+    """Return the PUC hierarchy, built once per data version
+
+    Hierarchies restricted to a kind of PUC or a chemical which does not
+    exist are empty, and are neither built nor cached.
+    """
+    if kind or chemical:
+        kinds = {node["kind"] for node in flatten(get_tree())}
+        if (kind and kind not in kinds) or (chemical and not is_chemical(chemical)):
+            return []
+    key = versioned_key("puc_tree", kind or "", chemical or "")
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_tree(kind, chemical)
+        cache.set(key, tree, None)
+    return tree
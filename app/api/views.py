@@ -1,12 +1,63 @@
-from django.db.models import Prefetch
-from rest_framework import viewsets
+import os
+from collections import OrderedDict
 
-from app.api import filters, serializers
+from django.conf import settings
+from django.db.models import Prefetch, Sum
+from django.http import FileResponse
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from app.api import (
+    cooccurrence,
+    filters,
+    jobs,
+    lookups,
+    presence,
+    search,
+    serializers,
+    similarity,
+    tree,
+    wfstats,
+)
+from app.api import models as api_models
+from app.core.dataversion import get_data_version
+from app.core.db import straight_join
+from app.core.viewsets import RecordMixin, StandardReadOnlyModelViewSet
 from dashboard import models
-from django_mysql.models import add_QuerySetMixin
 
 
-class PUCViewSet(viewsets.ReadOnlyModelViewSet):
+class LookupQuerysetMixin:
+    """Reads `lookup_queryset` when the lookup tables are current
+
+    `lookup_queryset` leaves out the joins and prefetches whose values the
+    serializer then reads from the lookup tables, see `app.api.lookups`. The
+    tables are resolved once per request, and passed to the serializer.
+    """
+
+    lookup_queryset = None
+
+    def get_lookups(self):
+        if not hasattr(self, "_lookups"):
+            self._lookups = lookups.get_lookups()
+        return self._lookups
+
+    def get_queryset(self):
+        if self.lookup_queryset is not None and self.get_lookups() is not None:
+            return self.lookup_queryset.all()
+        return super().get_queryset()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["lookups"] = self.get_lookups()
+        return context
+
+
+class PUCViewSet(StandardReadOnlyModelViewSet):
     """
     list: Service providing a list of all Product Use Categories (PUCs) in ChemExpoDB.
     The PUCs follow a three-tiered hierarchy (Levels 1-3) for categorizing products.
@@ -19,8 +70,40 @@ class PUCViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.PUC.objects.all().order_by("id")
     filterset_class = filters.PUCFilter
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "kind",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="A PUC kind to restrict the hierarchy to.",
+                example="FO",
+            ),
+            openapi.Parameter(
+                "chemical",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="A chemical DTXSID to restrict the hierarchy and counts to.",
+                example="DTXSID6026296",
+            ),
+        ],
+        responses={200: serializers.PUCTreeSerializer(many=True)},
+    )
+    @action(detail=False, filter_backends=[], pagination_class=None)
+    def tree(self, request):
+        """
+        Service providing the complete PUC hierarchy in one response. Each
+        Level 1 category contains its Level 2 categories, which contain their
+        Level 3 categories. Every node carries the number of products,
+        documents and chemicals below it.
+        """
+        if settings.EDGE_DATABASE:
+            raise NotFound("The PUC tree is not served from the edge database.")
+        params = request.query_params
+        return Response(tree.get_tree(params.get("kind"), params.get("chemical")))
+
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(LookupQuerysetMixin, StandardReadOnlyModelViewSet):
     """
     list: Service providing a list of all products in ChemExpoDB, along with metadata
     describing the product. In ChemExpoDB, a product is defined as an item having a
@@ -34,10 +117,45 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.Product.objects.prefetch_pucs().prefetch_related(
         Prefetch("documents", queryset=models.DataDocument.objects.order_by("id"))
     )
+    lookup_queryset = models.Product.objects.all()
     filterset_class = filters.ProductFilter
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "k",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                minimum=1,
+                maximum=100,
+                default=10,
+                description="Number of products to return.",
+            )
+        ],
+        responses={200: serializers.SimilarProductSerializer(many=True)},
+    )
+    @action(detail=True, filter_backends=[], pagination_class=None)
+    def similar(self, request, pk=None):
+        """
+        Service providing the products with the most similar formulation, i.e.
+        sharing the most chemicals relative to the chemicals of both products,
+        most similar first. Candidates are found with MinHash signatures, so
+        products sharing few chemicals may be left out.
+        """
+        try:
+            k = int(request.query_params.get("k", 10))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= 100:
+            raise ValidationError({"k": "Must be between 1 and 100."})
+        index = similarity.get_similar_products()
+        if index is None:
+            raise NotFound("The similar product index has not been built.")
+        product = self.get_object()
+        return Response(index.similar(product.pk, k))
+
 
-class DocumentViewSet(viewsets.ReadOnlyModelViewSet):
+class DocumentViewSet(LookupQuerysetMixin, StandardReadOnlyModelViewSet):
     """
     list: Service providing a list of all documents in ChemExpoDB, along with
     metadata describing the document. Service also provides the actual data
@@ -49,24 +167,44 @@ class DocumentViewSet(viewsets.ReadOnlyModelViewSet):
     # By using the STRAIGHT_JOIN directive, the query time is reduced
     # from >2 seconds to ~0.0005 seconds. Pretty big! This is due to
     # poor MySQL optimization with INNER JOIN and ORDER BY.
-    queryset = (
-        add_QuerySetMixin(models.DataDocument.objects.all())
-        .prefetch_related(
+    # Only the ExtractedChemical subclass is serialized, so the other RawChem
+    # subclass tables are not joined, and the product ids are read from the
+    # link table without loading the products.
+    queryset = straight_join(
+        models.DataDocument.objects.prefetch_related(
             Prefetch(
                 "extractedtext__rawchem",
                 queryset=models.RawChem.objects.filter(dsstox__isnull=False)
                 .select_related("dsstox")
-                .select_subclasses(),
+                .select_subclasses("extractedchemical"),
             ),
-            Prefetch("products"),
+            Prefetch(
+                "productdocument_set",
+                queryset=models.ProductDocument.objects.only(
+                    "document_id", "product_id"
+                ),
+                to_attr="product_links",
+            ),
+        )
+        .select_related("data_group__group_type", "document_type")
+        .order_by("-id")
+    )
+    lookup_queryset = straight_join(
+        models.DataDocument.objects.prefetch_related(
+            Prefetch(
+                "extractedtext__rawchem",
+                queryset=models.RawChem.objects.filter(
+                    dsstox__isnull=False
+                ).select_subclasses("extractedchemical"),
+            )
         )
-        .straight_join()
         .select_related("data_group__group_type", "document_type")
         .order_by("-id")
     )
+    filterset_class = filters.DocumentFilter
 
 
-class ChemicalViewSet(viewsets.ReadOnlyModelViewSet):
+class ChemicalViewSet(StandardReadOnlyModelViewSet):
     """
     list: Service providing a list of all registered chemical
     substances linked to data in ChemExpoDB. All chemical data in
@@ -83,8 +221,90 @@ class ChemicalViewSet(viewsets.ReadOnlyModelViewSet):
     ).order_by("sid")
     filterset_class = filters.ChemicalFilter
 
+    level_parameter = openapi.Parameter(
+        "level",
+        openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        enum=list(cooccurrence.LEVELS),
+        default="product",
+        description="Count chemicals found in the same product, or in products "
+        "of the same PUC.",
+    )
+
+    def get_matrix(self, request):
+        """Return the co-occurrence matrix and the requested level"""
+        level = request.query_params.get("level", "product")
+        if level not in cooccurrence.LEVELS:
+            raise ValidationError(
+                {"level": "Must be one of %s." % ", ".join(cooccurrence.LEVELS)}
+            )
+        matrix = cooccurrence.get_matrix()
+        if matrix is None:
+            raise NotFound("The chemical co-occurrence matrix has not been built.")
+        return matrix, level
+
+    def get_position(self, matrix, sid):
+        """Return the position of a chemical in the matrix, None if it has none
+
+        Chemicals outside the matrix which exist, e.g. added since its build,
+        co-occur with nothing.
+        """
+        position = matrix.position(sid)
+        if position is None and not self.get_queryset().filter(sid=sid).exists():
+            raise NotFound()
+        return position
+
+    @swagger_auto_schema(
+        manual_parameters=[level_parameter],
+        responses={200: serializers.CooccurringChemicalSerializer(many=True)},
+    )
+    @action(detail=True, filter_backends=[])
+    def cooccurring(self, request, id=None):
+        """
+        Service providing the chemicals found together with a chemical, with the
+        number of products (or PUCs) holding both, most frequent first. Counts
+        are read from a precomputed matrix and are as recent as its last build.
+        """
+        matrix, level = self.get_matrix(request)
+        chemical = self.get_position(matrix, id)
+        results = [] if chemical is None else matrix.top(chemical, level)
+        page = self.paginate_queryset(results)
+        serializer = serializers.CooccurringChemicalSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-class ChemicalPresenceViewSet(viewsets.ReadOnlyModelViewSet):
+    @swagger_auto_schema(
+        manual_parameters=[level_parameter],
+        responses={200: serializers.ChemicalPairSerializer()},
+    )
+    @action(
+        detail=True,
+        url_path=r"cooccurring/(?P<other>[^/.]+)",
+        filter_backends=[],
+        pagination_class=None,
+    )
+    def cooccurring_pair(self, request, id=None, other=None):
+        """
+        Service providing the number of products (or PUCs) holding a chemical,
+        another chemical, and both of them.
+        """
+        matrix, level = self.get_matrix(request)
+        counts = matrix.pair(
+            self.get_position(matrix, id), self.get_position(matrix, other), level
+        )
+        data = OrderedDict(
+            [
+                ("chemical_id", id),
+                ("other_chemical_id", other),
+                ("level", level),
+                ("chemical_count", counts[0]),
+                ("other_chemical_count", counts[1]),
+                ("count", counts[2]),
+            ]
+        )
+        return Response(serializers.ChemicalPairSerializer(data).data)
+
+
+class ChemicalPresenceViewSet(StandardReadOnlyModelViewSet):
     """
     list: Service providing a list of all chemical presence tags in ChemExpoDB.
     A 'tag' (or keyword) may be applied to a chemical, indicating that there
@@ -99,3 +319,537 @@ class ChemicalPresenceViewSet(viewsets.ReadOnlyModelViewSet):
         .select_related("kind")
         .order_by("id")
     )
+
+    tag_parameters = [
+        openapi.Parameter(
+            "q",
+            openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description="A tag expression combining tags, by ID or by name "
+            "(double-quoted when it holds spaces), with 'and', 'or', 'not' and "
+            "parentheses. 'not' is relative to the chemicals carrying any tag of "
+            "the kind. Defaults to every such chemical.",
+            example='"flame retardant" and not 12',
+        ),
+        openapi.Parameter(
+            "kind",
+            openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description="Only consider the tags of this kind.",
+        ),
+    ]
+
+    def get_tag_set(self, request):
+        """Return the presence tags and the bitset of the requested chemicals"""
+        if settings.EDGE_DATABASE:
+            raise NotFound("Presence tags are not served from the edge database.")
+        tags = presence.get_presence_tags()
+        kind = request.query_params.get("kind") or None
+        expression = request.query_params.get("q", "").strip()
+        if not expression:
+            return tags, tags.universe(kind)
+        try:
+            return tags, tags.evaluate(expression, kind)
+        except presence.ExpressionError as e:
+            raise ValidationError({"q": str(e)})
+
+    @swagger_auto_schema(
+        manual_parameters=tag_parameters,
+        responses={200: serializers.PresenceChemicalSerializer(many=True)},
+    )
+    @action(detail=False, filter_backends=[])
+    def chemicals(self, request):
+        """
+        Service providing the chemicals which carry a combination of chemical
+        presence tags, e.g. tags A and B but not C, along with all of their tags.
+        """
+        tags, bits = self.get_tag_set(request)
+        kind = request.query_params.get("kind") or None
+        results = presence.ChemicalTagSets(tags, tags.chemicals(bits), kind)
+        page = self.paginate_queryset(results)
+        serializer = serializers.PresenceChemicalSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @swagger_auto_schema(
+        manual_parameters=tag_parameters,
+        responses={200: serializers.PresenceTagCountSerializer(many=True)},
+    )
+    @action(detail=False, filter_backends=[])
+    def cooccurrence(self, request):
+        """
+        Service providing, for the chemicals which carry a combination of
+        chemical presence tags, how many of them carry each tag, most frequent
+        tags first.
+        """
+        tags, bits = self.get_tag_set(request)
+        kind = request.query_params.get("kind") or None
+        page = self.paginate_queryset(tags.cooccurrence(bits, kind))
+        serializer = serializers.PresenceTagCountSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class PUCRecordViewSet(RecordMixin, PUCViewSet):
+    __doc__ = PUCViewSet.__doc__
+    queryset = api_models.PUCRecord.objects.order_by("id")
+    filterset_class = filters.PUCRecordFilter
+
+
+class ProductRecordViewSet(RecordMixin, ProductViewSet):
+    __doc__ = ProductViewSet.__doc__
+    queryset = api_models.ProductRecord.objects.order_by("id")
+    lookup_queryset = None
+    filterset_class = filters.ProductRecordFilter
+
+
+class DocumentRecordViewSet(RecordMixin, DocumentViewSet):
+    __doc__ = DocumentViewSet.__doc__
+    queryset = api_models.DocumentRecord.objects.order_by("-id")
+    lookup_queryset = None
+    filterset_class = filters.DocumentRecordFilter
+    json_columns = ("products", "chemicals")
+
+
+class ChemicalRecordViewSet(RecordMixin, ChemicalViewSet):
+    __doc__ = ChemicalViewSet.__doc__
+    queryset = api_models.ChemicalRecord.objects.order_by("id")
+    filterset_class = filters.ChemicalRecordFilter
+
+
+class ChemicalPresenceRecordViewSet(RecordMixin, ChemicalPresenceViewSet):
+    __doc__ = ChemicalPresenceViewSet.__doc__
+    queryset = api_models.ChemicalPresenceRecord.objects.order_by("id")
+
+
+class SearchViewSet(viewsets.GenericViewSet):
+    """
+    list: Service providing a ranked search across chemicals (preferred name and
+    CAS), products (title, brand and manufacturer) and documents (title and
+    organization). Every word of the query must match part of a word in the
+    object, e.g. 'benzyl' or a partial CAS number. In prefix mode every word
+    must match the start of a word, which is suitable for autocompletion.
+    """
+
+    serializer_class = serializers.SearchResultSerializer
+    filter_backends = []
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "q",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=True,
+                description="The text to search for.",
+                example="benzyl",
+            ),
+            openapi.Parameter(
+                "type",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Comma separated kinds of objects to search: "
+                + ", ".join(search.KINDS)
+                + ". Defaults to all.",
+                example="chemical",
+            ),
+            openapi.Parameter(
+                "mode",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=["substring", "prefix"],
+                default="substring",
+                description="Match any part of words, or only their start.",
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        query = params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+        kinds = [k for k in params.get("type", "").split(",") if k]
+        if any(k not in search.KINDS for k in kinds):
+            raise ValidationError(
+                {"type": "Must be one of: %s." % ", ".join(search.KINDS)}
+            )
+        mode = params.get("mode", "substring")
+        if mode not in ("substring", "prefix"):
+            raise ValidationError({"mode": "Must be 'substring' or 'prefix'."})
+        index = search.get_index()
+        if index is None:
+            raise NotFound("The search index has not been built.")
+        results = index.search(query, kinds, prefix=mode == "prefix")
+        page = self.paginate_queryset(results)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class WeightFractionViewSet(viewsets.GenericViewSet):
+    """
+    list: Service providing the distribution of the reported weight fractions of
+    chemicals: the number of values, minimum, maximum, mean, percentiles and a
+    histogram of the lower, central and upper weight fractions. Records may be
+    restricted to a chemical, a PUC and a product component, and grouped by
+    component or PUC.
+    """
+
+    serializer_class = serializers.WeightFractionStatsSerializer
+    filter_backends = []
+    pagination_class = None
+    # Distributions aggregate every matching chemical record
+    query_budget = 30
+
+    def get_number(self, name, cast, default, low, high):
+        value = self.request.query_params.get(name)
+        if value in (None, ""):
+            return default
+        try:
+            value = cast(value)
+        except ValueError:
+            value = None
+        if value is None or not low <= value <= high:
+            raise ValidationError({name: "Must be between %s and %s." % (low, high)})
+        return value
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "chemical",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="A chemical DTXSID to restrict the records to.",
+                example="DTXSID6026296",
+            ),
+            openapi.Parameter(
+                "puc",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="A PUC to restrict the records to.",
+            ),
+            openapi.Parameter(
+                "component",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="A product component to restrict the records to.",
+            ),
+            openapi.Parameter(
+                "min_wf",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_NUMBER,
+                default=0,
+                description="Leave out weight fractions below this value.",
+            ),
+            openapi.Parameter(
+                "max_wf",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_NUMBER,
+                default=1,
+                description="Leave out weight fractions above this value.",
+            ),
+            openapi.Parameter(
+                "bins",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                default=10,
+                description="Number of equal width histogram bins between min_wf "
+                "and max_wf.",
+            ),
+            openapi.Parameter(
+                "group_by",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=["component", "puc"],
+                description="Compute one distribution per component or per PUC.",
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        if settings.EDGE_DATABASE:
+            raise NotFound("Weight fractions are not served from the edge database.")
+        params = request.query_params
+        group_by = params.get("group_by") or None
+        if group_by not in (None, "component", "puc"):
+            raise ValidationError({"group_by": "Must be 'component' or 'puc'."})
+        low = self.get_number("min_wf", float, 0.0, 0.0, 1.0)
+        high = self.get_number("max_wf", float, 1.0, low, 1.0)
+        bins = self.get_number("bins", int, 10, 1, 100)
+        puc = self.get_number("puc", int, None, 0, 2 ** 31 - 1)
+        weight_fractions = wfstats.get_weight_fractions()
+        rows = weight_fractions.select(
+            params.get("chemical") or None, puc, params.get("component")
+        )
+        groups = []
+        for value, group in weight_fractions.group(rows, group_by):
+            stats = weight_fractions.describe(group, low, high, bins)
+            if group_by is not None:
+                stats[group_by] = value
+                stats.move_to_end(group_by, last=False)
+            groups.append(stats)
+        return Response(groups)
+
+
+class ExportViewSet(viewsets.GenericViewSet):
+    """
+    create: Service queuing the export of every object of a resource matching
+    lists of filter values, e.g. all documents containing any of thousands of
+    chemicals, which is too large for the list services. The job is returned
+    at once, and identical requests share a job until the data changes. Poll
+    the job until it is done, then download its files.
+
+    retrieve: Service providing the status of an export job and, once it is
+    done, the links to its files. Old results are removed to free disk space,
+    after which the job must be created again.
+    """
+
+    serializer_class = serializers.ExportJobSerializer
+    filter_backends = []
+    pagination_class = None
+
+    resources = OrderedDict(
+        [
+            ("pucs", PUCViewSet),
+            ("products", ProductViewSet),
+            ("documents", DocumentViewSet),
+            ("chemicals", ChemicalViewSet),
+            ("chemicalpresences", ChemicalPresenceViewSet),
+        ]
+    )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if settings.EDGE_DATABASE:
+            raise NotFound("Exports are not served from the edge database.")
+
+    def get_spec(self, data):
+        """Validate a job specification and return it normalized"""
+        serializer = serializers.ExportSpecSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        resource = serializer.validated_data["resource"]
+        filters = serializer.validated_data["filters"]
+        viewset = self.resources[resource]
+        filterset_class = viewset.filterset_class
+        names = filterset_class.base_filters if filterset_class else {}
+        errors = {}
+        for name, values in filters.items():
+            if name not in names:
+                errors[name] = "Not a filter of %s." % resource
+            elif len(values) > settings.EXPORT_MAX_VALUES:
+                errors[name] = "At most %d values." % settings.EXPORT_MAX_VALUES
+            else:
+                for value in values:
+                    filterset = filterset_class(
+                        {name: value}, queryset=viewset.queryset.none()
+                    )
+                    if not filterset.is_valid():
+                        errors[name] = filterset.errors[name]
+                        break
+        if errors:
+            raise ValidationError({"filters": errors})
+        return OrderedDict(
+            [
+                ("resource", resource),
+                ("filters", {name: sorted(set(v)) for name, v in filters.items()}),
+            ]
+        )
+
+    def describe(self, job):
+        job = dict(job)
+        job["files"] = OrderedDict(
+            (
+                name,
+                reverse(
+                    "exports-files",
+                    kwargs={"pk": job["id"], "name": name},
+                    request=self.request,
+                ),
+            )
+            for name in job["files"]
+        )
+        return self.get_serializer(job).data
+
+    @swagger_auto_schema(
+        request_body=serializers.ExportSpecSerializer,
+        responses={
+            status.HTTP_202_ACCEPTED: serializers.ExportJobSerializer(),
+            status.HTTP_200_OK: serializers.ExportJobSerializer(),
+        },
+    )
+    def create(self, request, *args, **kwargs):
+        job, created = jobs.create_job(self.get_spec(request.data), get_data_version())
+        return Response(
+            self.describe(job),
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+            headers={"Location": reverse("exports-detail", args=[job["id"]])},
+        )
+
+    def retrieve(self, request, pk=None, *args, **kwargs):
+        job = jobs.read_job(pk)
+        if job is None:
+            raise NotFound()
+        return Response(self.describe(job))
+
+    @swagger_auto_schema(
+        responses={
+            200: openapi.Response(
+                "The gzipped file.", schema=openapi.Schema(type=openapi.TYPE_FILE)
+            )
+        }
+    )
+    @action(detail=True, url_path=r"files/(?P<name>ndjson|csv)")
+    def files(self, request, pk=None, name=None):
+        """
+        Service providing a file of a finished export job, as gzipped NDJSON
+        or CSV.
+        """
+        job = jobs.read_job(pk)
+        if job is None or name not in job["files"]:
+            raise NotFound()
+        path = os.path.join(jobs.get_directory(pk), job["files"][name]["name"])
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            raise NotFound()
+        filename = "%s-%s.%s.gz" % (job["spec"]["resource"], pk, name)
+        return FileResponse(file, as_attachment=True, filename=filename)
+
+
+class SummaryViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Base viewset for the /stats/ endpoints, which read summary tables
+
+    Rows may be sorted with `ordering`, and grouped by some of their fields
+    with `group_by`. Only the counts in `additive_fields`, which count every
+    object in a single row, are summed over the groups: the others count
+    objects shared by several rows, whose sum would count them many times.
+    """
+
+    group_fields = ()
+    additive_fields = ()
+    ordering = ()
+
+    def get_group_by(self):
+        if self.request is None:
+            return []
+        group_by = [
+            f for f in self.request.query_params.get("group_by", "").split(",") if f
+        ]
+        if group_by and not self.group_fields:
+            raise ValidationError(
+                {"group_by": "The counts of this service cannot be grouped."}
+            )
+        if any(f not in self.group_fields for f in group_by):
+            raise ValidationError(
+                {"group_by": "Must be any of: %s." % ", ".join(self.group_fields)}
+            )
+        return group_by
+
+    def get_ordering(self, group_by):
+        value = self.request.query_params.get("ordering")
+        if not value:
+            return group_by or list(self.ordering)
+        ordering = value.split(",")
+        if group_by:
+            allowed = group_by + list(self.additive_fields)
+        else:
+            allowed = list(self.serializer_class.Meta.fields)
+        if any(o.lstrip("-") not in allowed for o in ordering):
+            raise ValidationError(
+                {"ordering": "Must be any of: %s." % ", ".join(allowed)}
+            )
+        return ordering
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        group_by = self.get_group_by()
+        ordering = self.get_ordering(group_by)
+        if group_by:
+            queryset = (
+                queryset.order_by()
+                .values(*group_by)
+                .annotate(*[Sum(f) for f in self.additive_fields])
+            )
+            ordering = [
+                o + "__sum" if o.lstrip("-") in self.additive_fields else o
+                for o in ordering
+            ]
+        return queryset.order_by(*ordering)
+
+    def get_serializer(self, *args, **kwargs):
+        group_by = self.get_group_by()
+        if group_by:
+            kwargs["fields"] = group_by + list(self.additive_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "group_by",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Comma separated fields to group the additive "
+                "counts by.",
+            ),
+            openapi.Parameter(
+                "ordering",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Comma separated fields to sort by, prefixed by '-' "
+                "for descending order.",
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class PUCStatsViewSet(SummaryViewSet):
+    """
+    list: Service providing the number of products, documents and chemicals of
+    each PUC. The counts are not additive and cannot be grouped, the distinct
+    counts of each level of the hierarchy are served by /pucs/tree/.
+    """
+
+    serializer_class = serializers.PUCStatsSerializer
+    queryset = api_models.PUCSummary.objects.all()
+    filterset_class = filters.PUCStatsFilter
+    ordering = ("puc_id",)
+
+
+class ProductStatsViewSet(SummaryViewSet):
+    """
+    list: Service providing the number of products by uber PUC, manufacturer
+    and brand. Counts may be grouped by puc_id, manufacturer and brand.
+    """
+
+    serializer_class = serializers.ProductStatsSerializer
+    queryset = api_models.ProductSummary.objects.all()
+    filterset_class = filters.ProductStatsFilter
+    group_fields = ("puc_id", "manufacturer", "brand")
+    additive_fields = ("product_count",)
+    ordering = ("puc_id", "manufacturer", "brand")
+
+
+class DocumentStatsViewSet(SummaryViewSet):
+    """
+    list: Service providing the number of documents, and of their products and
+    chemicals, by data type and document type. Document counts may be grouped
+    by data_type and document_type.
+    """
+
+    serializer_class = serializers.DocumentStatsSerializer
+    queryset = api_models.DocumentSummary.objects.all()
+    filterset_class = filters.DocumentStatsFilter
+    group_fields = ("data_type", "document_type")
+    additive_fields = ("document_count",)
+    ordering = ("data_type", "document_type")
+
+
+class ChemicalStatsViewSet(SummaryViewSet):
+    """
+    list: Service providing the number of documents, products and PUCs each
+    chemical was found in, by default starting with the chemicals found in the
+    most products.
+    """
+
+    serializer_class = serializers.ChemicalStatsSerializer
+    queryset = api_models.ChemicalSummary.objects.all()
+    filterset_class = filters.ChemicalStatsFilter
+    ordering = ("-product_count", "chemical_id")
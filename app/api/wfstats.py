@@ -0,0 +1,167 @@
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.dataversion import VersionedObject
+from dashboard import models
+
+# (output name, ExtractedChemical field) of each weight fraction
+MEASURES = (
+    ("lower_weight_fraction", "lower_wf_analysis"),
+    ("central_weight_fraction", "central_wf_analysis"),
+    ("upper_weight_fraction", "upper_wf_analysis"),
+)
+
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+
+def expand_ranges(starts, ends):
+    """Concatenate the integer ranges [start, end) into one array"""
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+
+
+def to_float(value):
+    return np.nan if value is None else float(value)
+
+
+class WeightFractions:
+    """The weight fractions of every extracted chemical as column arrays
+
+    Rows are sorted by chemical so that the rows of one chemical are a
+    contiguous slice. A second ordering by document, together with the
+    document to PUC links, selects the rows of a PUC without a scan.
+    """
+
+    def __init__(self):
+        dsstox, docs, components = array("i"), array("i"), array("i")
+        values = [array("d") for _ in MEASURES]
+        self.components = []
+        codes = {}
+        rows = models.ExtractedChemical.objects.filter(dsstox__isnull=False)
+        fields = [field for _, field in MEASURES]
+        rows = rows.values_list("dsstox_id", "extracted_text_id", "component", *fields)
+        for row in rows.iterator():
+            dsstox.append(row[0])
+            docs.append(row[1])
+            component = row[2] or ""
+            if component not in codes:
+                codes[component] = len(self.components)
+                self.components.append(component)
+            components.append(codes[component])
+            for column, value in zip(values, row[3:]):
+                column.append(to_float(value))
+        dsstox = np.frombuffer(dsstox, dtype=np.int32)
+        chemical_ids, chemicals = np.unique(dsstox, return_inverse=True)
+        docs = np.frombuffer(docs, dtype=np.int32)
+        order = np.lexsort((docs, chemicals))
+        self.chemicals = chemicals[order].astype(np.int32)
+        self.docs = docs[order]
+        self.component_codes = np.frombuffer(components, dtype=np.int32)[order]
+        self.values = [np.frombuffer(v, dtype=np.float64)[order] for v in values]
+        self.chemical_offsets = np.searchsorted(
+            self.chemicals, np.arange(len(chemical_ids) + 1)
+        )
+        sids = dict(
+            models.DSSToxLookup.objects.filter(
+                id__in=chemical_ids.tolist()
+            ).values_list("id", "sid")
+        )
+        self.chemical_index = {sids[i]: n for n, i in enumerate(chemical_ids.tolist())}
+        self.doc_order = np.argsort(self.docs, kind="stable")
+        self.sorted_docs = self.docs[self.doc_order]
+        links = np.array(
+            models.DataDocument.objects.filter(products__puc__isnull=False)
+            .values_list("products__puc", "id")
+            .distinct(),
+            dtype=np.int32,
+        ).reshape(-1, 2)
+        by_puc = links[np.lexsort((links[:, 1], links[:, 0]))]
+        self.link_pucs, self.link_docs = by_puc[:, 0], by_puc[:, 1]
+        by_doc = links[np.lexsort((links[:, 0], links[:, 1]))]
+        self.doc_link_docs, self.doc_link_pucs = by_doc[:, 1], by_doc[:, 0]
+
+    def rows_for_docs(self, docs):
+        starts = np.searchsorted(self.sorted_docs, docs, "left")
+        ends = np.searchsorted(self.sorted_docs, docs, "right")
+        return np.sort(self.doc_order[expand_ranges(starts, ends)])
+
+    def docs_for_puc(self, puc):
+        low, high = np.searchsorted(self.link_pucs, [puc, puc + 1])
+        return self.link_docs[low:high]
+
+    def select(self, chemical=None, puc=None, component=None):
+        """Return the indices of the rows matching every given filter"""
+        if chemical is not None:
+            n = self.chemical_index.get(chemical)
+            if n is None:
+                return np.zeros(0, dtype=np.int64)
+            rows = np.arange(self.chemical_offsets[n], self.chemical_offsets[n + 1])
+            if puc is not None:
+                rows = rows[np.isin(self.docs[rows], self.docs_for_puc(puc))]
+        elif puc is not None:
+            rows = self.rows_for_docs(self.docs_for_puc(puc))
+        else:
+            rows = np.arange(len(self.docs))
+        if component is not None:
+            try:
+                code = self.components.index(component)
+            except ValueError:
+                return np.zeros(0, dtype=np.int64)
+            rows = rows[self.component_codes[rows] == code]
+        return rows
+
+    def group(self, rows, group_by):
+        """Split rows into (group value, rows) pairs"""
+        if group_by == "component":
+            codes = self.component_codes[rows]
+            return [(self.components[c], rows[codes == c]) for c in np.unique(codes)]
+        if group_by == "puc":
+            # A document may belong to several PUCs, its rows count in each
+            docs = self.docs[rows]
+            starts = np.searchsorted(self.doc_link_docs, docs, "left")
+            ends = np.searchsorted(self.doc_link_docs, docs, "right")
+            links = expand_ranges(starts, ends)
+            rows = np.repeat(rows, ends - starts)
+            pucs = self.doc_link_pucs[links]
+            return [(int(p), rows[pucs == p]) for p in np.unique(pucs)]
+        return [(None, rows)]
+
+    def describe(self, rows, low=0.0, high=1.0, bins=10):
+        """Summarize the distribution of each weight fraction over rows
+
+        Values outside [low, high] are left out.
+        """
+        out = OrderedDict([("count", len(rows))])
+        for (name, _), column in zip(MEASURES, self.values):
+            values = column[rows]
+            values = values[(values >= low) & (values <= high)]
+            stats = OrderedDict([("count", len(values))])
+            if len(values):
+                stats["min"] = float(values.min())
+                stats["max"] = float(values.max())
+                stats["mean"] = float(values.mean())
+                points = np.percentile(values, PERCENTILES)
+            else:
+                stats["min"] = stats["max"] = stats["mean"] = None
+                points = [None] * len(PERCENTILES)
+            stats["percentiles"] = OrderedDict(
+                (str(p), None if v is None else float(v))
+                for p, v in zip(PERCENTILES, points)
+            )
+            counts, edges = np.histogram(values, bins=bins, range=(low, high))
+            stats["histogram"] = OrderedDict(
+                [("edges", edges.tolist()), ("counts", counts.tolist())]
+            )
+            out[name] = stats
+        return out
+
+
+_weight_fractions = VersionedObject(WeightFractions)
+
+
+def get_weight_fractions():
+    """Return the weight fraction arrays of the current data version"""
+    return _weight_fractions.get()
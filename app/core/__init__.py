@@ -0,0 +1 @@
+default_app_config = "app.core.apps.CoreConfig"
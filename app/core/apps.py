@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+from app.core.db import configure_edge_connection, install_query_budget
+
+
+class CoreConfig(AppConfig):
+    name = "app.core"
+
+    def ready(self):
+        connection_created.connect(configure_edge_connection)
+        connection_created.connect(install_query_budget)
@@ -0,0 +1,101 @@
+"""Files of named NumPy arrays, read by the workers through a memory map
+
+A file starts with a magic string and the length of a JSON header, which
+gives the dtype, shape and offset of every array along with free-form
+metadata. Arrays are aligned so that they can be viewed in place.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b"FWSARRAY"
+
+ALIGNMENT = 64
+
+
+def _align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def write_arrays(path, arrays, meta=None):
+    """Write a mapping of names to arrays, replacing path atomically"""
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        entries[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({"arrays": entries, "meta": meta or {}}).encode()
+    start = _align(len(MAGIC) + 8 + len(header))
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for name, array in arrays.items():
+            f.seek(start + entries[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+
+
+class ArrayFile:
+    """The arrays of a file, as read-only views of a shared memory map"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[: len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not an array file" % path)
+        (size,) = struct.unpack("<Q", self.buffer[len(MAGIC) : len(MAGIC) + 8])
+        header = json.loads(self.buffer[len(MAGIC) + 8 : len(MAGIC) + 8 + size])
+        start = _align(len(MAGIC) + 8 + size)
+        self.meta = header["meta"]
+        self.arrays = {}
+        for name, entry in header["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            array = np.frombuffer(
+                self.buffer, dtype, count, offset=start + entry["offset"]
+            )
+            self.arrays[name] = array.reshape(entry["shape"])
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+
+class MappedFile:
+    """An array file reopened whenever it has been replaced
+
+    `get()` returns None while the file does not exist. Files are replaced
+    by renaming, so a worker keeps reading the old map until it next looks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.key = None
+        self.value = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self.key != key:
+            with self.lock:
+                if self.key != key:
+                    self.value = ArrayFile(self.path)
+                    self.key = key
+        return self.value
@@ -0,0 +1,93 @@
+"""Micro-benchmarks of in-process code, compared against stored baselines
+
+A benchmark is a function called repeatedly: its time is the best of
+`repeat` runs of `number` calls, which is the least disturbed by the rest of
+the machine, and its allocations are traced over a separate call. Results
+are saved as a baseline, and later runs slower than the baseline by more
+than a threshold are reported as regressions.
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+
+
+def measure(function, repeat=5, number=None, min_time=0.2):
+    """Return the seconds per call and the allocations of a function
+
+    `number` defaults to enough calls for a run to last about `min_time`.
+    Allocations are the bytes allocated during a call and not yet freed at
+    its peak, and the count of memory blocks still allocated by its end.
+    """
+    function()
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            if time.perf_counter() - start >= min_time / repeat or number >= 1 << 20:
+                break
+            number *= 2
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            times.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename"))
+    return OrderedDict(
+        [("seconds", min(times)), ("peak_bytes", peak), ("blocks", blocks)]
+    )
+
+
+def load_baseline(path):
+    """Return the results of a baseline file, empty if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+    except FileNotFoundError:
+        return OrderedDict()
+
+
+def save_baseline(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp, path)
+
+
+def compare(results, baseline, threshold):
+    """Return the (name, ratio) of the benchmarks slower than their baseline
+
+    A benchmark regresses when its time exceeds the baseline time by more
+    than `threshold`, e.g. 0.2 for 20%. Benchmarks absent from the baseline
+    are not compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base["seconds"]:
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
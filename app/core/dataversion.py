@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max
+
+logger = logging.getLogger("django")
+
+_current = {"version": None, "derived": None, "expires": 0.0}
+_first = threading.Lock()
+_refreshing = threading.Lock()
+
+# Fields holding the modification time of a row
+MODIFICATION_FIELDS = ("updated_at", "refreshed_at")
+
+
+def compute_data_version(labels=None, using=None):
+    """Return a fingerprint of the data served by the API
+
+    The fingerprint is built from the row count, the highest primary key and
+    (where available) the latest modification time of every model listed in
+    `labels` (by default `DATA_VERSION_MODELS`), so it changes whenever rows
+    are added, removed or edited.
+    """
+    digest = hashlib.sha1()
+    for label in labels or settings.DATA_VERSION_MODELS:
+        model = apps.get_model(label)
+        aggregates = {"count": Count("pk"), "max_pk": Max("pk")}
+        for field in model._meta.concrete_fields:
+            if field.name in MODIFICATION_FIELDS:
+                aggregates[field.name] = Max(field.name)
+        values = model._base_manager.using(using).aggregate(**aggregates)
+        digest.update(repr((label, sorted(values.items()))).encode())
+    return digest.hexdigest()[:16]
+
+
+def compute_derived_version():
+    """Return a fingerprint of the data derived from the data served
+
+    The summary and read-model tables and the index files of `INDEX_ROOT`
+    change without the data version when they are refreshed or rebuilt. The
+    fingerprint covers the models listed in `DERIVED_VERSION_MODELS`, which
+    record the refreshes, and the name, inode, size and modification time
+    of every index file.
+    """
+    digest = hashlib.sha1(
+        compute_data_version(settings.DERIVED_VERSION_MODELS).encode()
+    )
+    try:
+        entries = sorted(os.scandir(settings.INDEX_ROOT), key=lambda e: e.name)
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        if entry.is_file():
+            stat = entry.stat()
+            digest.update(
+                repr((entry.name, stat.st_ino, stat.st_size, stat.st_mtime_ns)).encode()
+            )
+    return digest.hexdigest()[:16]
+
+
+def refresh_data_version():
+    """Recompute the data version, on the connections of the calling thread"""
+    version, derived = compute_data_version(), compute_derived_version()
+    _current["version"], _current["derived"] = version, derived
+    _current["expires"] = time.monotonic() + settings.DATA_VERSION_TTL
+
+
+def _refresh_in_background():
+    try:
+        refresh_data_version()
+    except Exception:
+        logger.exception("Could not compute the data version")
+        _current["expires"] = time.monotonic() + settings.DATA_VERSION_TTL
+    finally:
+        connections.close_all()
+        _refreshing.release()
+
+
+def get_data_version():
+    """Return the current data version
+
+    The fingerprint is computed on first use. Once it is more than
+    `DATA_VERSION_TTL` seconds old, it is recomputed in a background thread
+    while the previous version is still returned, so that requests never
+    wait for it. A caller inside a transaction, whose changes the thread
+    would not see, recomputes it itself.
+    """
+    if _current["version"] is None:
+        with _first:
+            if _current["version"] is None:
+                refresh_data_version()
+    elif time.monotonic() >= _current["expires"]:
+        if connections["default"].in_atomic_block:
+            refresh_data_version()
+        elif _refreshing.acquire(False):
+            threading.Thread(
+                target=_refresh_in_background, name="dataversion", daemon=True
+            ).start()
+    return _current["version"]
+
+
+def get_derived_version():
+    """Return the fingerprint of the derived data, see `get_data_version`"""
+    get_data_version()
+    return _current["derived"]
+
+
+def versioned_key(*parts):
+    """Return a cache key which is only valid for the current data version"""
+    return ":".join(["factotum_ws", get_data_version()] + [str(p) for p in parts])
+
+
+class VersionedObject:
+    """An object built once per process and data version
+
+    `build` is called on first use and again whenever the data version
+    has changed since the object was built.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.version = None
+        self.value = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = get_data_version()
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.value = self.build()
+                    self.version = version
+        return self.value
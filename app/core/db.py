@@ -0,0 +1,284 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import QuerySet
+from django.db.utils import OperationalError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Structured records of the statements stopped by a query budget
+events = logging.getLogger("app.queries")
+
+# MySQL errors of a statement stopped by MAX_EXECUTION_TIME or KILL QUERY
+QUERY_INTERRUPTED = (1317, 3024)
+
+# Longest statement logged with an event
+MAX_LOGGED_SQL = 2000
+
+
+def is_mysql(connection):
+    return connection.vendor == "mysql"
+
+
+def straight_join(queryset):
+    """Add the MySQL STRAIGHT_JOIN hint to a queryset, on MySQL only"""
+    if not is_mysql(connections[queryset.db]):
+        return queryset
+    # Imported on demand, as only MySQL querysets need the mixin
+    from django_mysql.models import add_QuerySetMixin
+
+    return add_QuerySetMixin(queryset).straight_join()
+
+
+def configure_edge_connection(sender, connection, **kwargs):
+    """Memory map the edge database file and refuse any write to it"""
+    if connection.vendor != "sqlite" or not settings.EDGE_DATABASE:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA mmap_size = %d" % settings.EDGE_MMAP_SIZE)
+        cursor.execute("PRAGMA query_only = ON")
+
+
+QueryBudget = namedtuple("QueryBudget", ["deadline", "seconds", "endpoint"])
+
+_budget = threading.local()
+_lock = threading.Lock()
+_timeouts = {}
+
+
+class QueryTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = (
+        "The request took longer than the database time allowed for this "
+        "service. Narrow the filters, or request an export from /exports/."
+    )
+    default_code = "query_timeout"
+
+
+def make_query_budget(seconds, endpoint=None):
+    return QueryBudget(time.monotonic() + seconds, seconds, endpoint)
+
+
+def get_query_budget():
+    return getattr(_budget, "value", None)
+
+
+def set_query_budget(budget):
+    """Run the statements of this thread under a budget, None for none"""
+    _budget.value = budget
+
+
+@contextmanager
+def query_budget(budget):
+    """Run the statements of this thread under a budget until exit"""
+    previous = get_query_budget()
+    set_query_budget(budget)
+    try:
+        yield
+    finally:
+        set_query_budget(previous)
+
+
+def record_timeout(budget, sql, elapsed):
+    with _lock:
+        stats = _timeouts.setdefault((budget.endpoint, sql), [0, 0.0])
+        stats[0] += 1
+        stats[1] = max(stats[1], elapsed)
+    events.warning(
+        "%s exceeded its %.1f s query budget",
+        budget.endpoint,
+        budget.seconds,
+        extra={
+            "endpoint": budget.endpoint,
+            "budget": budget.seconds,
+            "elapsed": elapsed,
+            "sql": sql[:MAX_LOGGED_SQL],
+        },
+    )
+
+
+def timeout_stats():
+    """Return the statements stopped by a budget, most often stopped first
+
+    Statements are identified by their SQL with placeholders, i.e. by shape.
+    """
+    with _lock:
+        return [
+            OrderedDict(
+                [
+                    ("endpoint", endpoint),
+                    ("sql", sql),
+                    ("timeouts", n),
+                    ("max_elapsed", elapsed),
+                ]
+            )
+            for (endpoint, sql), (n, elapsed) in sorted(
+                _timeouts.items(), key=lambda item: -item[1][0]
+            )
+        ]
+
+
+def enforce_query_budget(execute, sql, params, many, context):
+    """Execute wrapper stopping the SELECT statements of an exhausted budget
+
+    MySQL stops a statement itself once it has run for its time left, given
+    by the MAX_EXECUTION_TIME optimizer hint (MySQL 5.7.8 or later; MariaDB
+    ignores the hint), so that the server does not keep on running a query
+    whose request is gone.
+    """
+    budget = get_query_budget()
+    statement = sql.lstrip()
+    if budget is None or many or statement[:6].upper() != "SELECT":
+        return execute(sql, params, many, context)
+    left = budget.deadline - time.monotonic()
+    if left <= 0:
+        record_timeout(budget, sql, 0.0)
+        raise QueryTimeout()
+    hinted = "SELECT /*+ MAX_EXECUTION_TIME(%d) */%s" % (
+        max(int(left * 1000), 1),
+        statement[6:],
+    )
+    start = time.monotonic()
+    try:
+        return execute(hinted, params, many, context)
+    except OperationalError as e:
+        if e.args and e.args[0] in QUERY_INTERRUPTED:
+            record_timeout(budget, sql, time.monotonic() - start)
+            raise QueryTimeout() from e
+        raise
+
+
+def install_query_budget(sender, connection, **kwargs):
+    """Add `enforce_query_budget` to every new MySQL connection
+
+    It is inserted first, outside of any wrapper installed for a block.
+    """
+    if is_mysql(connection) and enforce_query_budget not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, enforce_query_budget)
+
+
+class ConcurrentQueries:
+    """Runs independent database work on a small pool of threads
+
+    Each pool thread has its own connections, which are kept open between
+    tasks. Work runs sequentially in the calling thread when the pool is
+    disabled (`CONCURRENT_QUERIES = 0`) or exhausted, inside an atomic
+    block, whose uncommitted state other connections could not see, and
+    within `sequential()`, e.g. while the profiler records the statements of
+    the calling thread.
+    """
+
+    # Idle pool connections are checked before being used again
+    ping_after = 60
+
+    def __init__(self, size):
+        self.size = size
+        self.slots = threading.BoundedSemaphore(max(size, 1))
+        self.lock = threading.Lock()
+        self.executor = None
+        self.local = threading.local()
+
+    def get_executor(self):
+        # Created on first use, i.e. in each worker after the fork
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    self.size, thread_name_prefix="queries"
+                )
+            return self.executor
+
+    @contextmanager
+    def sequential(self):
+        """Run the work of this thread in the calling thread until exit"""
+        previous = getattr(self.local, "sequential", False)
+        self.local.sequential = True
+        try:
+            yield
+        finally:
+            self.local.sequential = previous
+
+    def is_sequential(self):
+        return (
+            self.size < 1
+            or getattr(self.local, "sequential", False)
+            or any(c.in_atomic_block for c in connections.all())
+        )
+
+    def task(self, call, budget):
+        try:
+            now = time.monotonic()
+            if now - getattr(self.local, "used_at", now) > self.ping_after:
+                for connection in connections.all():
+                    if connection.connection is not None and not connection.is_usable():
+                        connection.close()
+            try:
+                with query_budget(budget):
+                    return call()
+            finally:
+                for connection in connections.all():
+                    if connection.errors_occurred:
+                        connection.close()
+                self.local.used_at = time.monotonic()
+        finally:
+            self.slots.release()
+
+    def run(self, *calls):
+        """Call every function and return their results, in order"""
+        if len(calls) < 2 or self.is_sequential():
+            return [call() for call in calls]
+        futures = []
+        # Pool threads share the budget of the calling thread
+        budget = get_query_budget()
+        for call in calls[1:]:
+            if self.slots.acquire(blocking=False):
+                futures.append(self.get_executor().submit(self.task, call, budget))
+            else:
+                futures.append(None)
+        # The calling thread runs the first call, and those left without a slot
+        results = [calls[0]()]
+        for call, future in zip(calls[1:], futures):
+            results.append(call() if future is None else future.result())
+        return results
+
+
+queries = ConcurrentQueries(settings.CONCURRENT_QUERIES)
+
+
+def fetch(queryset):
+    """Evaluate a queryset, running its prefetch lookups concurrently
+
+    Lookups starting from the same relation fill the caches of the same
+    related objects, so they are run together, in order.
+    """
+    groups = OrderedDict()
+    for lookup in queryset._prefetch_related_lookups:
+        through = getattr(lookup, "prefetch_through", lookup)
+        groups.setdefault(through.split(LOOKUP_SEP)[0], []).append(lookup)
+    if len(groups) < 2 or queries.is_sequential():
+        return list(queryset)
+    objects = list(queryset.prefetch_related(None))
+    for obj in objects:
+        obj.__dict__.setdefault("_prefetched_objects_cache", {})
+    queries.run(
+        *[
+            lambda group=group: prefetch_related_objects(objects, *group)
+            for group in groups.values()
+        ]
+    )
+    return objects
+
+
+def count_and_slice(queryset, start, stop):
+    """Return the count of a queryset and the list of its objects [start:stop]"""
+    if not isinstance(queryset, QuerySet):
+        return len(queryset), list(queryset[start:stop])
+    count, objects = queries.run(queryset.count, lambda: fetch(queryset[start:stop]))
+    return count, objects
@@ -0,0 +1,106 @@
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+
+def encode(data):
+    """Encode data as it is written in JSON responses"""
+    return JSONRenderer().render(data)
+
+
+class Fragment(Mapping):
+    """A serialized object kept as encoded JSON
+
+    The renderers write the encoded bytes as they are. The object is only
+    decoded when accessed as a mapping, e.g. by tests.
+    """
+
+    __slots__ = ("raw", "_value")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = json.loads(self.raw.decode("utf-8"))
+        return self._value
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+
+class FragmentCache:
+    """A least recently used cache of encoded objects bounded in bytes
+
+    One cache is kept per worker process. Keys include the data version so
+    that stale fragments are never served, and are evicted as new ones are
+    stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_many(self, keys):
+        """Return a dictionary of the cached values of keys"""
+        found = {}
+        with self.lock:
+            for key in keys:
+                value = self.entries.get(key)
+                if value is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = value
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return OrderedDict(
+            [
+                ("entries", len(self.entries)),
+                ("bytes", self.size),
+                ("max_bytes", self.max_bytes),
+                ("hits", self.hits),
+                ("misses", self.misses),
+            ]
+        )
+
+
+cache = FragmentCache(settings.FRAGMENT_CACHE_MAX_BYTES)
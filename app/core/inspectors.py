@@ -168,6 +168,30 @@ class StandardPaginatorInspector(inspectors.DjangoRestResponsePagination):
                 minimum=1,
                 maximum=paginator.max_page_size,
                 default=settings.REST_FRAMEWORK["PAGE_SIZE"],
+                description="Number of objects per page, up to %d with the columnar "
+                "format or when streaming."
+                % max(
+                    paginator.columnar_max_page_size, paginator.streaming_max_page_size
+                ),
+            ),
+            openapi.Parameter(
+                paginator.stream_query_param,
+                "query",
+                type=openapi.TYPE_BOOLEAN,
+                default=False,
+                description="Stream the JSON page while its objects are read, "
+                "for large pages.",
+            ),
+            openapi.Parameter(
+                "format",
+                "query",
+                type=openapi.TYPE_STRING,
+                enum=["json", "columnar"],
+                default="json",
+                description="With 'columnar', data is an object of columns instead "
+                "of a list of objects. The objects of nested lists are flattened into "
+                "columns along with 'offsets': the items of row i run from offsets[i] "
+                "to offsets[i + 1].",
             ),
         ]
 
@@ -0,0 +1,179 @@
+"""Read-only lookup tables shared by the workers through a memory map
+
+A lookup file is an array file (see `app.core.arrayfile`) holding tables of
+sorted keys, integers or strings, and of the columns of every key:
+
+    <table>.keys              the sorted keys, int64 or fixed width bytes
+    <table>.<column>          "int" columns: one int64 value per key
+    <table>.<column>.offsets  "str" and "list" columns: the value of key i is
+    <table>.<column>          values[offsets[i]:offsets[i + 1]], UTF-8 bytes
+                              or int64 values
+    <table>.<column>.null     "int" and "str" columns: whether a value is None
+
+Keys are found by binary search, so that a file built once is read in place
+by every worker, its pages being shared by the operating system.
+"""
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import numpy as np
+
+from app.core.arrayfile import MappedFile, write_arrays
+
+KINDS = ("int", "str", "list")
+
+
+def column_arrays(name, kind, values):
+    """Return the arrays of a column of values sorted by key"""
+    arrays = OrderedDict()
+    if kind == "int":
+        arrays[name] = np.array([0 if v is None else v for v in values], np.int64)
+    elif kind == "str":
+        data = [b"" if v is None else str(v).encode() for v in values]
+        arrays[name + ".offsets"] = offsets(len(d) for d in data)
+        arrays[name] = np.frombuffer(b"".join(data), dtype=np.uint8)
+    elif kind == "list":
+        arrays[name + ".offsets"] = offsets(len(v) for v in values)
+        arrays[name] = np.array([x for v in values for x in v], dtype=np.int64)
+    else:
+        raise ValueError("Unknown column kind %r." % kind)
+    if kind != "list":
+        arrays[name + ".null"] = np.array([v is None for v in values], dtype=bool)
+    return arrays
+
+
+def offsets(lengths):
+    lengths = np.fromiter(lengths, dtype=np.int64)
+    out = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=out[1:])
+    return out
+
+
+def write_lookups(path, tables, meta=None):
+    """Write lookup tables, replacing path atomically
+
+    `tables` maps table names to (columns, rows), where `columns` is a list
+    of (name, kind) and every row is a key followed by a value per column.
+    Keys are unique integers or strings.
+    """
+    arrays = OrderedDict()
+    layout = OrderedDict()
+    for table, (columns, rows) in tables.items():
+        rows = sorted(rows, key=lambda row: row[0])
+        keys = [row[0] for row in rows]
+        if keys and isinstance(keys[0], str):
+            arrays[table + ".keys"] = np.array([k.encode() for k in keys], dtype="S")
+        else:
+            arrays[table + ".keys"] = np.array(keys, dtype=np.int64)
+        for n, (column, kind) in enumerate(columns, 1):
+            values = [row[n] for row in rows]
+            arrays.update(column_arrays("%s.%s" % (table, column), kind, values))
+        layout[table] = OrderedDict(columns)
+    write_arrays(path, arrays, dict(meta or {}, tables=layout))
+
+
+class Strings(Sequence):
+    """A "str" column of an array file, decoded on access
+
+    Columns of sorted values can be searched with `bisect`.
+    """
+
+    def __init__(self, arrays, name):
+        self.offsets = arrays[name + ".offsets"]
+        self.values = arrays[name]
+        self.null = arrays[name + ".null"]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, n):
+        if self.null[n]:
+            return None
+        return self.values[self.offsets[n] : self.offsets[n + 1]].tobytes().decode()
+
+
+class Table:
+    """A lookup table of a lookup file"""
+
+    def __init__(self, arrays, name, columns):
+        self.arrays = arrays
+        self.name = name
+        self.columns = columns
+        self.keys = arrays[name + ".keys"]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def position(self, key):
+        """Return the position of a key, None if it is not in the table"""
+        if self.keys.dtype.kind == "S":
+            if not isinstance(key, str):
+                return None
+            key = key.encode()
+        else:
+            try:
+                key = int(key)
+            except (TypeError, ValueError):
+                return None
+        n = np.searchsorted(self.keys, key)
+        if n < len(self.keys) and self.keys[n] == key:
+            return int(n)
+        return None
+
+    def value(self, n, column):
+        """Return the value of a column at a position"""
+        kind = self.columns[column]
+        name = "%s.%s" % (self.name, column)
+        if kind != "list" and self.arrays[name + ".null"][n]:
+            return None
+        if kind == "int":
+            return int(self.arrays[name][n])
+        offsets = self.arrays[name + ".offsets"]
+        values = self.arrays[name][offsets[n] : offsets[n + 1]]
+        return values.tobytes().decode() if kind == "str" else values.tolist()
+
+    def get(self, key, column, default=None):
+        """Return the value of a column for a key, default if it is missing"""
+        n = self.position(key)
+        return default if n is None else self.value(n, column)
+
+
+class Lookups:
+    """The tables of a lookup file, by name"""
+
+    def __init__(self, arrays):
+        self.meta = arrays.meta
+        self.tables = {
+            name: Table(arrays, name, columns)
+            for name, columns in arrays.meta["tables"].items()
+        }
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def __contains__(self, name):
+        return name in self.tables
+
+
+class LookupFile:
+    """A lookup file, reopened whenever it has been replaced
+
+    `get(version)` returns the tables, or None while the file does not exist
+    or was built from another data version than `version`, in which case the
+    caller reads the database instead.
+    """
+
+    def __init__(self, path):
+        self.file = MappedFile(path)
+        self.arrays = None
+        self.value = None
+
+    def get(self, version=None):
+        arrays = self.file.get()
+        if arrays is None:
+            return None
+        if arrays is not self.arrays:
+            self.value, self.arrays = Lookups(arrays), arrays
+        if version is not None and self.value.meta.get("data_version") != version:
+            return None
+        return self.value
@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from app.core import prewarm
+from app.core.middleware import get_endpoint
+
+logger = logging.getLogger("django")
+
+# Structured per-request records, shipped to logstash as metrics
+metrics = logging.getLogger("app.memory")
+
+STATM = "/proc/self/statm"
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# The gunicorn worker of this process, set by the post_fork hook
+worker = None
+
+_lock = threading.Lock()
+_endpoint_stats = {}
+
+
+def get_rss():
+    """Return the resident set size of this process in bytes"""
+    with open(STATM) as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def record(endpoint, growth):
+    with _lock:
+        stats = _endpoint_stats.setdefault(endpoint, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += growth
+        stats[2] = max(stats[2], growth)
+
+
+def endpoint_stats():
+    """Return the requests, total and largest RSS growth of each endpoint"""
+    with _lock:
+        return OrderedDict(
+            (
+                endpoint,
+                OrderedDict(
+                    [("requests", n), ("rss_growth", total), ("max_rss_growth", top)]
+                ),
+            )
+            for endpoint, (n, total, top) in sorted(
+                _endpoint_stats.items(), key=lambda item: -item[1][1]
+            )
+        )
+
+
+class MemoryMiddleware:
+    """Accounts the RSS growth of each request and recycles bloated workers
+
+    Every request logs its endpoint, RSS and RSS growth to `app.memory`.
+    The requests of the pre-warmer, and the live requests served while it
+    ran one, are not accounted, as the RSS growth is that of the process.
+    Once the RSS of a gunicorn worker exceeds `WORKER_MAX_RSS`, the worker
+    is told to exit after the current response and is replaced by the
+    arbiter.
+    """
+
+    def __init__(self, get_response):
+        if not os.path.exists(STATM):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.META.get(prewarm.PREWARM_ENVIRON):
+            return self.get_response(request)
+        warming = prewarm.get_warming()
+        before = get_rss()
+        response = self.get_response(request)
+        rss = get_rss()
+        if not prewarm.warmed_since(warming):
+            self.account(request, rss, max(rss - before, 0))
+        if settings.WORKER_MAX_RSS and rss > settings.WORKER_MAX_RSS:
+            self.recycle(rss)
+        return response
+
+    def account(self, request, rss, growth):
+        endpoint = get_endpoint(request)
+        record(endpoint, growth)
+        metrics.info(
+            "%s grew RSS by %d bytes",
+            endpoint,
+            growth,
+            extra={"endpoint": endpoint, "rss": rss, "rss_growth": growth},
+        )
+        if growth > settings.MEMORY_LOG_GROWTH:
+            logger.warning(
+                "%s %s grew RSS by %.1f MiB to %.1f MiB",
+                endpoint,
+                request.get_full_path(),
+                growth / 2 ** 20,
+                rss / 2 ** 20,
+            )
+
+    def recycle(self, rss):
+        if worker is None or not worker.alive:
+            return
+        logger.warning(
+            "Recycling worker %d at %.1f MiB RSS, growth by endpoint: %s",
+            os.getpid(),
+            rss / 2 ** 20,
+            dict((e, s["rss_growth"]) for e, s in endpoint_stats().items()),
+        )
+        # The worker finishes the current request before exiting
+        worker.alive = False
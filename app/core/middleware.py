@@ -0,0 +1,276 @@
+import gzip
+import hashlib
+import os
+import re
+import zlib
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import MissingFileError
+from whitenoise.string_utils import ensure_leading_trailing_slash
+
+from app.core.dataversion import get_data_version, get_derived_version
+from app.core.db import get_query_budget, is_mysql, make_query_budget, set_query_budget
+from app.core.fragments import FragmentCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def get_endpoint(request):
+    """Name a request by its method and URL name, e.g. `GET product-list`"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        name = "unresolved"
+    else:
+        name = match.view_name or match._func_path
+    return "%s %s" % (request.method, name)
+
+
+class SnapshotWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise middleware that also serves the published dataset snapshots
+
+    Snapshots are published while the workers are running, so unlike the
+    collected static files they are looked up on disk for every request.
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.snapshot_root = os.path.abspath(settings.SNAPSHOT_ROOT)
+        self.snapshot_prefix = ensure_leading_trailing_slash(
+            urlparse(settings.SNAPSHOT_URL).path
+        )
+
+    def process_request(self, request):
+        if request.path_info.startswith(self.snapshot_prefix):
+            static_file = self.find_snapshot_file(request.path_info)
+            if static_file is not None:
+                return self.serve(static_file, request)
+        return super().process_request(request)
+
+    def find_snapshot_file(self, url):
+        if url.endswith("/") or not self.url_is_canonical(url):
+            return None
+        path = os.path.join(self.snapshot_root, url[len(self.snapshot_prefix) :])
+        try:
+            return self.get_static_file(path, url)
+        except MissingFileError:
+            return None
+
+    def immutable_file_test(self, path, url):
+        """Files inside a versioned snapshot directory never change"""
+        if url.startswith(self.snapshot_prefix):
+            return not url[len(self.snapshot_prefix) :].startswith("latest/")
+        return super().immutable_file_test(path, url)
+
+
+def parse_accept_encoding(header):
+    """Return the codings accepted by an Accept-Encoding header with their weights"""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware:
+    """Compresses API responses with brotli (when installed) or gzip
+
+    Compressed bodies are cached per worker by the digest of the response
+    body, so a page served repeatedly, e.g. assembled from the fragment
+    cache, is compressed only once. Streamed pages are compressed as they
+    are sent, files are left to WhiteNoise.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = settings.COMPRESSION_MIN_SIZE
+        self.cache = FragmentCache(settings.COMPRESSION_CACHE_MAX_BYTES)
+        self.codings = {"gzip": self.compress_gzip}
+        if brotli is not None:
+            self.codings["br"] = self.compress_brotli
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.is_compressible(response):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        coding = self.select_coding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if coding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = self.compress_stream(
+                coding, response.streaming_content
+            )
+            if response.has_header("Content-Length"):
+                del response["Content-Length"]
+        else:
+            if len(response.content) < self.min_size:
+                return response
+            content = self.compress(coding, response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = coding
+        if response.has_header("ETag"):
+            # The compressed body is only semantically equivalent
+            response["ETag"] = re.sub(r'^"', 'W/"', response["ETag"])
+        return response
+
+    def is_compressible(self, response):
+        return (
+            not isinstance(response, FileResponse)
+            and response.status_code == 200
+            and not response.has_header("Content-Encoding")
+            and response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES)
+        )
+
+    def select_coding(self, header):
+        """Return the preferred coding accepted by the client, if any"""
+        accepted = parse_accept_encoding(header)
+        best, best_quality = None, 0.0
+        # Listed by order of preference on equal weights
+        for coding in ("br", "gzip"):
+            if coding not in self.codings:
+                continue
+            quality = accepted.get(coding, accepted.get("*", 0.0))
+            if quality > best_quality:
+                best, best_quality = coding, quality
+        return best
+
+    def compress(self, coding, content):
+        key = (coding, hashlib.sha1(content).digest())
+        compressed = self.cache.get_many([key]).get(key)
+        if compressed is None:
+            compressed = self.codings[coding](content)
+            self.cache.set(key, compressed)
+        return compressed
+
+    def compress_gzip(self, content):
+        return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL)
+
+    def compress_brotli(self, content):
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_LEVEL)
+
+    def compress_stream(self, coding, content):
+        """Compress a streamed body as it is produced"""
+        if coding == "br":
+            compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_LEVEL)
+            process, finish = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(
+                settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+            process, finish = compressor.compress, compressor.flush
+        for chunk in content:
+            data = process(chunk)
+            if data:
+                yield data
+        yield finish()
+
+
+class DataVersionETagMiddleware:
+    """Tags GET responses with an ETag derived from the data version
+
+    The tag depends only on the data version, the version of the derived
+    tables and index files, the URL and the Accept header, so revalidations
+    of unchanged data are answered with 304 Not Modified before the view
+    runs.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_etag(self, request):
+        key = "%s|%s|%s|%s" % (
+            get_data_version(),
+            get_derived_version(),
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+        )
+        return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+    def __call__(self, request):
+        if request.method not in ("GET", "HEAD") or request.path.startswith(
+            tuple(settings.DATA_VERSION_ETAG_EXCLUDE)
+        ):
+            return self.get_response(request)
+        etag = self.get_etag(request)
+        matches = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if etag in (re.sub(r"^W/", "", m.strip()) for m in matches.split(",")):
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            patch_vary_headers(response, ("Accept",))
+            return response
+        response = self.get_response(request)
+        if response.status_code == 200 and not response.has_header("ETag"):
+            response["ETag"] = etag
+            patch_vary_headers(response, ("Accept",))
+        return response
+
+
+class QueryBudgetMiddleware:
+    """Bounds the time the database spends on the statements of a request
+
+    The budget is the `query_budget` attribute of the view class, in seconds,
+    or `QUERY_BUDGET`, 0 meaning no budget. SELECT statements still running
+    when it is spent are stopped by MySQL, and the request is answered with
+    503 Service Unavailable, see `app.core.db.enforce_query_budget`. Other
+    databases are not bounded. Streamed bodies, which run their queries
+    while they are sent, keep the budget until they are closed.
+    """
+
+    def __init__(self, get_response):
+        if not any(is_mysql(connections[alias]) for alias in connections):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Left by a streamed body which was never read
+        set_query_budget(None)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            set_query_budget(None)
+            raise
+        if (
+            response.streaming
+            and get_query_budget() is not None
+            and getattr(response, "file_to_stream", None) is None
+        ):
+            response.streaming_content = self.stream(response.streaming_content)
+        else:
+            set_query_budget(None)
+        return response
+
+    def stream(self, content):
+        try:
+            yield from content
+        finally:
+            set_query_budget(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        seconds = getattr(getattr(view_func, "cls", None), "query_budget", None)
+        if seconds is None:
+            seconds = settings.QUERY_BUDGET
+        if seconds:
+            set_query_budget(make_query_budget(seconds, get_endpoint(request)))
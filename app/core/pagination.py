@@ -1,15 +1,75 @@
 from collections import OrderedDict
 
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.http import StreamingHttpResponse
+from rest_framework.pagination import PageNumberPagination, _positive_int
 from rest_framework.response import Response
 from rest_framework.utils.urls import remove_query_param, replace_query_param
 
+from app.core.db import count_and_slice
+from app.core.fragments import encode
+
+# Streamed rows are written in blocks of about this size
+STREAM_BLOCK_SIZE = 64 * 1024
+
+STREAM_ERROR = "The page could not be completed."
+
+
+class ConcurrentPaginator(Paginator):
+    """Paginator running the count and page queries concurrently"""
+
+    def page(self, number):
+        if "count" in self.__dict__ or not str(number).isdigit() or int(number) < 1:
+            return super().page(number)
+        bottom = (int(number) - 1) * self.per_page
+        count, objects = count_and_slice(
+            self.object_list, bottom, bottom + self.per_page
+        )
+        self.__dict__["count"] = count
+        page = super().page(number)
+        page.object_list = objects
+        return page
+
 
 class StandardPagination(PageNumberPagination):
     """The pagination schema to attach to all paginated responses"""
 
+    django_paginator_class = ConcurrentPaginator
+
     page_size_query_param = "page_size"
     max_page_size = 500
+    # Columnar pages repeat no key names, so larger pages are allowed
+    columnar_max_page_size = 5000
+    # Streamed pages are never held in memory, so larger pages are allowed
+    stream_query_param = "stream"
+    streaming_max_page_size = 5000
+
+    def is_streaming(self, request):
+        """Whether the JSON page is streamed, with `?stream=true`"""
+        renderer = getattr(request, "accepted_renderer", None)
+        return getattr(renderer, "format", None) == "json" and request.query_params.get(
+            self.stream_query_param
+        ) in ("true", "1")
+
+    def get_max_page_size(self, request):
+        renderer = getattr(request, "accepted_renderer", None)
+        if getattr(renderer, "format", None) == "columnar":
+            return self.columnar_max_page_size
+        if self.is_streaming(request):
+            return self.streaming_max_page_size
+        return self.max_page_size
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.get_max_page_size(request),
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
 
     def get_page_link(self, page_number, url=None):
         """Return a hyperlink to a given page"""
@@ -19,8 +79,7 @@ class StandardPagination(PageNumberPagination):
             return remove_query_param(url, self.page_query_param)
         return replace_query_param(url, self.page_query_param, page_number)
 
-    def get_paginated_response(self, data):
-        """Return the JSON payload"""
+    def get_paging(self):
         page = self.page.number
         pages = self.page.paginator.num_pages
         links = OrderedDict(
@@ -32,8 +91,7 @@ class StandardPagination(PageNumberPagination):
                 ("previous", self.get_previous_link()),
             ]
         )
-        meta = OrderedDict([("count", self.page.paginator.count)])
-        paging = OrderedDict(
+        return OrderedDict(
             [
                 ("links", links),
                 ("page", page),
@@ -41,5 +99,43 @@ class StandardPagination(PageNumberPagination):
                 ("size", len(self.page)),
             ]
         )
-        out = OrderedDict([("paging", paging), ("data", data), ("meta", meta)])
+
+    def get_meta(self):
+        return OrderedDict([("count", self.page.paginator.count)])
+
+    def get_paginated_response(self, data):
+        """Return the JSON payload"""
+        out = OrderedDict(
+            [("paging", self.get_paging()), ("data", data), ("meta", self.get_meta())]
+        )
         return Response(out)
+
+    def get_streaming_response(self, rows):
+        """Return the JSON payload of a page of encoded rows as a stream
+
+        `rows` is an iterable of JSON encoded objects, consumed while the
+        response is sent. The status has been sent by then, so an error while
+        streaming ends the payload with an `error` member instead of `meta`,
+        and is raised again for the server to abort the connection.
+        """
+        head = b'{"paging":' + encode(self.get_paging()) + b',"data":['
+        tail = b'],"meta":' + encode(self.get_meta()) + b"}"
+
+        def stream():
+            yield head
+            block, size = [], 0
+            try:
+                for n, row in enumerate(rows):
+                    block.append(b"," + row if n else row)
+                    size += len(row)
+                    if size >= STREAM_BLOCK_SIZE:
+                        yield b"".join(block)
+                        block, size = [], 0
+            except Exception:
+                block.append(b'],"error":' + encode({"detail": STREAM_ERROR}) + b"}")
+                yield b"".join(block)
+                raise
+            block.append(tail)
+            yield b"".join(block)
+
+        return StreamingHttpResponse(stream(), content_type="application/json")
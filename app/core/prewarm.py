@@ -0,0 +1,449 @@
+import fcntl
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.servers.basehttp import get_internal_wsgi_application
+
+from app.core.dataversion import get_data_version
+
+logger = logging.getLogger("app.prewarm")
+
+# Set in the WSGI environ of the requests made by the pre-warmer, which are
+# not counted
+PREWARM_ENVIRON = "factotum_ws.prewarm"
+
+# Query parameters which do not change the response
+IGNORED_PARAMETERS = ("profile",)
+
+MAX_KEY_LENGTH = 1024
+
+MERGED = "merged.json"
+
+WINDOW_RE = re.compile(r"^\d+-.+-\d+\.json$")
+
+
+# Live requests being served by this worker
+_in_flight = [0]
+# Pre-warming requests being served by this worker, and started so far
+_warming = [0, 0]
+_lock = threading.Lock()
+
+_prewarmer = None
+
+
+class TopK:
+    """Approximate counts of the most frequent keys, using Space-Saving
+
+    At most `size` keys are counted. An uncounted key replaces the least
+    counted one and inherits its count, which is kept as the error of the
+    key: the true count of a key lies between its count minus its error and
+    its count, and every key counted more than the total divided by `size`
+    is kept.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.counts = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key, count=1):
+        with self.lock:
+            if key in self.counts:
+                self.counts[key] += count
+            elif len(self.counts) < self.size:
+                self.counts[key] = count
+                self.errors[key] = 0
+            else:
+                least = min(self.counts, key=self.counts.get)
+                floor = self.counts.pop(least)
+                del self.errors[least]
+                self.counts[key] = floor + count
+                self.errors[key] = floor
+
+    def merge(self, rows):
+        """Add the (key, count, error) rows of another sketch
+
+        Counts and errors of the keys of both sketches are summed, and only
+        the `size` most counted keys are kept.
+        """
+        with self.lock:
+            for key, count, error in rows:
+                self.counts[key] = self.counts.get(key, 0) + count
+                self.errors[key] = self.errors.get(key, 0) + error
+            if len(self.counts) > self.size:
+                kept = sorted(self.counts, key=self.counts.get, reverse=True)
+                for key in kept[self.size :]:
+                    del self.counts[key]
+                    del self.errors[key]
+
+    def decay(self, factor):
+        with self.lock:
+            for key in self.counts:
+                self.counts[key] *= factor
+                self.errors[key] *= factor
+
+    def rows(self):
+        """Return the (key, count, error) of the keys, most counted first"""
+        with self.lock:
+            rows = [(k, c, self.errors[k]) for k, c in self.counts.items()]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+    def top(self, n):
+        return [key for key, _, _ in self.rows()[:n]]
+
+    def reset(self):
+        """Clear the sketch, returning its rows"""
+        rows = self.rows()
+        with self.lock:
+            self.counts, self.errors = {}, {}
+        return rows
+
+
+def normalize_key(request):
+    """Return the key of a request whose response can be pre-warmed
+
+    Keys are the path and the sorted query parameters of GET requests for
+    an object or the first page of a list, e.g.
+    `/products/?chemical=DTXSID9022528`. Other requests have no key.
+    """
+    if request.method != "GET" or request.path.startswith(
+        tuple(settings.DATA_VERSION_ETAG_EXCLUDE)
+    ):
+        return None
+    params = []
+    for name, values in sorted(request.GET.lists()):
+        if name in IGNORED_PARAMETERS:
+            continue
+        if name == "page":
+            if values != ["1"]:
+                return None
+            continue
+        if name == "stream":
+            return None
+        params.extend((name, value) for value in sorted(values))
+    key = request.path_info
+    if params:
+        key += "?" + urlencode(params)
+    return key if len(key) <= MAX_KEY_LENGTH else None
+
+
+def dump_name(timestamp, pid=None):
+    return "%d-%s-%d.json" % (timestamp, socket.gethostname(), pid or os.getpid())
+
+
+def write_rows(path, rows, **meta):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(meta, keys=rows), f)
+    os.replace(tmp, path)
+
+
+def read_rows(path):
+    """Return the rows and the other contents of a sketch file"""
+    with open(path) as f:
+        data = json.load(f)
+    return [tuple(row) for row in data.pop("keys")], data
+
+
+def merge_windows(directory, size, half_life, now=None):
+    """Fold the windows dumped by the workers into the merged sketch
+
+    The counts of the merged sketch are halved every `half_life` seconds
+    before the windows are added, so that it follows the current traffic,
+    and the windows are removed. Returns False when another process is
+    merging.
+    """
+    now = time.time() if now is None else now
+    with open(os.path.join(directory, ".merge.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        sketch = TopK(size)
+        path = os.path.join(directory, MERGED)
+        try:
+            rows, meta = read_rows(path)
+        except (OSError, ValueError):
+            pass
+        else:
+            sketch.merge(rows)
+            sketch.decay(0.5 ** (max(now - meta.get("updated", now), 0) / half_life))
+        windows = [
+            os.path.join(directory, name)
+            for name in sorted(os.listdir(directory))
+            if WINDOW_RE.match(name)
+        ]
+        for window in windows:
+            try:
+                sketch.merge(read_rows(window)[0])
+            except (OSError, ValueError):
+                logger.warning("Could not read the request keys of %s", window)
+        write_rows(path, sketch.rows(), updated=now)
+        for window in windows:
+            os.remove(window)
+    return True
+
+
+def read_hot_keys(directory, n):
+    """Return the `n` most requested keys of the merged sketch"""
+    try:
+        rows, _ = read_rows(os.path.join(directory, MERGED))
+    except (OSError, ValueError):
+        return []
+    sketch = TopK(len(rows))
+    sketch.merge(rows)
+    return sketch.top(n)
+
+
+def make_environ(key):
+    path, _, query = key.partition("?")
+    return {
+        "REQUEST_METHOD": "GET",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": settings.PREWARM_HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_ACCEPT_ENCODING": "br, gzip",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        PREWARM_ENVIRON: True,
+    }
+
+
+def wait_idle(version):
+    """Wait for the live requests of the worker to end
+
+    Returns False if the data version changes meanwhile. A busy worker
+    warms its caches with its live requests instead.
+    """
+    while _in_flight[0]:
+        if get_data_version() != version:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def get_warming():
+    """Return a marker of the pre-warming requests, see `warmed_since`"""
+    with _lock:
+        return tuple(_warming)
+
+
+def warmed_since(marker):
+    """Whether a pre-warming request ran since `get_warming` returned marker"""
+    active, started = marker
+    with _lock:
+        return active > 0 or _warming[1] != started
+
+
+def slot_name(slot):
+    return ".slot-%s-%d.lock" % (socket.gethostname(), slot)
+
+
+def claim_slot(directory):
+    """Lock the first free worker slot of the host
+
+    Returns the slot and its open lock file, which must be kept open: the
+    slot is released when the worker exits.
+    """
+    for slot in itertools.count():
+        f = open(os.path.join(directory, slot_name(slot)), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+        else:
+            return slot, f
+
+
+def held_slots(directory, own):
+    """Return the slots locked by the workers of the host, in order"""
+    slots = []
+    slot_re = re.compile(r"^\.slot-%s-(\d+)\.lock$" % re.escape(socket.gethostname()))
+    for name in os.listdir(directory):
+        match = slot_re.match(name)
+        if match is None:
+            continue
+        slot = int(match.group(1))
+        if slot != own:
+            with open(os.path.join(directory, name)) as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    continue
+        slots.append(slot)
+    return sorted(slots)
+
+
+class Prewarmer(threading.Thread):
+    """A daemon thread warming the caches of the worker for the hot requests
+
+    The request keys counted by `PrewarmMiddleware` are dumped to
+    `directory` every `dump_interval` seconds and merged with those of the
+    other workers. When the worker starts and whenever the data version
+    changes, the `keys` most requested keys are requested again through the
+    middleware stack, at most `rate` per second and while the worker serves
+    no live request. The keys are shared between the workers of the host,
+    each holding a slot (see `claim_slot`), so that every key is requested
+    once per host: the database and the index files are warmed for all the
+    workers, and the fragment and compression caches of each worker for its
+    share.
+    """
+
+    def __init__(self, sketch, directory, keys, rate, dump_interval, half_life):
+        super().__init__(name="prewarmer", daemon=True)
+        self.sketch = sketch
+        self.directory = directory
+        self.keys = keys
+        self.interval = 1.0 / rate
+        self.dump_interval = dump_interval
+        self.half_life = half_life
+        # The application served by the worker, sharing its middleware caches
+        self.handler = get_internal_wsgi_application()
+        self.version = None
+        self.slot, self.slot_file = None, None
+
+    def dump(self):
+        rows = self.sketch.reset()
+        try:
+            if rows:
+                path = os.path.join(self.directory, dump_name(time.time()))
+                write_rows(path, rows)
+            merge_windows(self.directory, self.sketch.size, self.half_life)
+        except OSError:
+            logger.exception("Could not write request keys to %s", self.directory)
+
+    def request(self, key):
+        with _lock:
+            _warming[0] += 1
+            _warming[1] += 1
+        try:
+            response = self.handler(make_environ(key), lambda status, headers: None)
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+        finally:
+            with _lock:
+                _warming[0] -= 1
+        return response.status_code
+
+    def get_share(self, keys):
+        """Return the keys this worker warms"""
+        slots = held_slots(self.directory, self.slot)
+        return keys[slots.index(self.slot) :: len(slots)]
+
+    def warm(self, version):
+        """Request the hot keys, False if the data version changed meanwhile"""
+        start = time.monotonic()
+        keys = self.get_share(read_hot_keys(self.directory, self.keys))
+        for n, key in enumerate(keys):
+            if not wait_idle(version) or get_data_version() != version:
+                return False
+            try:
+                status = self.request(key)
+            except Exception:
+                logger.exception("Could not pre-warm %s", key)
+            else:
+                if status != 200:
+                    logger.warning("Pre-warming %s returned %d", key, status)
+            if n + 1 < len(keys):
+                time.sleep(self.interval)
+        logger.info(
+            "Pre-warmed %d requests in %.1fs", len(keys), time.monotonic() - start
+        )
+        return True
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.slot, self.slot_file = claim_slot(self.directory)
+        next_dump = time.monotonic() + self.dump_interval
+        while True:
+            try:
+                version = get_data_version()
+                if version != self.version and self.warm(version):
+                    self.version = version
+            except Exception:
+                logger.exception("Could not pre-warm the caches")
+            time.sleep(settings.DATA_VERSION_TTL)
+            if time.monotonic() >= next_dump:
+                self.dump()
+                next_dump = time.monotonic() + self.dump_interval
+
+
+sketch = TopK(settings.PREWARM_SKETCH_SIZE)
+
+
+def start():
+    """Start the pre-warmer of this process when `PREWARM_KEYS` is set
+
+    Called by each gunicorn worker after it is forked.
+    """
+    global _prewarmer
+    if not settings.PREWARM_KEYS or (_prewarmer is not None and _prewarmer.is_alive()):
+        return
+    _prewarmer = Prewarmer(
+        sketch,
+        settings.PREWARM_ROOT,
+        settings.PREWARM_KEYS,
+        settings.PREWARM_RATE,
+        settings.PREWARM_DUMP_INTERVAL,
+        settings.PREWARM_HALF_LIFE,
+    )
+    _prewarmer.start()
+
+
+class PrewarmMiddleware:
+    """Counts the keys of the requests served, see `normalize_key`
+
+    Successful and revalidated responses are counted, the requests made by
+    the pre-warmer are not. Live requests are tracked so that the
+    pre-warmer waits for them.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PREWARM_KEYS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.META.get(PREWARM_ENVIRON):
+            return self.get_response(request)
+        with _lock:
+            _in_flight[0] += 1
+        try:
+            response = self.get_response(request)
+        finally:
+            with _lock:
+                _in_flight[0] -= 1
+        if response.status_code in (200, 304):
+            key = normalize_key(request)
+            if key is not None:
+                sketch.add(key)
+        return response
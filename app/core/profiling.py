@@ -0,0 +1,243 @@
+import cProfile
+import hmac
+import pstats
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+from app.core import db, fragments
+
+TOP_FUNCTIONS = 40
+
+MAX_EXPLAINED = 50
+
+_local = threading.local()
+_patch_lock = threading.Lock()
+_patch_users = [0]
+_original_to_representation = serializers.Serializer.to_representation
+
+
+def timed_to_representation(self, instance):
+    """`Serializer.to_representation` recording the time spent on each field
+
+    The time of a nested serializer field includes its own fields.
+    """
+    timings = getattr(_local, "field_timings", None)
+    if timings is None:
+        return _original_to_representation(self, instance)
+    ret = OrderedDict()
+    for field in self._readable_fields:
+        start = time.perf_counter()
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            continue
+        check_for_none = (
+            attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        )
+        if check_for_none is None:
+            ret[field.field_name] = None
+        else:
+            ret[field.field_name] = field.to_representation(attribute)
+        timing = timings[(type(self).__name__, field.field_name, field.source)]
+        timing[0] += 1
+        timing[1] += time.perf_counter() - start
+    return ret
+
+
+def patch_serializers():
+    with _patch_lock:
+        if _patch_users[0] == 0:
+            serializers.Serializer.to_representation = timed_to_representation
+        _patch_users[0] += 1
+
+
+def unpatch_serializers():
+    with _patch_lock:
+        _patch_users[0] -= 1
+        if _patch_users[0] == 0:
+            serializers.Serializer.to_representation = _original_to_representation
+
+
+class QueryRecorder:
+    """Database execute wrapper recording every statement and its time"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "database": self.alias,
+                    "sql": sql,
+                    "params": params if not many else None,
+                    "time": time.perf_counter() - start,
+                }
+            )
+
+
+def explain(query):
+    """Return the query plan of a recorded SELECT statement, if possible"""
+    if not query["sql"].lstrip().upper().startswith("SELECT"):
+        return None
+    connection = connections[query["database"]]
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + query["sql"], query["params"])
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def get_top_functions(profiler, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [
+        OrderedDict(
+            [
+                ("function", "%s:%d(%s)" % key),
+                ("calls", calls),
+                ("total_time", total_time),
+                ("cumulative_time", cumulative_time),
+            ]
+        )
+        for key, (_, calls, total_time, cumulative_time, _) in rows[:limit]
+    ]
+
+
+class ProfilingMiddleware:
+    """Profiles a request for operators holding the profiling secret
+
+    A request carrying `PROFILE_SECRET` in the `profile` query parameter or
+    the `X-Profile` header is run under cProfile, and a JSON report of the
+    top functions, SQL statements with their plans, serializer field times
+    and rendering time is returned instead of the response. The middleware
+    is removed from the stack when no secret is configured.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_SECRET:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.secret = settings.PROFILE_SECRET.encode()
+
+    def __call__(self, request):
+        token = request.GET.get("profile") or request.META.get("HTTP_X_PROFILE")
+        if not token or not hmac.compare_digest(token.encode(), self.secret):
+            return self.get_response(request)
+        return self.profile(request)
+
+    def profile(self, request):
+        recorders = [QueryRecorder(c.alias) for c in connections.all()]
+        wrappers = [c.execute_wrapper(r) for c, r in zip(connections.all(), recorders)]
+        field_timings = defaultdict(lambda: [0, 0.0])
+        fragment_stats = fragments.cache.stats()
+        profiler = cProfile.Profile()
+        patch_serializers()
+        _local.field_timings = field_timings
+        start = time.perf_counter()
+        try:
+            for wrapper in wrappers:
+                wrapper.__enter__()
+            profiler.enable()
+            try:
+                # The recorders and profiler only see the calling thread
+                with db.queries.sequential():
+                    response = self.get_response(request)
+                    # A streamed body runs its queries and serializers as it
+                    # is read, so it is read here
+                    if response.streaming:
+                        size = sum(len(c) for c in response.streaming_content)
+                        response.close()
+                    else:
+                        size = len(response.content)
+            finally:
+                profiler.disable()
+                for wrapper in reversed(wrappers):
+                    wrapper.__exit__(None, None, None)
+        finally:
+            elapsed = time.perf_counter() - start
+            _local.field_timings = None
+            unpatch_serializers()
+        return JsonResponse(
+            self.get_report(
+                response,
+                size,
+                elapsed,
+                profiler,
+                recorders,
+                field_timings,
+                fragment_stats,
+            ),
+            json_dumps_params={"indent": 2, "default": str},
+        )
+
+    def get_report(
+        self,
+        response,
+        size,
+        elapsed,
+        profiler,
+        recorders,
+        field_timings,
+        fragment_stats,
+    ):
+        queries = [q for r in recorders for q in r.queries]
+        for n, query in enumerate(queries):
+            query["plan"] = explain(query) if n < MAX_EXPLAINED else None
+        fields = [
+            OrderedDict(
+                [
+                    ("serializer", serializer),
+                    ("field", field),
+                    ("source", source),
+                    ("calls", calls),
+                    ("time", seconds),
+                ]
+            )
+            for (serializer, field, source), (calls, seconds) in field_timings.items()
+        ]
+        fields.sort(key=lambda f: f["time"], reverse=True)
+        after = fragments.cache.stats()
+        return OrderedDict(
+            [
+                ("status", response.status_code),
+                ("bytes", size),
+                ("time", elapsed),
+                ("render", self.get_render_cost(response)),
+                ("sql_time", sum(q["time"] for q in queries)),
+                ("sql", queries),
+                ("serializer_fields", fields),
+                (
+                    "fragment_cache",
+                    {k: after[k] - fragment_stats[k] for k in ("hits", "misses")},
+                ),
+                ("functions", get_top_functions(profiler)),
+            ]
+        )
+
+    def get_render_cost(self, response):
+        """Time to render the response data once more, for DRF responses"""
+        renderer = getattr(response, "accepted_renderer", None)
+        if renderer is None:
+            return None
+        start = time.perf_counter()
+        renderer.render(
+            response.data, response.accepted_media_type, response.renderer_context
+        )
+        return time.perf_counter() - start
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+
+from rest_framework.renderers import JSONRenderer
+
+from app.core.fragments import Fragment
+
+
+def rows_to_columns(rows):
+    """Turn a list of row dictionaries into a dictionary of columns
+
+    Columns holding lists of dictionaries, such as nested serializers, are
+    flattened into their own columns with an `offsets` column: the items of
+    row i are those from offsets[i] to offsets[i + 1].
+    """
+    columns = OrderedDict((key, []) for key in (rows[0] if rows else ()))
+    for row in rows:
+        for key, column in columns.items():
+            column.append(row.get(key))
+    for key, column in columns.items():
+        if any(isinstance(v, list) and v and isinstance(v[0], dict) for v in column):
+            offsets, items = [0], []
+            for value in column:
+                items.extend(value or ())
+                offsets.append(len(items))
+            columns[key] = OrderedDict([("offsets", offsets)])
+            columns[key].update(rows_to_columns(items))
+    return columns
+
+
+def has_fragments(data):
+    if isinstance(data, Fragment):
+        return True
+    if isinstance(data, list):
+        return any(isinstance(v, Fragment) for v in data)
+    if isinstance(data, dict):
+        return any(has_fragments(v) for v in data.values())
+    return False
+
+
+class StandardJSONRenderer(JSONRenderer):
+    """JSON renderer which writes `Fragment` objects as their encoded bytes
+
+    Responses holding fragments, e.g. a page of cached objects, are always
+    rendered compactly.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not has_fragments(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        return self.splice(data)
+
+    def splice(self, data):
+        if isinstance(data, Fragment):
+            return data.raw
+        if not has_fragments(data):
+            return b"null" if data is None else super().render(data)
+        if isinstance(data, list):
+            return b"[" + b",".join(self.splice(v) for v in data) + b"]"
+        items = [self.splice(str(k)) + b":" + self.splice(v) for k, v in data.items()]
+        return b"{" + b",".join(items) + b"}"
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """Renders the rows of a page as columns, selected with `?format=columnar`
+
+    Key names are written once per page instead of once per row. Views that
+    already return columns are rendered unchanged.
+    """
+
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and isinstance(data.get("data"), list):
+            data = OrderedDict(data)
+            data["data"] = rows_to_columns(data["data"])
+        elif isinstance(data, list):
+            data = rows_to_columns(data)
+        return super().render(data, accepted_media_type, renderer_context)
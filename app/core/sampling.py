@@ -0,0 +1,139 @@
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from app.core.middleware import get_endpoint
+
+logger = logging.getLogger("django")
+
+# Endpoint served by each request thread, only these threads are sampled
+_endpoints = {}
+
+_sampler = None
+
+
+def frame_label(code, _labels={}):
+    label = _labels.get(code)
+    if label is None:
+        label = "%s (%s:%d)" % (code.co_name, code.co_filename, code.co_firstlineno)
+        _labels[code] = label
+    return label
+
+
+def collapse(frame):
+    """Return the stack of a frame, outermost first, joined by semicolons"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def dump_name(timestamp, pid=None):
+    return "%d-%s-%d.folded" % (timestamp, socket.gethostname(), pid or os.getpid())
+
+
+def write_stacks(path, stacks):
+    """Write stack counts in the collapsed format read by flamegraph.pl"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write("%s %d\n" % (stack, count))
+    os.replace(tmp, path)
+
+
+def read_stacks(path):
+    stacks = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+class Sampler(threading.Thread):
+    """A daemon thread sampling the stacks of the threads serving requests
+
+    Stacks are counted under the endpoint of their request and written to
+    `directory` every `dump_interval` seconds, one file per worker and
+    window.
+    """
+
+    def __init__(self, hz, directory, dump_interval):
+        super().__init__(name="sampler", daemon=True)
+        self.interval = 1.0 / hz
+        self.directory = directory
+        self.dump_interval = dump_interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def sample(self):
+        frames = sys._current_frames()
+        for thread_id, endpoint in list(_endpoints.items()):
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.stacks["%s;%s" % (endpoint, collapse(frame))] += 1
+        self.samples += 1
+
+    def dump(self):
+        if not self.stacks:
+            return
+        stacks, self.stacks = self.stacks, Counter()
+        path = os.path.join(self.directory, dump_name(time.time()))
+        try:
+            write_stacks(path, stacks)
+        except OSError:
+            logger.exception("Could not write profile samples to %s", path)
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        next_dump = time.monotonic() + self.dump_interval
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+            if time.monotonic() >= next_dump:
+                self.dump()
+                next_dump += self.dump_interval
+
+
+def start():
+    """Start sampling this process when `SAMPLING_HZ` is set
+
+    Called by each gunicorn worker after it is forked.
+    """
+    global _sampler
+    if not settings.SAMPLING_HZ or (_sampler is not None and _sampler.is_alive()):
+        return
+    _sampler = Sampler(
+        settings.SAMPLING_HZ, settings.SAMPLING_ROOT, settings.SAMPLING_DUMP_INTERVAL
+    )
+    _sampler.start()
+
+
+class SamplingMiddleware:
+    """Tags the thread serving a request with its endpoint for the sampler"""
+
+    def __init__(self, get_response):
+        if not settings.SAMPLING_HZ:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        thread_id = threading.get_ident()
+        _endpoints[thread_id] = get_endpoint(request)
+        try:
+            return self.get_response(request)
+        finally:
+            del _endpoints[thread_id]
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _endpoints[threading.get_ident()] = get_endpoint(request)
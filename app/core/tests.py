@@ -1,12 +1,45 @@
+import gzip
+import json
 import os
 import subprocess
+import tempfile
+import threading
+from unittest import mock
 
-from django.test import SimpleTestCase
+import numpy as np
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.utils import OperationalError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
 from django.conf import settings
+from rest_framework import serializers
 from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory
 
-from app.core.pagination import StandardPagination
+from app.core import (
+    arrayfile,
+    benchmark,
+    dataversion,
+    db,
+    lookup,
+    memory,
+    prewarm,
+    profiling,
+    sampling,
+)
+from app.core.db import ConcurrentQueries
+from app.core.memory import MemoryMiddleware
+from app.core.middleware import (
+    CompressionMiddleware,
+    DataVersionETagMiddleware,
+    QueryBudgetMiddleware,
+    SnapshotWhiteNoiseMiddleware,
+)
+from app.core.pagination import STREAM_ERROR, StandardPagination
+from app.core.profiling import ProfilingMiddleware
+from app.core.fragments import Fragment, FragmentCache
+from app.core.renderers import ColumnarJSONRenderer, StandardJSONRenderer
 
 
 class ExamplePagination(StandardPagination):
@@ -98,6 +131,43 @@ class TestStandardPagination(SimpleTestCase):
             },
         )
 
+    def test_columnar_page_size(self):
+        request = Request(self.factory.get("/", {"page_size": 2000}))
+        self.assertEqual(self.pagination.get_page_size(request), 500)
+        request.accepted_renderer = ColumnarJSONRenderer()
+        self.assertEqual(self.pagination.get_page_size(request), 2000)
+
+    def test_streaming(self):
+        request = Request(self.factory.get("/", {"page": 2, "stream": "true"}))
+        request.accepted_renderer = StandardJSONRenderer()
+        self.assertTrue(self.pagination.is_streaming(request))
+        queryset = self.paginate_queryset(request)
+        response = self.pagination.get_streaming_response(
+            json.dumps(n).encode() for n in queryset
+        )
+        self.assertTrue(response.streaming)
+        content = json.loads(b"".join(response.streaming_content).decode())
+        self.assertEqual(content, self.get_paginated_content(queryset))
+
+    def test_streaming_error(self):
+        request = Request(self.factory.get("/", {"stream": "true"}))
+        request.accepted_renderer = StandardJSONRenderer()
+        self.paginate_queryset(request)
+
+        def rows():
+            yield b"1"
+            raise ValueError
+
+        response = self.pagination.get_streaming_response(rows())
+        chunks = []
+        with self.assertRaises(ValueError):
+            for chunk in response.streaming_content:
+                chunks.append(chunk)
+        content = json.loads(b"".join(chunks).decode())
+        self.assertEqual([1], content["data"])
+        self.assertEqual({"detail": STREAM_ERROR}, content["error"])
+        self.assertNotIn("meta", content)
+
     def test_last_page(self):
         request = Request(self.factory.get("/", {"page": 21}))
         queryset = self.paginate_queryset(request)
@@ -122,3 +192,693 @@ class TestStandardPagination(SimpleTestCase):
                 "meta": {"count": 103},
             },
         )
+
+
+class TestColumnarJSONRenderer(SimpleTestCase):
+    """
+    Unit tests for `renderers.ColumnarJSONRenderer`.
+    """
+
+    def test_render(self):
+        rows = [
+            {"id": 1, "tags": [1, 2], "items": [{"a": 1}, {"a": 2}]},
+            {"id": 2, "tags": [], "items": []},
+            {"id": 3, "tags": [3], "items": [{"a": 3}]},
+        ]
+        content = ColumnarJSONRenderer().render({"data": rows, "meta": {"count": 3}})
+        self.assertEqual(
+            json.loads(content.decode()),
+            {
+                "data": {
+                    "id": [1, 2, 3],
+                    "tags": [[1, 2], [], [3]],
+                    "items": {"offsets": [0, 2, 2, 3], "a": [1, 2, 3]},
+                },
+                "meta": {"count": 3},
+            },
+        )
+
+
+class TestFragmentCache(SimpleTestCase):
+    """
+    Unit tests for `fragments.FragmentCache` and `renderers.StandardJSONRenderer`.
+    """
+
+    def test_eviction(self):
+        cache = FragmentCache(max_bytes=10)
+        cache.set("a", b"1234")
+        cache.set("b", b"1234")
+        self.assertEqual(cache.get_many(["a", "c"]), {"a": b"1234"})
+        cache.set("c", b"1234")
+        # "b" was the least recently used
+        self.assertEqual(set(cache.entries), {"a", "c"})
+        self.assertEqual(cache.size, 8)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.set("d", b"12345678901")
+        self.assertNotIn("d", cache.entries)
+
+    def test_render(self):
+        data = {
+            "paging": {"next": None, "page": 1},
+            "data": [Fragment(b'{"id":1,"name":"\xc3\xa9"}'), Fragment(b'{"id":2}')],
+        }
+        content = StandardJSONRenderer().render(data)
+        self.assertEqual(
+            json.loads(content.decode()),
+            {
+                "paging": {"next": None, "page": 1},
+                "data": [{"id": 1, "name": "\u00e9"}, {"id": 2}],
+            },
+        )
+        self.assertEqual(data["data"][0]["name"], "\u00e9")
+
+
+class TestSnapshotWhiteNoiseMiddleware(SimpleTestCase):
+    """
+    Unit tests for `middleware.SnapshotWhiteNoiseMiddleware`.
+    """
+
+    factory = APIRequestFactory()
+
+    def test_serve_snapshot(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "abc"))
+            with open(os.path.join(root, "abc", "manifest.json"), "w") as f:
+                f.write("{}")
+            os.symlink("abc", os.path.join(root, "latest"))
+            with override_settings(SNAPSHOT_ROOT=root):
+                middleware = SnapshotWhiteNoiseMiddleware(lambda request: None)
+            # files published after start up are found
+            response = middleware(self.factory.get("/snapshots/abc/manifest.json"))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("immutable", response["Cache-Control"])
+            response = middleware(self.factory.get("/snapshots/latest/manifest.json"))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("immutable", response["Cache-Control"])
+            # anything else falls through to the view
+            self.assertIsNone(middleware(self.factory.get("/snapshots/missing.json")))
+            self.assertIsNone(middleware(self.factory.get("/snapshots/abc/")))
+
+
+class TestDataVersion(SimpleTestCase):
+    """
+    Unit tests for `dataversion.get_data_version`.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.dict(dataversion._current, {"version": None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_refresh(self):
+        computed = threading.Event()
+        versions = iter(["1", "2"])
+
+        def compute():
+            version = next(versions)
+            if version == "2":
+                computed.wait(5)
+            return version
+
+        with mock.patch.object(
+            dataversion, "compute_data_version", compute
+        ), mock.patch.object(dataversion, "compute_derived_version", lambda: "a"):
+            self.assertEqual(dataversion.get_data_version(), "1")
+            dataversion._current["expires"] = 0.0
+            # the stale version is returned while it is recomputed
+            self.assertEqual(dataversion.get_data_version(), "1")
+            computed.set()
+            with dataversion._refreshing:
+                pass
+            self.assertEqual(dataversion.get_data_version(), "2")
+
+
+class TestDataVersionETagMiddleware(SimpleTestCase):
+    """
+    Unit tests for `middleware.DataVersionETagMiddleware`.
+    """
+
+    factory = APIRequestFactory()
+
+    def setUp(self):
+        self.calls = 0
+        current = {"version": "1", "derived": "a", "expires": float("inf")}
+        patcher = mock.patch.dict(dataversion._current, current)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_response(self, request):
+        self.calls += 1
+        return HttpResponse("{}", content_type="application/json")
+
+    def test_revalidate(self):
+        middleware = DataVersionETagMiddleware(self.get_response)
+        etag = middleware(self.factory.get("/products/"))["ETag"]
+        response = middleware(self.factory.get("/products/", HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.calls, 1)
+        # compressed responses carry the weak form of the tag
+        weak = "W/" + etag
+        response = middleware(self.factory.get("/products/", HTTP_IF_NONE_MATCH=weak))
+        self.assertEqual(response.status_code, 304)
+        for request in (
+            self.factory.get("/products/?page=2", HTTP_IF_NONE_MATCH=etag),
+            self.factory.get(
+                "/products/", HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT="text/html"
+            ),
+        ):
+            self.assertEqual(middleware(request).status_code, 200)
+        dataversion._current["version"] = "2"
+        response = middleware(self.factory.get("/products/", HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        # refreshed tables and rebuilt indexes change the tag too
+        etag = response["ETag"]
+        dataversion._current["derived"] = "b"
+        response = middleware(self.factory.get("/products/", HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_derived_version(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            INDEX_ROOT=directory
+        ), mock.patch.object(dataversion, "compute_data_version", lambda labels: "1"):
+            version = dataversion.compute_derived_version()
+            with open(os.path.join(directory, "similar_products.idx"), "wb") as f:
+                f.write(b"1")
+            self.assertNotEqual(dataversion.compute_derived_version(), version)
+
+    def test_exclude(self):
+        middleware = DataVersionETagMiddleware(self.get_response)
+        response = middleware(self.factory.get("/exports/abc/"))
+        self.assertFalse(response.has_header("ETag"))
+
+
+class TestCompressionMiddleware(SimpleTestCase):
+    """
+    Unit tests for `middleware.CompressionMiddleware`.
+    """
+
+    factory = APIRequestFactory()
+    content = json.dumps([{"id": i, "name": "chemical"} for i in range(200)]).encode()
+
+    def get_response(self, request):
+        return HttpResponse(self.content, content_type="application/json")
+
+    def test_gzip(self):
+        middleware = CompressionMiddleware(self.get_response)
+        middleware.codings.pop("br", None)
+        request = self.factory.get("/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        response = middleware(request)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(response.content), self.content)
+        # the compressed body is reused
+        misses = middleware.cache.misses
+        middleware(request)
+        self.assertEqual(middleware.cache.misses, misses)
+        self.assertEqual(middleware.cache.hits, 1)
+
+    def test_identity(self):
+        middleware = CompressionMiddleware(self.get_response)
+        for header in ("", "gzip;q=0, br;q=0", "identity"):
+            response = middleware(self.factory.get("/", HTTP_ACCEPT_ENCODING=header))
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            self.assertEqual(response.content, self.content)
+
+    def test_select_coding(self):
+        middleware = CompressionMiddleware(self.get_response)
+        middleware.codings["br"] = None
+        self.assertEqual(middleware.select_coding("gzip, br"), "br")
+        self.assertEqual(middleware.select_coding("gzip, br;q=0.5"), "gzip")
+        self.assertEqual(middleware.select_coding("*"), "br")
+        self.assertIsNone(middleware.select_coding("deflate"))
+
+    def test_streaming(self):
+        middleware = CompressionMiddleware(
+            lambda request: StreamingHttpResponse(
+                iter([self.content[:100], self.content[100:]]),
+                content_type="application/json",
+            )
+        )
+        middleware.codings.pop("br", None)
+        response = middleware(self.factory.get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        content = b"".join(response.streaming_content)
+        self.assertEqual(gzip.decompress(content), self.content)
+
+    @override_settings(COMPRESSION_MIN_SIZE=10 ** 6)
+    def test_min_size(self):
+        middleware = CompressionMiddleware(self.get_response)
+        response = middleware(self.factory.get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class TestProfilingMiddleware(SimpleTestCase):
+    """
+    Unit tests for `profiling.ProfilingMiddleware`.
+    """
+
+    factory = APIRequestFactory()
+
+    class ItemSerializer(serializers.Serializer):
+        id = serializers.IntegerField()
+        name = serializers.CharField()
+
+    def get_response(self, request):
+        data = self.ItemSerializer([{"id": 1, "name": "a"}] * 3, many=True).data
+        return HttpResponse(json.dumps(data), content_type="application/json")
+
+    @override_settings(PROFILE_SECRET="")
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(self.get_response)
+
+    @override_settings(PROFILE_SECRET="secret")
+    def test_profile(self):
+        middleware = ProfilingMiddleware(self.get_response)
+        for request in (
+            self.factory.get("/"),
+            self.factory.get("/", {"profile": "wrong"}),
+        ):
+            self.assertEqual(json.loads(middleware(request).content)[0]["id"], 1)
+        for request in (
+            self.factory.get("/", {"profile": "secret"}),
+            self.factory.get("/", HTTP_X_PROFILE="secret"),
+        ):
+            report = json.loads(middleware(request).content)
+            self.assertEqual(report["status"], 200)
+            self.assertEqual(report["sql"], [])
+            self.assertTrue(report["functions"])
+            fields = {f["field"]: f["calls"] for f in report["serializer_fields"]}
+            self.assertEqual(fields, {"id": 3, "name": 3})
+        # the serializers are restored
+        self.assertIs(
+            serializers.Serializer.to_representation,
+            profiling._original_to_representation,
+        )
+
+    @override_settings(PROFILE_SECRET="secret")
+    def test_streaming(self):
+        # a streamed body is read under the profiler
+        def get_response(request):
+            rows = (
+                json.dumps(self.ItemSerializer({"id": n, "name": "a"}).data)
+                for n in range(3)
+            )
+            return StreamingHttpResponse(rows, content_type="application/json")
+
+        middleware = ProfilingMiddleware(get_response)
+        report = json.loads(
+            middleware(self.factory.get("/", {"profile": "secret"})).content
+        )
+        size = sum(len(json.dumps({"id": n, "name": "a"})) for n in range(3))
+        self.assertEqual(report["bytes"], size)
+        fields = {f["field"]: f["calls"] for f in report["serializer_fields"]}
+        self.assertEqual(fields, {"id": 3, "name": 3})
+
+    @override_settings(PROFILE_SECRET="secret")
+    def test_sequential(self):
+        # the recorders only wrap the connections of the calling thread
+        sequential = []
+        middleware = ProfilingMiddleware(
+            lambda request: sequential.append(db.queries.is_sequential())
+            or HttpResponse()
+        )
+        middleware(self.factory.get("/", {"profile": "secret"}))
+        self.assertEqual(sequential, [True])
+
+
+class TestSampling(SimpleTestCase):
+    """
+    Unit tests for the `sampling` stack sampler.
+    """
+
+    def test_sample(self):
+        sampler = sampling.Sampler(100, tempfile.gettempdir(), 60)
+        sampling._endpoints[threading.get_ident()] = "GET product-list"
+        try:
+            sampler.sample()
+        finally:
+            del sampling._endpoints[threading.get_ident()]
+        sampler.sample()
+        (stack, count), = sampler.stacks.items()
+        self.assertEqual(count, 1)
+        self.assertTrue(stack.startswith("GET product-list;"))
+        self.assertIn("test_sample (", stack.rsplit(";", 1)[0])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, sampling.dump_name(0))
+            sampling.write_stacks(path, sampler.stacks)
+            self.assertEqual(sampling.read_stacks(path), sampler.stacks)
+
+
+class TestMemoryMiddleware(SimpleTestCase):
+    """
+    Unit tests for `memory.MemoryMiddleware`.
+    """
+
+    factory = APIRequestFactory()
+
+    def get_response(self, request):
+        self.blob = bytearray(8 * 1024 * 1024)
+        return HttpResponse("{}", content_type="application/json")
+
+    def setUp(self):
+        if not os.path.exists(memory.STATM):
+            self.skipTest("RSS is read from /proc")
+
+    @override_settings(WORKER_MAX_RSS=1)
+    def test_recycle(self):
+        class Worker:
+            alive = True
+
+        memory.worker = Worker()
+        try:
+            response = MemoryMiddleware(self.get_response)(self.factory.get("/"))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(memory.worker.alive)
+        finally:
+            memory.worker = None
+        stats = memory.endpoint_stats()["GET unresolved"]
+        self.assertGreaterEqual(stats["requests"], 1)
+        self.assertGreater(stats["max_rss_growth"], 0)
+
+    def test_prewarm(self):
+        middleware = MemoryMiddleware(self.get_response)
+        requests = memory.endpoint_stats().get("GET unresolved", {}).get("requests", 0)
+        middleware(self.factory.get("/", **{prewarm.PREWARM_ENVIRON: True}))
+
+        def get_response(request):
+            # a pre-warming request started while serving this one
+            with prewarm._lock:
+                prewarm._warming[1] += 1
+            return self.get_response(request)
+
+        MemoryMiddleware(get_response)(self.factory.get("/"))
+        stats = memory.endpoint_stats().get("GET unresolved", {})
+        self.assertEqual(stats.get("requests", 0), requests)
+
+
+class TestConcurrentQueries(SimpleTestCase):
+    """
+    Unit tests for `db.ConcurrentQueries`.
+    """
+
+    def test_run(self):
+        queries = ConcurrentQueries(2)
+        calls = [threading.get_ident, threading.get_ident, lambda: 3]
+        first, second, third = queries.run(*calls)
+        self.assertEqual(first, threading.get_ident())
+        self.assertNotEqual(second, threading.get_ident())
+        self.assertEqual(third, 3)
+
+    def test_sequential(self):
+        for queries in (ConcurrentQueries(0), ConcurrentQueries(2)):
+            # an exhausted pool runs everything in the calling thread
+            while queries.slots.acquire(blocking=False):
+                pass
+            calls = [threading.get_ident] * 3
+            self.assertEqual(queries.run(*calls), [threading.get_ident()] * 3)
+        queries = ConcurrentQueries(2)
+        with queries.sequential():
+            calls = [threading.get_ident] * 3
+            self.assertEqual(queries.run(*calls), [threading.get_ident()] * 3)
+        self.assertFalse(queries.is_sequential())
+
+
+class TestQueryBudget(SimpleTestCase):
+    """
+    Unit tests for `db.enforce_query_budget`.
+    """
+
+    def setUp(self):
+        self.executed = []
+        patcher = mock.patch.dict(db._timeouts, {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, sql, params, many, context):
+        self.executed.append(sql)
+        return sql
+
+    def interrupt(self, sql, params, many, context):
+        raise OperationalError(3024, "Query execution was interrupted")
+
+    def test_hint(self):
+        context = {"connection": connection}
+        db.enforce_query_budget(self.execute, "SELECT 1", (), False, context)
+        with db.query_budget(db.make_query_budget(2, "GET product-list")):
+            db.enforce_query_budget(self.execute, " SELECT 1", (), False, context)
+            db.enforce_query_budget(self.execute, "UPDATE t", (), False, context)
+        self.assertEqual(self.executed[0], "SELECT 1")
+        self.assertRegex(
+            self.executed[1], r"^SELECT /\*\+ MAX_EXECUTION_TIME\(\d+\) \*/ 1$"
+        )
+        self.assertEqual(self.executed[2], "UPDATE t")
+        self.assertIsNone(db.get_query_budget())
+
+    def test_timeout(self):
+        context = {"connection": connection}
+        budget = db.make_query_budget(2, "GET product-list")
+        with db.query_budget(budget), self.assertLogs("app.queries", "WARNING"):
+            with self.assertRaises(db.QueryTimeout):
+                db.enforce_query_budget(self.interrupt, "SELECT 1", (), False, context)
+        spent = budget._replace(deadline=0.0)
+        with db.query_budget(spent), self.assertLogs("app.queries", "WARNING"):
+            with self.assertRaises(db.QueryTimeout):
+                db.enforce_query_budget(self.execute, "SELECT 1", (), False, context)
+        self.assertEqual(self.executed, [])
+        stats = db.timeout_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["timeouts"], 2)
+        self.assertEqual(stats[0]["endpoint"], "GET product-list")
+
+    def test_concurrent(self):
+        budget = db.make_query_budget(2)
+        with db.query_budget(budget):
+            results = ConcurrentQueries(2).run(db.get_query_budget, db.get_query_budget)
+        self.assertEqual(results, [budget, budget])
+
+    def test_middleware(self):
+        # only MySQL statements are bounded
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryBudgetMiddleware(lambda request: HttpResponse())
+
+    def test_streaming(self):
+        budgets = []
+
+        def content():
+            for _ in range(2):
+                budgets.append(db.get_query_budget())
+                yield b""
+
+        def get_response(request):
+            middleware.process_view(request, lambda request: None, (), {})
+            if request.GET.get("stream"):
+                return StreamingHttpResponse(content())
+            return HttpResponse()
+
+        factory = APIRequestFactory()
+        with mock.patch("app.core.middleware.is_mysql", return_value=True):
+            middleware = QueryBudgetMiddleware(get_response)
+        with override_settings(QUERY_BUDGET=10):
+            middleware(factory.get("/"))
+            self.assertIsNone(db.get_query_budget())
+            response = middleware(factory.get("/", {"stream": "true"}))
+            # the body is streamed under the budget of its request
+            self.assertIsNotNone(db.get_query_budget())
+            b"".join(response.streaming_content)
+            response.close()
+        self.assertEqual(len(budgets), 2)
+        self.assertTrue(all(budget is not None for budget in budgets))
+        self.assertIsNone(db.get_query_budget())
+
+
+class TestArrayFile(SimpleTestCase):
+    """
+    Unit tests for `arrayfile`.
+    """
+
+    def test_round_trip(self):
+        arrays = {
+            "ids": np.arange(10, dtype=np.int64),
+            "matrix": np.arange(12, dtype=np.uint8).reshape(3, 4),
+            "empty": np.zeros(0, dtype=np.float32),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.idx")
+            mapped = arrayfile.MappedFile(path)
+            self.assertIsNone(mapped.get())
+            arrayfile.write_arrays(path, arrays, {"version": 1})
+            first = mapped.get()
+            self.assertEqual(first.meta, {"version": 1})
+            for name, array in arrays.items():
+                np.testing.assert_array_equal(first[name], array)
+                self.assertEqual(first[name].dtype, array.dtype)
+            self.assertFalse(first["ids"].flags.writeable)
+            self.assertIs(mapped.get(), first)
+            # a replaced file is reopened
+            arrayfile.write_arrays(path, {"ids": np.arange(3)})
+            self.assertEqual(len(mapped.get()["ids"]), 3)
+            np.testing.assert_array_equal(first["ids"], arrays["ids"])
+
+
+class TestLookup(SimpleTestCase):
+    """
+    Unit tests for `lookup`.
+    """
+
+    def test_tables(self):
+        tables = {
+            "chemicals": (
+                [("sid", "str"), ("name", "str")],
+                [(2, "DTXSID2", None), (1, "DTXSID1", "Benzène")],
+            ),
+            "ids": ([("id", "int")], [("DTXSID2", 2), ("DTXSID1", 1)]),
+            "products": (
+                [("puc", "int"), ("documents", "list")],
+                [(5, None, [3, 4]), (7, 0, [])],
+            ),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lookups.idx")
+            file = lookup.LookupFile(path)
+            self.assertIsNone(file.get())
+            lookup.write_lookups(path, tables, {"data_version": "a"})
+            self.assertIsNone(file.get("b"))
+            found = file.get("a")
+            self.assertIs(file.get(), found)
+            chemicals = found["chemicals"]
+            self.assertEqual(len(chemicals), 2)
+            self.assertEqual(chemicals.get(1, "name"), "Benzène")
+            self.assertIsNone(chemicals.get(2, "name"))
+            self.assertEqual(chemicals.get("2", "sid"), "DTXSID2")
+            self.assertEqual(chemicals.get(3, "sid", "missing"), "missing")
+            self.assertEqual(found["ids"].get("DTXSID1", "id"), 1)
+            self.assertIsNone(found["ids"].get(1, "id"))
+            self.assertIsNone(found["products"].get(5, "puc"))
+            self.assertEqual(found["products"].get(7, "puc"), 0)
+            self.assertEqual(found["products"].get(5, "documents"), [3, 4])
+            self.assertEqual(found["products"].get(7, "documents"), [])
+            # a new version is swapped in
+            lookup.write_lookups(path, {"ids": tables["ids"]}, {"data_version": "b"})
+            self.assertIsNone(file.get("a"))
+            self.assertNotIn("chemicals", file.get("b"))
+
+
+class TestBenchmark(SimpleTestCase):
+    """
+    Unit tests for `benchmark`.
+    """
+
+    def test_measure(self):
+        result = benchmark.measure(lambda: [0] * 10000, repeat=2, number=3)
+        self.assertGreater(result["seconds"], 0)
+        self.assertGreaterEqual(result["peak_bytes"], 80000)
+        self.assertGreaterEqual(result["blocks"], 1)
+
+    def test_baseline(self):
+        results = {"a": {"seconds": 1.1}, "b": {"seconds": 1.3}, "c": {"seconds": 5.0}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            self.assertEqual(benchmark.load_baseline(path), {})
+            benchmark.save_baseline(
+                path, {"a": {"seconds": 1.0}, "b": {"seconds": 1.0}}
+            )
+            baseline = benchmark.load_baseline(path)
+        self.assertEqual(benchmark.compare(results, baseline, 0.2), [("b", 1.3)])
+
+
+class TestPrewarm(SimpleTestCase):
+    """
+    Unit tests for the `prewarm` request counting.
+    """
+
+    factory = APIRequestFactory()
+
+    def test_top_k(self):
+        sketch = prewarm.TopK(2)
+        for key in "aaabbc":
+            sketch.add(key)
+        # c replaced b, inheriting its count
+        self.assertEqual(sketch.rows(), [("a", 3, 0), ("c", 3, 2)])
+        other = prewarm.TopK(2)
+        for key in "ddddd":
+            other.add(key)
+        sketch.merge(other.rows())
+        self.assertEqual(sketch.top(5), ["d", "a"])
+        self.assertEqual(sketch.reset(), [("d", 5, 0), ("a", 3, 0)])
+        self.assertEqual(len(sketch), 0)
+
+    def test_normalize_key(self):
+        def key(url, method="get"):
+            return prewarm.normalize_key(getattr(self.factory, method)(url))
+
+        self.assertEqual(
+            key("/products/?puc=2&page=1&chemical=b&chemical=a&profile=x"),
+            "/products/?chemical=a&chemical=b&puc=2",
+        )
+        self.assertEqual(key("/chemicals/DTXSID1/"), "/chemicals/DTXSID1/")
+        self.assertIsNone(key("/products/?page=2"))
+        self.assertIsNone(key("/products/?stream=true"))
+        self.assertIsNone(key("/exports/", "post"))
+
+    def test_merge_windows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for pid, keys in ((1, ["/a/", "/b/"]), (2, ["/a/"])):
+                path = os.path.join(directory, prewarm.dump_name(0, pid))
+                prewarm.write_rows(path, [(k, 4, 0) for k in keys])
+            self.assertTrue(prewarm.merge_windows(directory, 10, 60, now=100))
+            self.assertEqual(prewarm.read_hot_keys(directory, 1), ["/a/"])
+            prewarm.write_rows(
+                os.path.join(directory, prewarm.dump_name(1, 1)), [("/b/", 1, 0)]
+            )
+            self.assertTrue(prewarm.merge_windows(directory, 10, 60, now=160))
+            self.assertEqual(
+                sorted(os.listdir(directory)), [".merge.lock", prewarm.MERGED]
+            )
+            rows, meta = prewarm.read_rows(os.path.join(directory, prewarm.MERGED))
+        self.assertEqual(meta, {"updated": 160})
+        self.assertEqual(rows, [("/a/", 4, 0), ("/b/", 3, 0)])
+
+    def test_shares(self):
+        keys = ["/a/", "/b/", "/c/", "/d/", "/e/"]
+        with tempfile.TemporaryDirectory() as directory:
+            first, first_file = prewarm.claim_slot(directory)
+            second, second_file = prewarm.claim_slot(directory)
+            self.assertEqual((first, second), (0, 1))
+            self.assertEqual(prewarm.held_slots(directory, first), [0, 1])
+            warmer = mock.Mock(directory=directory, slot=second)
+            self.assertEqual(prewarm.Prewarmer.get_share(warmer, keys), keys[1::2])
+            # the slot of a stopped worker is free again
+            first_file.close()
+            self.assertEqual(prewarm.held_slots(directory, second), [1])
+            self.assertEqual(prewarm.Prewarmer.get_share(warmer, keys), keys)
+            third, third_file = prewarm.claim_slot(directory)
+            self.assertEqual(third, 0)
+            second_file.close()
+            third_file.close()
+
+    def test_wait_idle(self):
+        current = {"version": "1", "expires": float("inf")}
+        with mock.patch.dict(dataversion._current, current):
+            self.assertTrue(prewarm.wait_idle("1"))
+            with mock.patch.object(prewarm, "_in_flight", [1]):
+                # gives up once the data version changes
+                self.assertFalse(prewarm.wait_idle("0"))
+
+    @override_settings(PREWARM_KEYS=10)
+    def test_middleware(self):
+        middleware = prewarm.PrewarmMiddleware(
+            lambda request: HttpResponse("{}", content_type="application/json")
+        )
+        prewarm.sketch.reset()
+        middleware(self.factory.get("/pucs/?page=1"))
+        middleware(self.factory.get("/pucs/", **{prewarm.PREWARM_ENVIRON: True}))
+        self.assertEqual(prewarm.sketch.rows(), [("/pucs/", 1, 0)])
+        self.assertEqual(prewarm._in_flight, [0])
+        prewarm.sketch.reset()
+        with override_settings(PREWARM_KEYS=0):
+            with self.assertRaises(MiddlewareNotUsed):
+                prewarm.PrewarmMiddleware(None)
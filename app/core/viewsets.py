@@ -0,0 +1,203 @@
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import models
+from django.http import Http404
+from rest_framework import viewsets
+from rest_framework.generics import get_object_or_404
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
+
+from app.core import fragments
+from app.core.dataversion import get_data_version
+from app.core.db import fetch
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def is_streaming(view, request):
+    """Whether the list page of a view is streamed, see `StandardPagination`"""
+    paginator = view.paginator
+    return hasattr(paginator, "is_streaming") and paginator.is_streaming(request)
+
+
+def serialize_columns(serializer, instances):
+    """Serialize instances field by field into a dictionary of columns
+
+    This is the columnar counterpart of `serializer.to_representation`, and
+    does not build a dictionary per instance. Nested list serializers are
+    flattened into their own columns with an `offsets` column, as done by
+    `app.core.renderers.rows_to_columns`.
+    """
+    fields = list(serializer._readable_fields)
+    columns = OrderedDict((field.field_name, []) for field in fields)
+    for field in fields:
+        column = columns[field.field_name]
+        nested = isinstance(field, ListSerializer)
+        for instance in instances:
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                attribute = None
+            if isinstance(attribute, PKOnlyObject) and attribute.pk is None:
+                attribute = None
+            if nested or attribute is None:
+                column.append(attribute)
+            else:
+                column.append(field.to_representation(attribute))
+        if nested:
+            offsets, items = [0], []
+            for attribute in column:
+                if isinstance(attribute, models.Manager):
+                    attribute = attribute.all()
+                items.extend(attribute or ())
+                offsets.append(len(items))
+            columns[field.field_name] = OrderedDict([("offsets", offsets)])
+            columns[field.field_name].update(serialize_columns(field.child, items))
+    return columns
+
+
+class ColumnarListMixin:
+    """Serializes list pages directly into columns for `?format=columnar`"""
+
+    def list(self, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, "format", None) != "columnar":
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer()
+        if page is not None:
+            return self.get_paginated_response(serialize_columns(serializer, page))
+        return Response(serialize_columns(serializer, queryset))
+
+
+class FragmentMixin:
+    """Serves JSON list and detail responses from the fragment cache
+
+    Pages are selected on primary keys only. Objects are serialized and
+    encoded once per data version and worker, then spliced into responses
+    by `StandardJSONRenderer`. Serializers must therefore not depend on the
+    request.
+    """
+
+    def get_fragments(self, queryset, pks):
+        """Return the fragments of the objects of queryset with primary keys pks"""
+        serializer_class = self.get_serializer_class()
+        version = get_data_version()
+        keys = [(serializer_class, pk, version) for pk in pks]
+        found = fragments.cache.get_many(keys)
+        missing = [key[1] for key in keys if key not in found]
+        if missing:
+            objects = fetch(queryset.filter(pk__in=missing))
+            rows = self.get_serializer(objects, many=True).data
+            for obj, row in zip(objects, rows):
+                key = (serializer_class, obj.pk, version)
+                found[key] = fragments.encode(row)
+                fragments.cache.set(key, found[key])
+        return [fragments.Fragment(found[key]) for key in keys if key in found]
+
+    def iter_fragments(self, queryset, pks):
+        """Yield the encoded objects with primary keys pks, a chunk at a time"""
+        for chunk in chunks(pks, settings.STREAMING_CHUNK_SIZE):
+            for fragment in self.get_fragments(queryset, chunk):
+                yield fragment.raw
+
+    def uses_fragments(self, request):
+        return getattr(request.accepted_renderer, "format", None) == "json"
+
+    def list(self, request, *args, **kwargs):
+        if not self.uses_fragments(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        pks = queryset.prefetch_related(None).values_list("pk", flat=True)
+        page = self.paginate_queryset(pks)
+        if page is not None and is_streaming(self, request):
+            return self.paginator.get_streaming_response(
+                self.iter_fragments(queryset, page)
+            )
+        if page is not None:
+            return self.get_paginated_response(self.get_fragments(queryset, page))
+        return Response(self.get_fragments(queryset, list(pks)))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.uses_fragments(request):
+            return super().retrieve(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        pk = get_object_or_404(
+            queryset.prefetch_related(None).values_list("pk", flat=True),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        found = self.get_fragments(queryset, [pk])
+        if not found:
+            raise Http404
+        return Response(found[0])
+
+
+class RecordMixin:
+    """Serves list and detail responses from a read-model table
+
+    The table has one column per serializer field, named alike, and its
+    primary key is the id of the resource. Rows are read as tuples, without
+    creating model instances or running the serializer, which is only used
+    for the documentation. `json_columns` are stored as encoded JSON.
+    """
+
+    json_columns = ()
+
+    def get_columns(self):
+        return list(self.get_serializer_class().Meta.fields)
+
+    def get_rows(self, values):
+        columns = self.get_columns()
+        rows = []
+        for row in values:
+            row = OrderedDict(zip(columns, row))
+            for name in self.json_columns:
+                row[name] = json.loads(row[name])
+            rows.append(row)
+        return rows
+
+    def iter_rows(self, queryset, pks):
+        """Yield the encoded rows with primary keys pks, a chunk at a time"""
+        columns = self.get_columns()
+        for chunk in chunks(pks, settings.STREAMING_CHUNK_SIZE):
+            values = queryset.filter(pk__in=chunk).values_list("pk", *columns)
+            rows = {row[0]: row[1:] for row in values}
+            found = [rows[pk] for pk in chunk if pk in rows]
+            for row in self.get_rows(found):
+                yield fragments.encode(row)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if is_streaming(self, request):
+            page = self.paginate_queryset(queryset.values_list("pk", flat=True))
+            if page is not None:
+                return self.paginator.get_streaming_response(
+                    self.iter_rows(queryset, page)
+                )
+        values = queryset.values_list(*self.get_columns())
+        page = self.paginate_queryset(values)
+        if page is not None:
+            return self.get_paginated_response(self.get_rows(page))
+        return Response(self.get_rows(values))
+
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            queryset.values_list(*self.get_columns()), pk=self.kwargs[lookup_url_kwarg]
+        )
+        return Response(self.get_rows([row])[0])
+
+
+class StandardReadOnlyModelViewSet(
+    ColumnarListMixin, FragmentMixin, viewsets.ReadOnlyModelViewSet
+):
+    """The base viewset of the read only resources"""
@@ -0,0 +1,5 @@
+"""Python client for the Factotum web services"""
+from factotum_ws_client.cache import ETagCache
+from factotum_ws_client.client import APIError, Client, DataChanged
+
+__all__ = ["APIError", "Client", "DataChanged", "ETagCache"]
@@ -0,0 +1,69 @@
+"""Compare reading a whole list with the client and with a plain loop
+
+    python -m factotum_ws_client.benchmark                 # local test server
+    python -m factotum_ws_client.benchmark http://localhost:8000 --path /products/
+
+Without a URL, a local test server with simulated latency is started.
+"""
+import argparse
+import tempfile
+import time
+
+import requests
+
+from factotum_ws_client.client import Client
+from factotum_ws_client.testserver import TestServer
+
+
+def read_sequentially(base_url, path, page_size):
+    """The loop over `links.next` that the client replaces"""
+    url = "%s/%s?page_size=%d" % (base_url.rstrip("/"), path.lstrip("/"), page_size)
+    rows = 0
+    while url:
+        page = requests.get(url).json()
+        rows += len(page["data"])
+        url = page["paging"]["links"]["next"]
+    return rows
+
+
+def timed(name, function):
+    start = time.perf_counter()
+    rows = function()
+    print("%-28s %8.3f s %10d rows" % (name, time.perf_counter() - start, rows))
+
+
+def run(base_url, path, page_size, workers):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached = Client(
+            base_url, cache_dir=cache_dir, workers=workers, page_size=page_size
+        )
+        timed("requests loop", lambda: read_sequentially(base_url, path, page_size))
+        for n in (1, workers):
+            client = Client(base_url, workers=n, page_size=page_size)
+            timed(
+                "client, %d worker(s)" % n, lambda: sum(1 for _ in client.iterate(path))
+            )
+        timed("client, cold cache", lambda: sum(1 for _ in cached.iterate(path)))
+        timed("client, revalidated cache", lambda: sum(1 for _ in cached.iterate(path)))
+        client = Client(base_url, workers=workers, page_size=page_size)
+        timed("client, columnar", lambda: len(client.columns(path)["id"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("url", nargs="?", help="The API, a test server by default.")
+    parser.add_argument("--path", default="/items/")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    if args.url:
+        run(args.url, args.path, args.page_size, args.workers)
+    else:
+        with TestServer(args.items, args.latency) as server:
+            run(server.url, args.path, args.page_size, args.workers)
+
+
+if __name__ == "__main__":
+    main()
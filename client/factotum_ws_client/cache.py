@@ -0,0 +1,44 @@
+import hashlib
+import os
+import tempfile
+
+
+class ETagCache:
+    """An on-disk cache of response bodies, revalidated with their ETags
+
+    Each URL is stored as two files named after its digest: the body and
+    its ETag. Files are replaced atomically, so several processes may share
+    a directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest())
+
+    def get(self, url):
+        """Return the (etag, body) stored for url, or None"""
+        path = self.path(url)
+        try:
+            with open(path + ".etag") as f:
+                etag = f.read()
+            with open(path + ".json", "rb") as f:
+                return etag, f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, url, etag, body):
+        path = self.path(url)
+        # The body is written first, an ETag never points to another body
+        for suffix, data in ((".json", body), (".etag", etag.encode())):
+            fd, tmp = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path + suffix)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith((".json", ".etag")):
+                os.remove(os.path.join(self.directory, name))
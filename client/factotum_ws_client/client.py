@@ -0,0 +1,197 @@
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urljoin
+
+import requests
+
+from factotum_ws_client.cache import ETagCache
+
+# Statuses retried with exponential backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class APIError(Exception):
+    """An unsuccessful response from the API"""
+
+    def __init__(self, url, status, body):
+        super().__init__("%s returned %d" % (url, status))
+        self.url = url
+        self.status = status
+        self.body = body
+
+
+class DataChanged(Exception):
+    """The data of the API changed while its pages were being read"""
+
+
+def get_rows(page):
+    if isinstance(page, dict) and "paging" in page:
+        return page["data"]
+    return page
+
+
+def merge_columns(target, columns):
+    """Append the columns of a page to target, rebasing nested offsets"""
+    for key, column in columns.items():
+        if isinstance(column, dict):
+            nested = target.setdefault(key, {"offsets": [0]})
+            base = nested["offsets"][-1]
+            nested["offsets"].extend(base + o for o in column["offsets"][1:])
+            merge_columns(nested, {k: v for k, v in column.items() if k != "offsets"})
+        else:
+            target.setdefault(key, []).extend(column)
+    return target
+
+
+def to_arrays(columns):
+    """Convert columns to numpy arrays, recursively"""
+    import numpy as np
+
+    return {
+        key: to_arrays(column) if isinstance(column, dict) else np.array(column)
+        for key, column in columns.items()
+    }
+
+
+class Client:
+    """A client for the Factotum web services
+
+    Connections are reused, the pages of a list are fetched by `workers`
+    threads once the first page tells how many there are, and failed
+    requests are retried. With `cache_dir`, responses are kept on disk and
+    revalidated with their ETag, so unchanged data is not downloaded again.
+
+        client = Client("http://localhost:8000", cache_dir=".factotum")
+        for product in client.iterate("/products/", chemical="DTXSID6026296"):
+            ...
+        columns = client.columns("/documents/", arrays=True)
+    """
+
+    def __init__(
+        self,
+        base_url,
+        cache_dir=None,
+        workers=4,
+        page_size=500,
+        retries=3,
+        backoff=0.5,
+        timeout=60,
+        session=None,
+    ):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.cache = ETagCache(cache_dir) if cache_dir else None
+        self.workers = workers
+        self.page_size = page_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(workers, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {"requests": 0, "retries": 0, "revalidated": 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def url(self, path, params=None):
+        url = urljoin(self.base_url, path.lstrip("/"))
+        if params:
+            url += "?" + urlencode(sorted(params.items()), doseq=True)
+        return url
+
+    def wait(self, attempt, retry_after=None):
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.backoff * 2 ** attempt
+        self.count("retries")
+        time.sleep(delay)
+
+    def fetch(self, url):
+        """Return the body of a URL, from the cache when still valid"""
+        cached = self.cache.get(url) if self.cache else None
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        for attempt in range(self.retries + 1):
+            self.count("requests")
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                self.wait(attempt)
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                self.wait(attempt, response.headers.get("Retry-After"))
+                continue
+            break
+        if response.status_code == 304 and cached:
+            self.count("revalidated")
+            return cached[1]
+        if response.status_code != 200:
+            raise APIError(url, response.status_code, response.content)
+        etag = response.headers.get("ETag")
+        if self.cache and etag:
+            self.cache.set(url, etag, response.content)
+        return response.content
+
+    def get(self, path, params=None):
+        """Return the decoded response of a path"""
+        return json.loads(self.fetch(self.url(path, params)).decode())
+
+    def pages(self, path, params=None):
+        """Yield the pages of a list in order, fetching them concurrently
+
+        At most twice `workers` pages are fetched ahead of the consumer.
+        """
+        params = dict(params or {})
+        params.setdefault("page_size", self.page_size)
+        first = self.get(path, dict(params, page=1))
+        yield first
+        if not isinstance(first, dict) or "paging" not in first:
+            return
+        numbers = iter(range(2, first["paging"]["pages"] + 1))
+        with ThreadPoolExecutor(max(self.workers, 1)) as executor:
+            pending = deque()
+
+            def submit():
+                number = next(numbers, None)
+                if number is not None:
+                    pending.append(
+                        executor.submit(self.get, path, dict(params, page=number))
+                    )
+
+            for _ in range(2 * max(self.workers, 1)):
+                submit()
+            while pending:
+                page = pending.popleft().result()
+                if page["meta"]["count"] != first["meta"]["count"]:
+                    raise DataChanged(path)
+                submit()
+                yield page
+
+    def iterate(self, path, **params):
+        """Lazily yield every object of a list"""
+        for page in self.pages(path, params):
+            yield from get_rows(page)
+
+    def retrieve(self, path, id, **params):
+        """Return one object, e.g. retrieve("/products/", 3)"""
+        return self.get("%s/%s/" % (path.rstrip("/"), id), params)
+
+    def columns(self, path, arrays=False, **params):
+        """Return every object of a list as columns
+
+        Nested lists are flattened into their own columns with offsets, as
+        in the columnar format of the API. With `arrays`, columns are numpy
+        arrays.
+        """
+        columns = {}
+        for page in self.pages(path, dict(params, format="columnar")):
+            merge_columns(columns, get_rows(page))
+        return to_arrays(columns) if arrays else columns
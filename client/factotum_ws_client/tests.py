@@ -0,0 +1,54 @@
+import tempfile
+import unittest
+
+from factotum_ws_client import APIError, Client
+from factotum_ws_client.client import merge_columns
+from factotum_ws_client.testserver import TestServer, make_items, to_columns
+
+
+class TestClient(unittest.TestCase):
+    def test_iterate(self):
+        with TestServer(items=250) as server:
+            client = Client(server.url, workers=3, page_size=20)
+            self.assertEqual(list(client.iterate("/items/")), server.items)
+            self.assertEqual(server.requests, 13)
+
+    def test_columns(self):
+        with TestServer(items=95) as server:
+            client = Client(server.url, page_size=10)
+            self.assertEqual(client.columns("/items/"), to_columns(server.items))
+
+    def test_retries(self):
+        with TestServer(items=10, failures=2) as server:
+            client = Client(server.url, backoff=0)
+            self.assertEqual(len(client.get("/items/")["data"]), 10)
+            self.assertEqual(client.stats["retries"], 2)
+        with TestServer(items=10, failures=5) as server:
+            client = Client(server.url, retries=1, backoff=0)
+            with self.assertRaises(APIError):
+                client.get("/items/")
+
+    def test_cache(self):
+        with TestServer(items=50) as server, tempfile.TemporaryDirectory() as cache:
+            client = Client(server.url, cache_dir=cache, page_size=10)
+            first = list(client.iterate("/items/"))
+            self.assertEqual(list(client.iterate("/items/")), first)
+            self.assertEqual(client.stats["revalidated"], 5)
+            # a new version is downloaded again
+            server.version = "2"
+            server.items = make_items(60)
+            self.assertEqual(list(client.iterate("/items/")), server.items)
+            self.assertEqual(client.stats["revalidated"], 5)
+
+
+class TestMergeColumns(unittest.TestCase):
+    def test_merge(self):
+        items = make_items(7)
+        columns = {}
+        for start in range(0, 7, 3):
+            merge_columns(columns, to_columns(items[start : start + 3]))
+        self.assertEqual(columns, to_columns(items))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""A local stand-in for the API, used by the tests and the benchmark
+
+It serves `/items/` with the paging envelope of the API, in the JSON or
+columnar format, answers revalidations with 304 and can delay or fail
+requests to mimic a remote server.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_items(count):
+    return [
+        {
+            "id": i,
+            "name": "item %d" % i,
+            "chemicals": [{"sid": "DTXSID%d" % (i * 10 + n)} for n in range(i % 3)],
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def to_columns(rows):
+    columns = {"id": [], "name": [], "chemicals": {"offsets": [0], "sid": []}}
+    for row in rows:
+        columns["id"].append(row["id"])
+        columns["name"].append(row["name"])
+        columns["chemicals"]["sid"].extend(c["sid"] for c in row["chemicals"])
+        columns["chemicals"]["offsets"].append(len(columns["chemicals"]["sid"]))
+    return columns
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.failures > 0
+            server.failures -= fail
+        time.sleep(server.latency)
+        if fail:
+            return self.send(503, headers=[("Retry-After", "0")])
+        url = urlparse(self.path)
+        if url.path != "/items/":
+            return self.send(404)
+        etag = '"%s"' % hashlib.sha1((server.version + self.path).encode()).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            return self.send(304, headers=[("ETag", etag)])
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        size = int(query.get("page_size", 100))
+        number = int(query.get("page", 1))
+        rows = server.items[(number - 1) * size : number * size]
+        data = to_columns(rows) if query.get("format") == "columnar" else rows
+        pages = max(1, -(-len(server.items) // size))
+        link = "%sitems/?page_size=%d&page=%%d" % (server.url, size)
+        body = {
+            "paging": {
+                "links": {
+                    "next": link % (number + 1) if number < pages else None,
+                    "previous": link % (number - 1) if number > 1 else None,
+                },
+                "page": number,
+                "pages": pages,
+                "size": len(rows),
+            },
+            "data": data,
+            "meta": {"count": len(server.items)},
+        }
+        self.send(
+            200,
+            json.dumps(body).encode(),
+            [("Content-Type", "application/json"), ("ETag", etag)],
+        )
+
+
+class TestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, items=1000, latency=0.0, failures=0):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.items = make_items(items)
+        self.latency = latency
+        self.failures = failures
+        self.version = "1"
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://%s:%d/" % self.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
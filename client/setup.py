@@ -0,0 +1,11 @@
+from setuptools import setup
+
+setup(
+    name="factotum-ws-client",
+    version="0.1.0",
+    description="Python client for the Factotum web services",
+    packages=["factotum_ws_client"],
+    python_requires=">=3.7",
+    install_requires=["requests>=2.22"],
+    extras_require={"arrays": ["numpy"]},
+)
@@ -26,6 +26,41 @@ class MetaEnv(type):
             if host
         ]
 
+    @property
+    def READ_MODELS(cls):
+        default = "false"
+        return cls._get("READ_MODELS", default, prefix=True) in cls.truevals
+
+    @property
+    def EDGE_DATABASE(cls):
+        default = ""
+        return cls._get("EDGE_DATABASE", default, prefix=True)
+
+    @property
+    def PROFILE_SECRET(cls):
+        default = ""
+        return cls._get("PROFILE_SECRET", default, prefix=True)
+
+    @property
+    def SAMPLING_HZ(cls):
+        default = "0"
+        return int(cls._get("SAMPLING_HZ", default, prefix=True))
+
+    @property
+    def PREWARM_KEYS(cls):
+        default = "100"
+        return int(cls._get("PREWARM_KEYS", default, prefix=True))
+
+    @property
+    def QUERY_BUDGET(cls):
+        default = "10"
+        return float(cls._get("QUERY_BUDGET", default, prefix=True))
+
+    @property
+    def WORKER_MAX_RSS(cls):
+        default = "1024"
+        return int(cls._get("WORKER_MAX_RSS", default, prefix=True))
+
     @property
     def FACTOTUM_WS_PORT(cls):
         deafult = "8001"
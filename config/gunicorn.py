@@ -9,6 +9,9 @@ bind = ":" + env.FACTOTUM_WS_PORT
 workers = multiprocessing.cpu_count() * 2 + 1
 logconfig_dict = LOGGING
 access_log_format = '"%(r)s" %(s)s %(b)s'
+# Recycle workers regularly, on top of the RSS limit (WORKER_MAX_RSS)
+max_requests = 2000
+max_requests_jitter = 200
 
 # Override/set any configuration variable with environment variables
 locals().update(env.GUNICORN_OPTS)
@@ -20,3 +23,11 @@ def on_starting(server):
         logger.warning("Running in DEBUG mode")
     if "*" in env.ALLOWED_HOSTS:
         logger.warning("Host checking is disabled (ALLOWED_HOSTS is set to accept all)")
+
+
+def post_fork(server, worker):
+    from app.core import memory, prewarm, sampling
+
+    memory.worker = worker
+    sampling.start()
+    prewarm.start()
@@ -20,11 +20,19 @@ INSTALLED_APPS = THIRD_PARTY_OVERRIDE_APPS + DJANGO_APPS + THIRD_PARTY_APPS + LO
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "app.core.memory.MemoryMiddleware",
+    "app.core.middleware.CompressionMiddleware",
+    "app.core.profiling.ProfilingMiddleware",
+    "app.core.sampling.SamplingMiddleware",
+    "app.core.middleware.SnapshotWhiteNoiseMiddleware",
+    "app.core.prewarm.PrewarmMiddleware",
+    "app.core.middleware.DataVersionETagMiddleware",
+    "app.core.middleware.QueryBudgetMiddleware",
     "django.middleware.common.CommonMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
+WSGI_APPLICATION = "config.wsgi.application"
 
 TEMPLATES = [
     {
@@ -55,6 +63,21 @@ DATABASES = {
 }
 
 DJANGO_MYSQL_REWRITE_QUERIES = True
+
+# Serve from a SQLite file written by export_sqlite instead of MySQL. The
+# file is opened read-only and immutable, i.e. without any locking, so it
+# must be replaced and the workers restarted rather than edited in place.
+EDGE_DATABASE = env.EDGE_DATABASE
+EDGE_MMAP_SIZE = 1024 * 1024 * 1024
+if EDGE_DATABASE:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": "file:%s?mode=ro&immutable=1" % os.path.abspath(EDGE_DATABASE),
+            "OPTIONS": {"uri": True},
+        }
+    }
+    DJANGO_MYSQL_REWRITE_QUERIES = False
 SILENCED_SYSTEM_CHECKS = [
     "django_mysql.W001",
     "django_mysql.W002",
@@ -76,12 +99,120 @@ WHITENOISE_USE_FINDERS = DEBUG
 
 MEDIA_URL = env.MEDIA_URL
 
+SNAPSHOT_URL = "/snapshots/"
+SNAPSHOT_ROOT = os.path.join(BASE_DIR, "snapshots")
+SNAPSHOT_PARTITION_SIZE = 10000
+SNAPSHOT_KEEP = 2
+
+# Index files built offline and memory mapped by the workers
+INDEX_ROOT = os.path.join(BASE_DIR, "indexes")
+
+# q= filters matching more objects than this are rejected
+SEARCH_FILTER_MAX_MATCHES = 10000
+
+# Export jobs (see run_export_jobs), the results of the oldest finished jobs
+# being removed once they take more than EXPORT_MAX_BYTES
+EXPORT_ROOT = os.path.join(BASE_DIR, "exports")
+EXPORT_PARTITION_SIZE = 5000
+EXPORT_MAX_VALUES = 10000
+EXPORT_MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+# Models whose contents make up the data version fingerprint
+DATA_VERSION_MODELS = [
+    "dashboard.PUC",
+    "dashboard.Product",
+    "dashboard.ProductToPUC",
+    "dashboard.ProductDocument",
+    "dashboard.DataDocument",
+    "dashboard.DataGroup",
+    "dashboard.GroupType",
+    "dashboard.DocumentType",
+    "dashboard.ExtractedText",
+    "dashboard.RawChem",
+    "dashboard.ExtractedChemical",
+    "dashboard.ExtractedListPresence",
+    "dashboard.ExtractedListPresenceTag",
+    "dashboard.ExtractedListPresenceToTag",
+    "dashboard.DSSToxLookup",
+]
+DATA_VERSION_TTL = 60
+
+# Models recording the refreshes of the summary and read-model tables, which
+# with the index files of INDEX_ROOT make up the derived version in the ETags
+DERIVED_VERSION_MODELS = ["api.RefreshState"]
+
+# Path prefixes whose responses change without the data version or the
+# derived version, which DataVersionETagMiddleware leaves untagged
+DATA_VERSION_ETAG_EXCLUDE = ["/exports/"]
+
+# Serve the resources from the read-model tables (see refresh_read_models)
+API_READ_MODELS = env.READ_MODELS or bool(EDGE_DATABASE)
+if EDGE_DATABASE:
+    # Only the tables of this service are exported
+    DATA_VERSION_MODELS = ["api.RefreshState"]
+
+# Memory available to each worker for pre-encoded API objects
+FRAGMENT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Threads per worker running independent queries of a request (count and
+# page, prefetch lookups) on their own connections, 0 to disable
+CONCURRENT_QUERIES = 4
+
+# Request keys counted per worker (see app.core.prewarm), the PREWARM_KEYS
+# most requested being requested again when a worker starts and when the data
+# version changes, shared between the workers of each host, at most
+# PREWARM_RATE per second and worker, 0 to disable. Counts are halved every
+# PREWARM_HALF_LIFE seconds.
+PREWARM_KEYS = env.PREWARM_KEYS
+PREWARM_SKETCH_SIZE = 2000
+PREWARM_RATE = 2
+PREWARM_ROOT = os.path.join(BASE_DIR, "prewarm")
+PREWARM_DUMP_INTERVAL = 300
+PREWARM_HALF_LIFE = 24 * 60 * 60
+PREWARM_HOST = next((h.lstrip(".") for h in ALLOWED_HOSTS if h != "*"), "localhost")
+
+# Results of run_benchmarks, which fails when slower by more than the
+# threshold
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, "benchmarks", "baseline.json")
+BENCHMARK_THRESHOLD = 0.2
+
+# Seconds after which the MySQL statements of a request are stopped, counted
+# from the start of its view, unless the view sets `query_budget`, 0 to
+# disable (see QueryBudgetMiddleware)
+QUERY_BUDGET = env.QUERY_BUDGET
+
+# Objects read and serialized at once by streamed pages (`?stream=true`)
+STREAMING_CHUNK_SIZE = 100
+
+# Compression of API responses, brotli being used when installed
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_LEVEL = 5
+COMPRESSION_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Requests carrying this secret in `?profile=` or `X-Profile` return a
+# profiling report, the profiler being disabled when it is empty
+PROFILE_SECRET = env.PROFILE_SECRET
+
+# Stack sampling of the gunicorn workers (see merge_profiles), off when 0
+SAMPLING_HZ = env.SAMPLING_HZ
+SAMPLING_ROOT = os.path.join(BASE_DIR, "profiles")
+SAMPLING_DUMP_INTERVAL = 60
+
+# Workers exit after the current request once their RSS exceeds this (MiB,
+# 0 to disable), and requests growing the RSS by more are logged
+WORKER_MAX_RSS = env.WORKER_MAX_RSS * 1024 * 1024
+MEMORY_LOG_GROWTH = 32 * 1024 * 1024
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [],
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_PAGINATION_CLASS": "app.core.pagination.StandardPagination",
     "DEFAULT_PERMISSION_CLASSES": [],
-    "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
+    "DEFAULT_RENDERER_CLASSES": [
+        "app.core.renderers.StandardJSONRenderer",
+        "app.core.renderers.ColumnarJSONRenderer",
+    ],
     "PAGE_SIZE": 100,
     "TEST_REQUEST_DEFAULT_FORMAT": "json",
     "URL_FIELD_NAME": "link",
@@ -152,6 +283,13 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        "app.memory": {"handlers": ["logstash"], "level": "INFO", "propagate": False},
+        "app.prewarm": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "app.queries": {
+            "handlers": ["logstash", "console"],
+            "level": "INFO",
+            "propagate": False,
+        },
         "gunicorn.access": {
             "level": "INFO",
             "handlers": ["logstash", "console"],
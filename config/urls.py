@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
 
@@ -6,16 +7,52 @@ from app.api import views as apiviews
 from app.docs import views as docsviews
 
 
+# (prefix, basename, viewset, viewset serving from the read-model tables)
+resources = [
+    (r"pucs", "puc", apiviews.PUCViewSet, apiviews.PUCRecordViewSet),
+    (r"products", "product", apiviews.ProductViewSet, apiviews.ProductRecordViewSet),
+    (
+        r"documents",
+        "datadocument",
+        apiviews.DocumentViewSet,
+        apiviews.DocumentRecordViewSet,
+    ),
+    (
+        r"chemicals",
+        "dsstoxlookup",
+        apiviews.ChemicalViewSet,
+        apiviews.ChemicalRecordViewSet,
+    ),
+    (
+        r"chemicalpresences",
+        "chemical_presences",
+        apiviews.ChemicalPresenceViewSet,
+        apiviews.ChemicalPresenceRecordViewSet,
+    ),
+]
+
 router = routers.SimpleRouter()
-router.register(r"pucs", apiviews.PUCViewSet)
-router.register(r"products", apiviews.ProductViewSet)
-router.register(r"documents", apiviews.DocumentViewSet)
-router.register(r"chemicals", apiviews.ChemicalViewSet)
+for prefix, basename, viewset, record_viewset in resources:
+    if settings.API_READ_MODELS:
+        viewset = record_viewset
+    router.register(prefix, viewset, basename=basename)
+router.register(r"search", apiviews.SearchViewSet, basename="search")
+router.register(r"stats/pucs", apiviews.PUCStatsViewSet, basename="stats_pucs")
+router.register(
+    r"stats/products", apiviews.ProductStatsViewSet, basename="stats_products"
+)
+router.register(
+    r"stats/documents", apiviews.DocumentStatsViewSet, basename="stats_documents"
+)
+router.register(
+    r"stats/chemicals", apiviews.ChemicalStatsViewSet, basename="stats_chemicals"
+)
+# Weight fractions and exports read the Factotum tables, which edge nodes lack,
+# and answer 404 there like the PUC tree and presence tags
 router.register(
-    r"chemicalpresences",
-    apiviews.ChemicalPresenceViewSet,
-    basename="chemical_presences",
+    r"weightfractions", apiviews.WeightFractionViewSet, basename="weight_fractions"
 )
+router.register(r"exports", apiviews.ExportViewSet, basename="exports")
 
 urlpatterns = [
     path(